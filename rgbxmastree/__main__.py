@@ -1,8 +1,16 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import os
 
+from rgbxmastree.audio import DEFAULT_SAMPLE_RATE, AudioOptions
+from rgbxmastree.hardware.chains import MultiChainTree, load_chains
+from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.ingest import IngestOptions
+from rgbxmastree.lowjitter import LowJitterOptions
+from rgbxmastree.realtime import DDP_PORT, DEFAULT_TIMEOUT_S, E131_PORT, RealtimeOptions
+from rgbxmastree.sync import SYNC_GROUP, SYNC_PORT, SyncOptions
 from rgbxmastree.web.app import create_app
 
 
@@ -19,14 +27,171 @@ def main() -> int:
         default=os.environ.get("RGBXMASTREE_CONFIG", "/var/lib/rgbxmastree/config.json"),
         help="Path to config JSON",
     )
+    parser.add_argument(
+        "--patterns",
+        default=os.environ.get("RGBXMASTREE_PATTERNS"),
+        help="Path to the saved patterns JSON (default: patterns.json next to the config)",
+    )
+    parser.add_argument(
+        "--images",
+        default=os.environ.get("RGBXMASTREE_IMAGES"),
+        help="Directory of images/GIFs to offer as programs (default: images/ next to the config)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=int(os.environ.get("RGBXMASTREE_THREADS", "10")),
+        help="Server worker threads (with waitress, each open /api/events or /api/preview stream holds one)",
+    )
+    parser.add_argument(
+        "--server",
+        choices=("waitress", "asyncio"),
+        default=os.environ.get("RGBXMASTREE_SERVER", "waitress"),
+        help="HTTP server: waitress (thread per connection) or asyncio (streams on an event loop)",
+    )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        default=os.environ.get("RGBXMASTREE_SIMULATE") == "1",
+        help="Run against a simulated tree (no GPIO/SPI needed)",
+    )
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        default=os.environ.get("RGBXMASTREE_REALTIME") == "1",
+        help="Accept realtime pixel data over UDP (DDP and E1.31/sACN)",
+    )
+    parser.add_argument("--ddp-port", type=int, default=DDP_PORT, help="DDP port (0 disables)")
+    parser.add_argument("--e131-port", type=int, default=E131_PORT, help="E1.31 port (0 disables)")
+    parser.add_argument("--e131-universe", type=int, default=1, help="E1.31 universe of the first pixel")
+    parser.add_argument(
+        "--realtime-timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT_S,
+        help="Seconds without realtime frames before returning to the program/schedule",
+    )
+    parser.add_argument(
+        "--ingest-socket",
+        default=os.environ.get("RGBXMASTREE_INGEST_SOCKET"),
+        help="Unix socket for local co-processes to stream frames (adds a 'Local Co-process' program)",
+    )
+    parser.add_argument(
+        "--audio",
+        default=os.environ.get("RGBXMASTREE_AUDIO"),
+        metavar="SOURCE",
+        help="PCM for the 'Music Sync' program: a WAV file (looped), '-' for stdin, or a FIFO",
+    )
+    parser.add_argument(
+        "--audio-rate",
+        type=int,
+        default=DEFAULT_SAMPLE_RATE,
+        help="Sample rate of raw (headerless, s16le) PCM on stdin/a FIFO",
+    )
+    parser.add_argument("--audio-channels", type=int, default=1, help="Channels of raw PCM on stdin/a FIFO")
+    parser.add_argument(
+        "--sync",
+        choices=("leader", "follower"),
+        default=os.environ.get("RGBXMASTREE_SYNC") or None,
+        help="Animate several trees in lockstep: one leader, any number of followers",
+    )
+    parser.add_argument("--sync-group", default=SYNC_GROUP, help="Sync multicast group")
+    parser.add_argument("--sync-port", type=int, default=SYNC_PORT, help="Sync multicast port")
+    parser.add_argument(
+        "--sync-interface",
+        default=os.environ.get("RGBXMASTREE_SYNC_INTERFACE", "0.0.0.0"),
+        help="Local address of the interface to sync on (127.0.0.1 to try it on one machine)",
+    )
+    parser.add_argument(
+        "--chains",
+        default=os.environ.get("RGBXMASTREE_CHAINS"),
+        metavar="FILE",
+        help="JSON file describing several LED chains (trees/strips) to drive as one",
+    )
+    parser.add_argument(
+        "--fixed-pacing",
+        action="store_true",
+        default=os.environ.get("RGBXMASTREE_FIXED_PACING") == "1",
+        help="Send every frame at the rate programs ask for (no skipping of unchanged or late frames)",
+    )
+    parser.add_argument(
+        "--low-jitter",
+        action="store_true",
+        default=os.environ.get("RGBXMASTREE_LOW_JITTER") == "1",
+        help="Pin the render thread to a core, raise its priority where permitted and defer full GCs",
+    )
+    parser.add_argument(
+        "--low-jitter-cpu",
+        type=int,
+        default=None,
+        help="Core for the render thread in low-jitter mode (default: the last one)",
+    )
+    parser.add_argument(
+        "--fleet",
+        default=os.environ.get("RGBXMASTREE_FLEET"),
+        metavar="REGISTRY",
+        help="Run the fleet controller instead of a tree, with its node list in this JSON file",
+    )
     args = parser.parse_args()
 
-    app = create_app(config_path=args.config)
+    realtime = None
+    if args.realtime:
+        realtime = RealtimeOptions(
+            ddp_port=args.ddp_port,
+            e131_port=args.e131_port,
+            e131_universe=args.e131_universe,
+            timeout_s=args.realtime_timeout,
+        )
+
+    chains = load_chains(args.chains) if args.chains else None
+    ingest = None
+    if args.ingest_socket:
+        pixels = sum(c.pixels for c in chains if c.mirror is None) if chains else 25
+        ingest = IngestOptions(socket_path=args.ingest_socket, pixels=pixels)
+    sync = (
+        SyncOptions(role=args.sync, group=args.sync_group, port=args.sync_port, interface=args.sync_interface)
+        if args.sync
+        else None
+    )
+
+    if args.fleet:
+        from rgbxmastree.web.fleet_app import create_fleet_app
+
+        app = create_fleet_app(args.fleet)
+    else:
+        tree_factory = RGBXmasTree
+        if args.simulate:
+            from rgbxmastree.hardware.simulated import SimulatedXmasTree
+
+            tree_factory = SimulatedXmasTree
+        if chains:
+            tree_factory = functools.partial(MultiChainTree, chains, chain_factory=tree_factory)
+        app = create_app(
+            config_path=args.config,
+            tree_factory=tree_factory,
+            realtime=realtime,
+            ingest=ingest,
+            sync=sync,
+            adaptive_pacing=not args.fixed_pacing,
+            low_jitter=LowJitterOptions(cpu=args.low_jitter_cpu) if args.low_jitter else None,
+            patterns_path=args.patterns,
+            images_path=args.images,
+            threads=max(1, args.threads),
+            audio=(
+                AudioOptions(args.audio, sample_rate=args.audio_rate, channels=args.audio_channels)
+                if args.audio
+                else None
+            ),
+        )
+    if args.server == "asyncio" and not args.fleet:
+        from rgbxmastree.web.asyncio_server import serve_asyncio
+
+        serve_asyncio(app, host=args.host, port=args.port, threads=max(1, args.threads))
+        return 0
     # Use waitress for production-ish runs, fallback to Flask dev server.
     try:
         from waitress import serve
 
-        serve(app, host=args.host, port=args.port)
+        serve(app, host=args.host, port=args.port, threads=max(1, args.threads))
     except Exception:
         app.run(host=args.host, port=args.port)
     return 0
@@ -0,0 +1,460 @@
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import select
+import stat
+import struct
+import sys
+import threading
+import time
+import wave
+from dataclasses import dataclass
+from threading import Event
+
+import numpy as np
+
+from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.metrics import MetricsRegistry
+from rgbxmastree.programs.shader import Geometry, to_rgb_bytes
+from rgbxmastree.runtime import sleep
+
+
+# Music sync: PCM in, band energies out, lights on the tree.
+#
+# A worker thread reads PCM from a WAV file (played back in real time, looping), stdin or a
+# FIFO, in blocks of HOP samples. Each block slides a WINDOW-sample analysis buffer along;
+# the buffer is Hann-windowed and FFT'd and its energy summed into BANDS, each normalised
+# against its own recent peak (so quiet and loud music both fill the tree). Only the newest
+# result is kept: when input is already waiting behind a block (a backlog), blocks are
+# buffered but analysed at most once per hop of wall time, so latency stays bounded
+# instead of growing.
+#
+# The program ("Music Sync") runs on the runner thread like any other and never waits on
+# the worker: every frame it takes the newest band levels, smooths them (instant attack,
+# speed-dependent release) and lights the three levels and the star. It runs with fixed
+# pacing (adaptive pacing would let it compute ahead of the wall clock during silence).
+# Input-to-light latency is measured from when a block was read to the end of the first
+# transfer showing it.
+#
+# Raw PCM (stdin/FIFO without a WAV header) is signed 16-bit little-endian at the
+# configured rate and channel count.
+AUDIO_PROGRAM_ID = "audio_reactive"
+DEFAULT_SAMPLE_RATE = 44100
+WINDOW = 2048
+HOP = 512
+# (name, low Hz, high Hz) in tree order: bottom level, middle, top, star.
+BANDS = (("bass", 30, 150), ("low", 150, 600), ("mid", 600, 2500), ("high", 2500, 10000))
+# Levels are scaled between (peak - DYNAMIC_RANGE_DB) and a peak that falls by
+# PEAK_FALL_DB_S once the music gets quieter; below NOISE_FLOOR_DB is silence.
+DYNAMIC_RANGE_DB = 36.0
+PEAK_FALL_DB_S = 6.0
+NOISE_FLOOR_DB = -90.0
+FRAME_DELAY_S = 1.0 / 60.0
+RELEASE_S = 0.3
+# Bottom to top, then the star.
+BAND_COLOURS = np.array(((1.0, 0.0, 0.0), (0.0, 0.8, 0.1), (1.0, 0.7, 0.0), (1.0, 1.0, 1.0)))
+GLOW = 0.04
+
+
+@dataclass
+class AudioOptions:
+    source: str  # a WAV file, "-" for stdin, or a FIFO
+    sample_rate: int = DEFAULT_SAMPLE_RATE  # raw PCM only; WAV carries its own
+    channels: int = 1  # raw PCM only
+    loop: bool = True  # play a WAV file again from the start when it ends
+
+
+@dataclass(frozen=True)
+class PcmFormat:
+    rate: int
+    channels: int
+    width: int  # bytes per sample
+    is_float: bool = False
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.channels * self.width
+
+
+# ----- PCM input -----
+
+
+def _read_exact(f, n: int) -> bytes:
+    """Up to n bytes; fewer only at end of stream."""
+    chunks = []
+    while n > 0:
+        data = f.read(n)
+        if not data:
+            break
+        chunks.append(data)
+        n -= len(data)
+    return b"".join(chunks)
+
+
+def read_wav_header(f, first: bytes = b"") -> tuple[PcmFormat, int | None]:
+    """
+    Parse a RIFF/WAVE header from a (possibly unseekable) stream, leaving it at the first
+    sample. Returns the format and the data length (None when streamed with no length).
+    """
+    head = first + _read_exact(f, 12 - len(first))
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        raise ValueError("not a WAV stream")
+    fmt = None
+    while True:
+        chunk = _read_exact(f, 8)
+        if len(chunk) < 8:
+            raise ValueError("WAV stream ended before its data")
+        cid, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if cid == b"data":
+            if fmt is None:
+                raise ValueError("WAV data before its format")
+            # Streaming writers (e.g. arecord to a pipe) put a placeholder length here.
+            return fmt, None if size in (0, 0xFFFFFFFF, 0x7FFFFFFF) else size
+        body = _read_exact(f, size + (size & 1))
+        if cid == b"fmt ":
+            tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+            if tag == 0xFFFE and len(body) >= 26:  # WAVE_FORMAT_EXTENSIBLE: real tag in the GUID
+                tag = struct.unpack("<H", body[24:26])[0]
+            if tag not in (1, 3) or bits not in (8, 16, 24, 32) or (tag == 3 and bits != 32):
+                raise ValueError(f"unsupported WAV format (tag {tag}, {bits} bits)")
+            fmt = PcmFormat(rate, channels, bits // 8, is_float=tag == 3)
+
+
+def decode_pcm(data: bytes, fmt: PcmFormat) -> np.ndarray:
+    """Interleaved PCM to mono float samples in -1..1."""
+    usable = len(data) - len(data) % fmt.frame_bytes
+    raw = np.frombuffer(data[:usable], dtype=np.uint8)
+    if fmt.is_float:
+        x = raw.view("<f4").astype(np.float64)
+    elif fmt.width == 1:
+        x = (raw.astype(np.float64) - 128.0) / 128.0
+    elif fmt.width == 2:
+        x = raw.view("<i2") / 32768.0
+    elif fmt.width == 3:
+        b = raw.reshape(-1, 3).astype(np.int32)
+        x = ((b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)) << 8 >> 8) / 8388608.0
+    else:
+        x = raw.view("<i4") / 2147483648.0
+    if fmt.channels > 1:
+        x = x.reshape(-1, fmt.channels).mean(axis=1)
+    return x
+
+
+# ----- analysis -----
+
+
+class BandAnalyzer:
+    """Sliding-window FFT band levels (0..1 per band in BANDS order)."""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._buf = np.zeros(WINDOW)
+        self._window = np.hanning(WINDOW)
+        # Scale so a full-scale sine reads about 0 dB.
+        self._norm = 4.0 / (self._window.sum() ** 2)
+        freqs = np.fft.rfftfreq(WINDOW, 1.0 / rate)
+        self._bins = [
+            (int(np.searchsorted(freqs, lo)), max(int(np.searchsorted(freqs, hi)), int(np.searchsorted(freqs, lo)) + 1))
+            for _, lo, hi in BANDS
+        ]
+        self._peaks = np.full(len(BANDS), NOISE_FLOOR_DB + DYNAMIC_RANGE_DB)
+        self._hop_s = HOP / rate
+
+    def push(self, samples: np.ndarray) -> None:
+        """Slide new samples into the analysis window."""
+        n = len(samples)
+        if n >= WINDOW:
+            self._buf[:] = samples[-WINDOW:]
+        elif n:
+            self._buf[:-n] = self._buf[n:]
+            self._buf[-n:] = samples
+
+    def levels(self) -> np.ndarray:
+        power = np.abs(np.fft.rfft(self._buf * self._window)) ** 2 * self._norm
+        energy = np.array([power[lo:hi].sum() for lo, hi in self._bins])
+        db = 10.0 * np.log10(energy + 1e-12)
+        self._peaks = np.maximum(db, np.maximum(self._peaks - PEAK_FALL_DB_S * self._hop_s, NOISE_FLOOR_DB + DYNAMIC_RANGE_DB))
+        return np.clip((db - (self._peaks - DYNAMIC_RANGE_DB)) / DYNAMIC_RANGE_DB, 0.0, 1.0)
+
+
+# ----- worker + program -----
+
+
+class _ShownLatency:
+    """
+    Wraps the tree's frame observer while the program runs, so input-to-light latency is
+    taken at the end of the transfer that actually shows new levels (not when the loop
+    picks them up, and not for a frame that is never sent).
+    """
+
+    def __init__(self, inner, histogram):
+        self._inner = inner
+        self._h = histogram
+        # perf_counter() when the newest levels not yet shown were read; 0 for none.
+        self.pending = 0.0
+        ready = getattr(inner, "frame_ready", None)
+        if ready is not None:
+            self.frame_ready = ready
+
+    def frame_shown(self, start: float, end: float) -> None:
+        if self._inner is not None:
+            self._inner.frame_shown(start, end)
+        read_at, self.pending = self.pending, 0.0
+        if read_at:
+            self._h.observe(end - read_at)
+
+
+
+class AudioSync:
+    """
+    Owns the input worker; `run` is the program runner. The controller registers it in
+    PROGRAMS (like the local ingest), so it is selected like any other program.
+    """
+
+    def __init__(self, options: AudioOptions, metrics: MetricsRegistry):
+        self.options = options
+        self._closed = Event()
+        self._running = False
+        # (seq, band levels, perf_counter() when the newest block in them was read; 0 for none)
+        self._latest: tuple[int, np.ndarray, float] = (0, np.zeros(len(BANDS)), 0.0)
+        self._status = {"source": options.source, "format": None, "error": None}
+        self._c_blocks = metrics.counter("rgbxmastree_audio_blocks_total", "PCM blocks read")
+        self._c_skipped = metrics.counter(
+            "rgbxmastree_audio_blocks_unanalysed_total", "Blocks buffered but not analysed because newer input was waiting"
+        )
+        self._h_analysis = metrics.histogram("rgbxmastree_audio_analysis_seconds", "FFT band analysis per block")
+        self._h_latency = metrics.histogram(
+            "rgbxmastree_audio_latency_seconds", "From reading a PCM block to the end of the first frame showing it"
+        )
+        self._g_levels = [metrics.gauge("rgbxmastree_audio_band_level", "Band level, 0..1", band=b[0]) for b in BANDS]
+        self._thread = threading.Thread(target=self._worker, name="rgbxmastree-audio", daemon=True)
+        self._thread.start()
+
+    def status(self) -> dict:
+        return dict(self._status)
+
+    # ----- worker thread -----
+
+    def _open(self):
+        """Returns (binary stream, is_live). Opening a FIFO blocks until a writer shows up."""
+        if self.options.source == "-":
+            return sys.stdin.buffer.raw, True
+        live = stat.S_ISFIFO(os.stat(self.options.source).st_mode)
+        return open(self.options.source, "rb", buffering=0 if live else -1), live
+
+    def _worker(self) -> None:
+        while not self._closed.is_set():
+            try:
+                f, live = self._open()
+            except OSError as e:
+                self._status["error"] = repr(e)
+                self._closed.wait(5.0)
+                continue
+            try:
+                self._stream(f, live)
+                self._status["error"] = None
+            except (OSError, ValueError) as e:
+                self._status["error"] = repr(e)
+                self._closed.wait(1.0)
+            finally:
+                if f is not sys.stdin.buffer.raw:
+                    f.close()
+            self._latest = (self._latest[0] + 1, np.zeros(len(BANDS)), 0.0)
+            if self.options.source == "-" or (not live and not self.options.loop):
+                return
+
+    def _stream(self, f, live: bool) -> None:
+        first = _read_exact(f, 4)
+        if first == b"RIFF":
+            fmt, remaining = read_wav_header(f, first)
+            pending = b""
+        else:
+            fmt = PcmFormat(self.options.sample_rate, self.options.channels, 2)
+            remaining, pending = None, first
+        self._status["format"] = f"{fmt.rate} Hz, {fmt.channels} ch, {fmt.width * 8}-bit{' float' if fmt.is_float else ''}"
+        analyzer = BandAnalyzer(fmt.rate)
+        block_bytes = HOP * fmt.frame_bytes
+        started = time.perf_counter()
+        played = 0
+        hop_s = HOP / fmt.rate
+        analysed_at = 0.0
+        fd = f.fileno() if live else None
+        while not self._closed.is_set():
+            want = block_bytes if remaining is None else min(block_bytes, remaining)
+            data = pending + _read_exact(f, want - len(pending))
+            pending = b""
+            if len(data) < fmt.frame_bytes:
+                return
+            if remaining is not None:
+                remaining -= len(data)
+            samples = decode_pcm(data, fmt)
+            if not live:
+                # A file plays in real time: release each block when it would have been heard.
+                played += len(samples)
+                due = started + played / fmt.rate
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    self._closed.wait(wait)
+            read_at = time.perf_counter()
+            self._c_blocks.inc()
+            analyzer.push(samples)
+            if not self._running:
+                continue
+            if read_at - analysed_at < hop_s and fd is not None and select.select([fd], [], [], 0)[0]:
+                # More input is already waiting and the last result is under a hop old:
+                # analysing this block would only add latency.
+                self._c_skipped.inc()
+                continue
+            analysed_at = t = time.perf_counter()
+            levels = analyzer.levels()
+            self._h_analysis.observe(time.perf_counter() - t)
+            self._latest = (self._latest[0] + 1, levels, read_at)
+
+    # ----- program runner -----
+
+    def run(self, tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
+        """Light each level (and the star) with its band's energy; `speed` shortens the release."""
+        geo = Geometry.of(tree)
+        band = np.where(geo.level >= 0, np.minimum(geo.level, len(BANDS) - 1), -1)
+        lit = band >= 0
+        colours = np.zeros((geo.pixels, 3))
+        colours[lit] = BAND_COLOURS[band[lit]]
+        # Round each level like a VU meter: branch b lights at level (b + 1) / 8; the star
+        # (branch -1) just brightens.
+        threshold = np.where(geo.branch >= 0, (geo.branch + 1) / 8.0, 0.0)
+        release = math.exp(-FRAME_DELAY_S * max(0.1, float(speed)) / RELEASE_S)
+        smoothed = np.zeros(len(BANDS))
+        last_seq = self._latest[0]
+        observer = tree.frame_observer = _ShownLatency(tree.frame_observer, self._h_latency)
+        self._running = True
+        try:
+            while not stop.is_set():
+                seq, levels, read_at = self._latest
+                smoothed = np.maximum(levels, smoothed * release)
+                for i, value in enumerate(smoothed):
+                    self._g_levels[i].set(float(value))
+                level = np.where(lit, smoothed[np.maximum(band, 0)], 0.0)
+                on = np.where(geo.star, level, np.where(level >= threshold, 0.4 + 0.6 * level, GLOW))
+                if seq != last_seq:
+                    last_seq = seq
+                    observer.pending = read_at
+                tree.write_rgb(0, to_rgb_bytes(colours * np.where(lit, on, 0.0)[:, None]))
+                tree.show()
+                sleep(FRAME_DELAY_S)
+        finally:
+            self._running = False
+            if tree.frame_observer is observer:
+                tree.frame_observer = observer._inner
+
+    def close(self) -> None:
+        self._closed.set()
+
+
+# ----- offline tools -----
+
+
+def write_fixture(path: str, seconds: float = 8.0, rate: int = DEFAULT_SAMPLE_RATE) -> list[tuple[float, float, str]]:
+    """
+    A test WAV: one tone per band in turn (half a second each, with a gap), then all of them
+    together. Returns (start s, end s, band) for each tone.
+    """
+    tones = [(60.0, "bass"), (300.0, "low"), (1200.0, "mid"), (5000.0, "high")]
+    t = np.arange(int(seconds * rate)) / rate
+    out = np.zeros_like(t)
+    spans = []
+    slot = seconds / (len(tones) + 1)
+    for k, (freq, name) in enumerate(tones + [(0.0, "all")]):
+        start, end = k * slot + 0.1 * slot, (k + 0.6) * slot
+        mask = (t >= start) & (t < end)
+        if name == "all":
+            for f, _ in tones:
+                out[mask] += 0.2 * np.sin(2 * np.pi * f * t[mask])
+        else:
+            out[mask] += 0.5 * np.sin(2 * np.pi * freq * t[mask])
+        spans.append((start, end, name))
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((np.clip(out, -1, 1) * 32767).astype("<i2").tobytes())
+    return spans
+
+
+def analyze_file(path: str, step_s: float = 0.25) -> list[tuple[float, np.ndarray]]:
+    """Band levels through a WAV file as fast as it can be read, averaged per `step_s`."""
+    with open(path, "rb") as f:
+        fmt, remaining = read_wav_header(f)
+        analyzer = BandAnalyzer(fmt.rate)
+        out, acc, count, pos = [], np.zeros(len(BANDS)), 0, 0
+        per_step = max(1, int(step_s * fmt.rate / HOP))
+        while True:
+            want = HOP * fmt.frame_bytes if remaining is None else min(HOP * fmt.frame_bytes, remaining)
+            data = _read_exact(f, want)
+            if len(data) < fmt.frame_bytes:
+                break
+            if remaining is not None:
+                remaining -= len(data)
+            analyzer.push(decode_pcm(data, fmt))
+            acc += analyzer.levels()
+            count += 1
+            pos += HOP
+            if count == per_step:
+                out.append((pos / fmt.rate, acc / count))
+                acc, count = np.zeros(len(BANDS)), 0
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m rgbxmastree.audio", description="Music sync tools (offline).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_fix = sub.add_parser("fixture", help="Write a test WAV with one tone per band")
+    p_fix.add_argument("path")
+    p_fix.add_argument("--seconds", type=float, default=8.0)
+    p_an = sub.add_parser("analyze", help="Print band levels through a WAV file")
+    p_an.add_argument("path")
+    p_an.add_argument("--step", type=float, default=0.25, help="Seconds per row")
+    p_sim = sub.add_parser("simulate", help="Play a WAV file through the worker and program on a simulated tree")
+    p_sim.add_argument("path")
+    p_sim.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "fixture":
+        for start, end, name in write_fixture(args.path, args.seconds):
+            print(f"{start:6.2f}-{end:5.2f}s  {name}")
+        return 0
+    if args.cmd == "analyze":
+        print("     t  " + "  ".join(f"{name:>5}" for name, _, _ in BANDS))
+        for t, levels in analyze_file(args.path, args.step):
+            print(f"{t:6.2f}  " + "  ".join(f"{v:5.2f}" for v in levels))
+        return 0
+
+    from rgbxmastree.hardware.simulated import SimulatedXmasTree
+
+    metrics = MetricsRegistry()
+    sync = AudioSync(AudioOptions(args.path, loop=False), metrics)
+    tree = SimulatedXmasTree()
+    stop = Event()
+    timer = threading.Timer(args.seconds, stop.set)
+    timer.start()
+    try:
+        sync.run(tree, stop, 1.0)
+    finally:
+        timer.cancel()
+        sync.close()
+    for name, family in metrics.to_json().items():
+        if name.startswith("rgbxmastree_audio_") and family["type"] == "histogram":
+            for s in family["series"]:
+                p50, p95 = s["p50"], s["p95"]
+                print(
+                    f"{name}: n={s['count']} "
+                    f"p50={p50 * 1000 if p50 is not None else float('nan'):.2f}ms "
+                    f"p95={p95 * 1000 if p95 is not None else float('nan'):.2f}ms"
+                )
+    print(f"source: {sync.status()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from threading import Event
+
+from rgbxmastree.hardware.simulated import SimulatedXmasTree
+from rgbxmastree.metrics import percentile
+from rgbxmastree.programs import PROGRAMS
+from rgbxmastree.programs.base import ProgramSpec
+from rgbxmastree.runtime import run_headless
+
+
+DEFAULT_FRAMES = 200
+DEFAULT_SPEEDS = (1.0, 10.0, 50.0, 200.0)
+DEFAULT_SEED = 1234
+DEFAULT_THRESHOLD = 0.25
+# Absolute floors so timer noise on tiny numbers isn't reported as a regression.
+MIN_CPU_REGRESSION_US = 5.0
+MIN_ALLOC_REGRESSION_BYTES = 256
+# Frames sampled under tracemalloc (it slows everything down, so it gets its own pass).
+ALLOC_FRAMES = 50
+# Safety net for programs that stop showing frames: give up after this much wall time.
+MAX_WALL_S_PER_RUN = 60.0
+
+
+class _FrameRecorder:
+    """
+    tree.frame_observer for benchmark runs: records per-frame CPU time (and optionally
+    tracemalloc peaks) and stops the program once enough frames were shown.
+    """
+
+    def __init__(self, frames: int, stop: Event, trace_alloc: bool):
+        self.frames = frames
+        self.stop = stop
+        self.trace_alloc = trace_alloc
+        self.count = 0
+        self.cpu_s: list[float] = []
+        self.alloc_bytes: list[int] = []
+        self._last_cpu = time.thread_time()
+        self._alloc_base = tracemalloc.get_traced_memory()[0] if trace_alloc else 0
+
+    def frame_shown(self, start: float, end: float) -> None:
+        now = time.thread_time()
+        self.cpu_s.append(now - self._last_cpu)
+        self._last_cpu = now
+        if self.trace_alloc:
+            current, peak = tracemalloc.get_traced_memory()
+            self.alloc_bytes.append(max(0, peak - self._alloc_base))
+            tracemalloc.reset_peak()
+            self._alloc_base = current
+        self.count += 1
+        if self.count >= self.frames:
+            self.stop.set()
+
+
+def _run_program(
+    tree: SimulatedXmasTree,
+    spec: ProgramSpec,
+    speed: float,
+    frames: int,
+    seed: int,
+    trace_alloc: bool = False,
+) -> tuple[_FrameRecorder, float, float]:
+    """Run one program headlessly on a virtual clock. Returns (recorder, wall_s, virtual_sleep_s)."""
+    tree.frame_observer = None
+    tree.auto_show = True
+    tree.off()
+
+    stop = Event()
+    if trace_alloc:
+        tracemalloc.start()
+    recorder = _FrameRecorder(frames, stop, trace_alloc)
+    tree.frame_observer = recorder
+    try:
+        wall_s, clock = run_headless(
+            tree, spec.runner, speed, stop, program_id=spec.id, seed=seed, max_wall_s=MAX_WALL_S_PER_RUN
+        )
+    finally:
+        tree.frame_observer = None
+        if trace_alloc:
+            tracemalloc.stop()
+    return recorder, wall_s, clock.now()
+
+
+def bench_program(
+    tree: SimulatedXmasTree,
+    spec: ProgramSpec,
+    speed: float,
+    frames: int,
+    seed: int,
+    measure_alloc: bool = True,
+) -> dict:
+    rec, wall_s, slept_s = _run_program(tree, spec, speed, frames, seed)
+    cpu_us = [c * 1e6 for c in rec.cpu_s]
+    result = {
+        "program": spec.id,
+        "speed": speed,
+        "frames": rec.count,
+        "cpu_us_per_frame_mean": (sum(cpu_us) / len(cpu_us)) if cpu_us else None,
+        "cpu_us_per_frame_p50": percentile(cpu_us, 0.50),
+        "cpu_us_per_frame_p95": percentile(cpu_us, 0.95),
+        # Achieved fps if the sleeps had been real: compute/transfer wall time + requested sleeps.
+        "fps": (rec.count / (wall_s + slept_s)) if rec.count and (wall_s + slept_s) > 0 else None,
+        "wall_s": wall_s,
+        "virtual_sleep_s": slept_s,
+    }
+    if measure_alloc:
+        arec, _, _ = _run_program(tree, spec, speed, min(frames, ALLOC_FRAMES), seed, trace_alloc=True)
+        allocs = arec.alloc_bytes[1:] or arec.alloc_bytes  # first frame includes program setup
+        result["alloc_bytes_per_frame_mean"] = (sum(allocs) / len(allocs)) if allocs else None
+        result["alloc_bytes_per_frame_max"] = max(allocs) if allocs else None
+    return result
+
+
+def run_suite(
+    program_ids: list[str],
+    speeds: list[float],
+    frames: int,
+    seed: int,
+    transfer_time: float = 0.0,
+    measure_alloc: bool = True,
+) -> dict:
+    tree = SimulatedXmasTree(transfer_time=transfer_time)
+    results: dict[str, dict] = {}
+    try:
+        for program_id in program_ids:
+            spec = PROGRAMS[program_id]
+            for speed in speeds:
+                results[f"{program_id}@{speed:g}"] = bench_program(tree, spec, speed, frames, seed, measure_alloc)
+    finally:
+        tree.close()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "frames": frames,
+            "speeds": speeds,
+            "seed": seed,
+            "transfer_time_s": transfer_time,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Return human-readable regressions of `current` against `baseline`."""
+    regressions: list[str] = []
+    base_results = baseline.get("results", {})
+    for key, cur in current.get("results", {}).items():
+        base = base_results.get(key)
+        if not base:
+            continue
+        c, b = cur.get("cpu_us_per_frame_p50"), base.get("cpu_us_per_frame_p50")
+        if c is not None and b is not None and c > b * (1.0 + threshold) and c - b > MIN_CPU_REGRESSION_US:
+            regressions.append(f"{key}: cpu/frame p50 {b:.1f}us -> {c:.1f}us (+{(c / b - 1) * 100:.0f}%)")
+        c, b = cur.get("alloc_bytes_per_frame_mean"), base.get("alloc_bytes_per_frame_mean")
+        if c is not None and b is not None and c > b * (1.0 + threshold) and c - b > MIN_ALLOC_REGRESSION_BYTES:
+            regressions.append(f"{key}: alloc/frame {b:.0f}B -> {c:.0f}B")
+    return regressions
+
+
+def _fmt(v, spec: str) -> str:
+    return "-" if v is None else format(v, spec)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m rgbxmastree.bench",
+        description="Benchmark every program headlessly against the simulated tree.",
+    )
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES, help="Frames per program/speed")
+    parser.add_argument(
+        "--speeds",
+        default=",".join(f"{s:g}" for s in DEFAULT_SPEEDS),
+        help="Comma-separated speeds to run each program at",
+    )
+    parser.add_argument("--programs", default="", help="Comma-separated program ids (default: all)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument(
+        "--transfer-ms",
+        type=float,
+        default=0.0,
+        help="Emulated SPI transfer time per frame in milliseconds",
+    )
+    parser.add_argument("--no-alloc", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Allowed relative regression vs baseline (0.25 = 25%%)",
+    )
+    args = parser.parse_args(argv)
+
+    program_ids = [p.strip() for p in args.programs.split(",") if p.strip()] or list(PROGRAMS)
+    unknown = [p for p in program_ids if p not in PROGRAMS]
+    if unknown:
+        parser.error(f"unknown program(s): {', '.join(unknown)}")
+    speeds = [float(s) for s in args.speeds.split(",") if s.strip()]
+
+    report = run_suite(
+        program_ids,
+        speeds,
+        frames=max(1, args.frames),
+        seed=args.seed,
+        transfer_time=max(0.0, args.transfer_ms) / 1000.0,
+        measure_alloc=not args.no_alloc,
+    )
+
+    print(f"{'program@speed':<26} {'frames':>6} {'cpu p50':>9} {'cpu p95':>9} {'fps':>9} {'alloc/f':>9}")
+    for key, r in report["results"].items():
+        print(
+            f"{key:<26} {r['frames']:>6} {_fmt(r['cpu_us_per_frame_p50'], '8.1f')}u "
+            f"{_fmt(r['cpu_us_per_frame_p95'], '8.1f')}u {_fmt(r['fps'], '9.1f')} "
+            f"{_fmt(r.get('alloc_bytes_per_frame_mean'), '8.0f')}B"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) vs {args.baseline}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print(f"\nNo regressions vs {args.baseline} (threshold {args.threshold:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,84 @@
 from __future__ import annotations
 
+import random
 import threading
 import time
-from dataclasses import replace
+import traceback
+from collections import deque
+from dataclasses import dataclass, replace
 from datetime import datetime
 from typing import Callable
 
+from rgbxmastree.audio import AUDIO_PROGRAM_ID, AudioOptions, AudioSync
 from rgbxmastree.config import AppConfig, load_config, save_config
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.ingest import LOCAL_INGEST_PROGRAM_ID, IngestOptions, LocalIngest
+from rgbxmastree.lowjitter import LowJitter, LowJitterOptions
+from rgbxmastree.metrics import MetricsRegistry
 from rgbxmastree.programs import PROGRAMS
+from rgbxmastree.programs.base import ProgramSpec
+from rgbxmastree.realtime import RealtimeOptions, RealtimeReceiver
+from rgbxmastree.runtime import RenderContext
 from rgbxmastree.scheduler import is_within_schedule
+from rgbxmastree.sync import LeaderState, SyncOptions, Timeline, TreeSync
+from rgbxmastree.tracing import CommandTrace, CommandTracer
+
+
+# Crash-loop protection: a runner that dies without being asked to stop is restarted
+# after an exponential backoff (base * 2**(failures-1), capped). A run that lasted at
+# least RESET_AFTER seconds counts as healthy and clears the failure count.
+RESTART_BACKOFF_BASE_S = 0.5
+RESTART_BACKOFF_MAX_S = 60.0
+RESTART_BACKOFF_RESET_AFTER_S = 30.0
+MAX_RECENT_ERRORS = 20
+
+
+def _resolve_program(program_id: str) -> str:
+    """The program that runs for `program_id`: unknown ids fall back to rgb_cycle."""
+    return program_id if program_id in PROGRAMS else "rgb_cycle"
+
+
+def _status_digest(status: dict | None) -> tuple | None:
+    """
+    A subsystem status for change detection. Measurements (floats: frame age, clock offset)
+    are kept to one significant figure in whole units (0, 1..9, 10, 20, ..), so they count
+    as a change when they move noticeably, not every tick, and ever more rarely as an age
+    keeps growing.
+    """
+    if status is None:
+        return None
+    return tuple(
+        (k, float(f"{round(v):.1g}") if isinstance(v, float) else repr(v)) for k, v in sorted(status.items())
+    )
+
+
+@dataclass
+class _RestartBackoff:
+    failures: int = 0
+    retry_at: float = 0.0  # time.monotonic() before which we don't restart
+
+
+class _RealtimeOutput:
+    """
+    FrameSink for the realtime receiver: passes pixels to the tree once the supervisor has
+    handed it over (and until it takes it back), and asks for the hand-over otherwise.
+    """
+
+    def __init__(self, controller: "TreeController"):
+        self._controller = controller
+
+    def write_rgb(self, first_pixel: int, data: memoryview) -> None:
+        tree = self._controller._tree
+        if self._controller._realtime_live and tree is not None:
+            tree.write_rgb(first_pixel, data)
+
+    def show(self) -> bool:
+        tree = self._controller._tree
+        if not self._controller._realtime_live or tree is None:
+            self._controller._supervisor_wake.set()
+            return False
+        tree.show()
+        return True
 
 
 class TreeController:
@@ -17,18 +86,99 @@ class TreeController:
     Owns the hardware driver, runs one program at a time, and enforces on/off policy.
     """
 
-    def __init__(self, config_path: str):
+    def __init__(
+        self,
+        config_path: str,
+        tree_factory: Callable[[], RGBXmasTree] = RGBXmasTree,
+        realtime: RealtimeOptions | None = None,
+        ingest: IngestOptions | None = None,
+        sync: SyncOptions | None = None,
+        adaptive_pacing: bool = True,
+        low_jitter: LowJitterOptions | None = None,
+        audio: AudioOptions | None = None,
+    ):
         self._config_path = config_path
+        self._adaptive_pacing = adaptive_pacing
+        self._tree_factory = tree_factory
         self._lock = threading.RLock()
         self._cfg = load_config(config_path)
+        # Bumped on every update_config(); lets the supervisor tell traces which change it applied.
+        self._cfg_version = 0
+
+        self.metrics = MetricsRegistry()
+        self._h_supervisor_tick = self.metrics.histogram(
+            "rgbxmastree_supervisor_tick_seconds", "Supervisor loop work per tick (excluding its sleep)"
+        )
+        self._h_config_save = self.metrics.histogram(
+            "rgbxmastree_config_save_seconds", "Time to persist the config file"
+        )
+        self.tracer = CommandTracer(self.metrics)
+
+        # State-change notifications for push clients (/api/events). Separate from self._lock
+        # so waiters never hold up the supervisor.
+        self._changes = threading.Condition()
+        self._change_seq = 0
+        # Callbacks for non-blocking waiters (the asyncio server); run on the notifying thread.
+        self._change_listeners: list[Callable[[], None]] = []
+        self._last_observed: tuple | None = None
+
+        # Live preview streams reference-count frame capture on the tree (see RGBXmasTree.shown).
+        self._preview_lock = threading.Lock()
+        self._preview_clients = 0
 
         self._tree: RGBXmasTree | None = None
         self._runner_thread: threading.Thread | None = None
         self._runner_stop = threading.Event()
         self._runner_program_id: str | None = None
         self._runner_speed: float | None = None
+        # Shared timeline the runner was started on (synced trees only).
+        self._runner_timeline: Timeline | None = None
+
+        # Runner exits are reported from the runner thread, which must never block on
+        # self._lock (it is held while _stop_program() joins that same thread).
+        self._errors_lock = threading.Lock()
+        self._recent_errors: deque[dict] = deque(maxlen=MAX_RECENT_ERRORS)
+        self._backoff: dict[str, _RestartBackoff] = {}
+
+        # Realtime ingest: while frames arrive (and the mode isn't manual_off) the receiver
+        # thread drives the tree instead of a program.
+        self._realtime_live = False
+        self._realtime = (
+            RealtimeReceiver(realtime, _RealtimeOutput(self), self.metrics) if realtime is not None else None
+        )
+
+        # Local co-process ingest is offered as one more program.
+        self._ingest = LocalIngest(ingest, self.metrics) if ingest is not None else None
+        if self._ingest is not None:
+            PROGRAMS[LOCAL_INGEST_PROGRAM_ID] = ProgramSpec(
+                id=LOCAL_INGEST_PROGRAM_ID,
+                name="Local Co-process",
+                runner=self._ingest.run,
+                adaptive_pacing=False,
+            )
+
+        # Music sync from a PCM source, likewise one more program.
+        self._audio = AudioSync(audio, self.metrics) if audio is not None else None
+        if self._audio is not None:
+            PROGRAMS[AUDIO_PROGRAM_ID] = ProgramSpec(
+                id=AUDIO_PROGRAM_ID,
+                name="Music Sync",
+                runner=self._audio.run,
+                adaptive_pacing=False,
+            )
+
+        # Low-jitter mode: the runner is pinned/prioritised and full GCs wait for idle gaps.
+        # The web app calls low_jitter.start() once it is fully built (see create_app).
+        self.low_jitter = LowJitter(low_jitter, self.metrics) if low_jitter is not None else None
 
         self._supervisor_stop = threading.Event()
+        # Set by update_config() so changes are applied now rather than on the next tick.
+        self._supervisor_wake = threading.Event()
+
+        # Multi-tree sync: leaders start a shared timeline per program run and publish their
+        # settings; followers run the leader's program on the leader's timeline.
+        self._sync = TreeSync(sync, self.metrics, on_change=self._supervisor_wake.set) if sync is not None else None
+
         self._supervisor_thread = threading.Thread(target=self._supervise_loop, name="rgbxmastree-supervisor", daemon=True)
         self._supervisor_thread.start()
 
@@ -44,15 +194,152 @@ class TreeController:
             return {
                 "program_running": runner_alive,
                 "program_id": self._runner_program_id,
+                "realtime": self._realtime.status() if self._realtime is not None else None,
+                "sync": self._sync.status() if self._sync is not None else None,
+                "low_jitter": self.low_jitter.status() if self.low_jitter is not None else None,
+                "audio": self._audio.status() if self._audio is not None else None,
             }
 
-    def update_config(self, mutate: Callable[[AppConfig], None]) -> AppConfig:
+    def runner_thread_id(self) -> int | None:
+        """Thread ident of the current program runner (for the sampling profiler)."""
+        t = self._runner_thread
+        if t is None or not t.is_alive():
+            return None
+        return t.ident
+
+    def closing(self) -> bool:
+        return self._supervisor_stop.is_set()
+
+    def open_preview(self) -> None:
+        with self._preview_lock:
+            self._preview_clients += 1
+            if self._tree is not None:
+                self._tree.capture_shown = True
+
+    def close_preview(self) -> None:
+        with self._preview_lock:
+            self._preview_clients = max(0, self._preview_clients - 1)
+            if self._tree is not None and self._preview_clients == 0:
+                self._tree.capture_shown = False
+                self._tree.shown = None
+
+    def shown_frame(self) -> tuple[int, bytes] | None:
+        """
+        Last frame sent to the tree as (sequence number, packed RGB), while a preview is
+        open. Runs on the caller's thread, so the render thread only pays for one copy.
+        """
+        tree = self._tree
+        shown = tree.shown if tree is not None else None
+        if shown is None:
+            return None
+        seq, frame = shown
+        return seq, tree.frame_rgb(frame)
+
+    def get_errors(self) -> dict:
+        now = time.monotonic()
+        with self._errors_lock:
+            return {
+                "recent": list(self._recent_errors),
+                "backoff": {
+                    program_id: {
+                        "failures": b.failures,
+                        "retry_in_s": round(max(0.0, b.retry_at - now), 3),
+                    }
+                    for program_id, b in self._backoff.items()
+                    if b.failures > 0
+                },
+            }
+
+    def update_config(self, mutate: Callable[[AppConfig], None], trace: CommandTrace | None = None) -> AppConfig:
+        """
+        Apply `mutate` to a copy of the config, persist it and wake the supervisor. Any
+        number of fields can change in one call: one file write, and at most one program
+        restart once the supervisor applies it. A mutation that changes nothing is not
+        written (spares the SD card when clients re-send current values).
+        """
         with self._lock:
             cfg = replace(self._cfg)
             mutate(cfg)
-            self._cfg = cfg
-            save_config(self._config_path, cfg)
-            return replace(cfg)
+            changed = cfg != self._cfg
+            if changed:
+                self._cfg = cfg
+                self._cfg_version += 1
+                t0 = time.perf_counter()
+                save_config(self._config_path, cfg)
+                self._h_config_save.observe(time.perf_counter() - t0)
+            if trace is not None:
+                self.tracer.saved(trace, self._cfg_version)
+            result = replace(self._cfg)
+        if changed:
+            self._supervisor_wake.set()
+            self._notify_change()
+        return result
+
+    # ----- change notification -----
+
+    def program_changed(self, program_id: str) -> None:
+        """
+        A program was added, replaced or removed at runtime: restart it if it is the one
+        running, and tell push clients the catalogue moved.
+        """
+        with self._lock:
+            if self._runner_program_id == program_id:
+                self._stop_program()
+                self._supervisor_wake.set()
+        self._notify_change()
+
+    def change_seq(self) -> int:
+        with self._changes:
+            return self._change_seq
+
+    def wait_for_change(self, seen: int, timeout: float) -> int | None:
+        """
+        Block until the observable state (config, runtime state, schedule window) moves past
+        change number `seen`, or `timeout` elapses. Returns the current change number, or
+        None once the controller is closing.
+        """
+        with self._changes:
+            self._changes.wait_for(lambda: self._change_seq != seen or self._supervisor_stop.is_set(), timeout)
+            if self._supervisor_stop.is_set():
+                return None
+            return self._change_seq
+
+    def add_change_listener(self, callback: Callable[[], None]) -> None:
+        """Call `callback` (from whichever thread noticed) after every change and on close."""
+        with self._changes:
+            self._change_listeners.append(callback)
+
+    def remove_change_listener(self, callback: Callable[[], None]) -> None:
+        with self._changes:
+            if callback in self._change_listeners:
+                self._change_listeners.remove(callback)
+
+    def _notify_change(self) -> None:
+        with self._changes:
+            self._change_seq += 1
+            self._changes.notify_all()
+            listeners = list(self._change_listeners)
+        for callback in listeners:
+            callback()
+
+    def _observe(self, version: int, now: datetime, cfg: AppConfig) -> None:
+        # Runtime state and the schedule window change without a config write (program
+        # crash, clock crossing a block boundary, countdown expiring, a realtime sender or
+        # sync leader going quiet, an audio error): detect them per tick.
+        runtime = self.get_runtime_state()
+        observed = (
+            version,
+            runtime["program_running"],
+            runtime["program_id"],
+            self._realtime_live,
+            self._runner_timeline,
+            is_within_schedule(now, cfg.schedule_blocks),
+            self._desired_on(now, cfg),
+            tuple(_status_digest(runtime[k]) for k in ("realtime", "sync", "low_jitter", "audio")),
+        )
+        if observed != self._last_observed:
+            self._last_observed = observed
+            self._notify_change()
 
     # ----- policy -----
 
@@ -72,7 +359,13 @@ class TreeController:
 
     def _ensure_tree(self) -> RGBXmasTree:
         if self._tree is None:
-            self._tree = RGBXmasTree()
+            self._tree = self._tree_factory()
+            bind_metrics = getattr(self._tree, "bind_metrics", None)
+            if bind_metrics is not None:
+                # Multi-chain trees report per-chain throughput.
+                bind_metrics(self.metrics)
+            with self._preview_lock:
+                self._tree.capture_shown = self._preview_clients > 0
         return self._tree
 
     @staticmethod
@@ -99,28 +392,115 @@ class TreeController:
             # Hardware errors shouldn't crash the supervisor loop.
             pass
 
-    def _start_program(self, program_id: str, speed: float) -> None:
-        spec = PROGRAMS.get(program_id)
-        if spec is None:
-            spec = PROGRAMS["rgb_cycle"]
-            program_id = spec.id
+    def _start_program(self, program_id: str, speed: float, timeline: Timeline | None = None) -> None:
+        program_id = _resolve_program(program_id)
+        spec = PROGRAMS[program_id]
 
         tree = self._ensure_tree()
+        # Every program starts from the default; one that left auto_show off mustn't
+        # silence the next.
+        tree.auto_show = True
 
         self._runner_stop.clear()
         self._runner_program_id = program_id
         self._runner_speed = float(speed)
 
+        stop = self._runner_stop
+        if self._sync is not None and self._sync.role == "leader":
+            timeline = self._sync.start_timeline(program_id, speed)
+        self._runner_timeline = timeline
+        pacer = self._sync.pacer(timeline, stop) if timeline is not None else None
+        on_idle = self.low_jitter.idle if self.low_jitter is not None else None
+        if pacer is not None:
+            ctx = RenderContext(
+                program_id,
+                self.metrics,
+                sleeper=pacer.sleep,
+                on_frame=self.tracer.frame_shown,
+                rng=random.Random(timeline.seed),
+                timebase=pacer.time,
+                on_idle=on_idle,
+            )
+        else:
+            # Sleeping on the stop event lets a stop interrupt a program's inter-frame sleep, so
+            # switching away (to another program, off, or realtime) doesn't wait out a long delay.
+            # Adaptive pacing skips unchanged and late frames; synced trees keep strict lockstep,
+            # and programs showing live input opt out (see ProgramSpec.adaptive_pacing).
+            ctx = RenderContext(
+                program_id,
+                self.metrics,
+                sleeper=stop.wait,
+                on_frame=self.tracer.frame_shown,
+                adaptive=self._adaptive_pacing and spec.adaptive_pacing,
+                on_idle=on_idle,
+            )
+        tree.frame_observer = ctx
+
         def _run():
+            started = time.monotonic()
+            error: BaseException | None = None
+            ctx.bind()
+            if self.low_jitter is not None:
+                self.low_jitter.enter_render_thread()
             try:
-                spec.runner(tree, self._runner_stop, speed)
-            except Exception:
-                # If a program crashes, supervisor may restart it if we still want "on".
-                pass
+                if pacer is not None:
+                    pacer.wait_start()
+                spec.runner(tree, stop, speed)
+            except Exception as e:
+                # If a program crashes, supervisor restarts it (with backoff) if we still want "on".
+                error = e
+            finally:
+                ctx.unbind()
+            self._note_runner_exit(program_id, speed, started, error, stopped=stop.is_set())
 
         self._runner_thread = threading.Thread(target=_run, name=f"rgbxmastree-program-{program_id}", daemon=True)
         self._runner_thread.start()
 
+    def _note_runner_exit(
+        self,
+        program_id: str,
+        speed: float,
+        started: float,
+        error: BaseException | None,
+        stopped: bool,
+    ) -> None:
+        """
+        Record how a runner ended. Called from the runner thread itself.
+        """
+        ended = time.monotonic()
+        ran_for = ended - started
+        if stopped and error is None:
+            return
+
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "program_id": program_id,
+            "program_speed": float(speed),
+            "ran_for_s": round(ran_for, 3),
+            "error": repr(error) if error is not None else "program returned without being stopped",
+            "traceback": "".join(traceback.format_exception(type(error), error, error.__traceback__)) if error is not None else None,
+        }
+        with self._errors_lock:
+            self._recent_errors.append(entry)
+            if stopped:
+                # Crashed while shutting down: worth reporting, not worth backing off.
+                return
+            b = self._backoff.setdefault(program_id, _RestartBackoff())
+            if ran_for >= RESTART_BACKOFF_RESET_AFTER_S:
+                b.failures = 0
+            b.failures += 1
+            delay = min(RESTART_BACKOFF_MAX_S, RESTART_BACKOFF_BASE_S * (2 ** (b.failures - 1)))
+            b.retry_at = ended + delay
+
+    def _restart_allowed(self, program_id: str) -> bool:
+        with self._errors_lock:
+            b = self._backoff.get(program_id)
+            return b is None or time.monotonic() >= b.retry_at
+
+    def _reset_backoff(self, program_id: str) -> None:
+        with self._errors_lock:
+            self._backoff.pop(program_id, None)
+
     def _stop_program(self) -> None:
         self._runner_stop.set()
         t = self._runner_thread
@@ -129,7 +509,25 @@ class TreeController:
         self._runner_thread = None
         self._runner_program_id = None
         self._runner_speed = None
+        self._runner_timeline = None
         self._runner_stop.clear()
+        if self._tree is not None:
+            self._tree.frame_observer = None
+
+    def _take_realtime(self, cfg: AppConfig) -> None:
+        if not self._realtime_live:
+            self._stop_program()
+            tree = self._ensure_tree()
+            tree.frame_observer = RenderContext("realtime", self.metrics, on_frame=self.tracer.frame_shown)
+            self._realtime_live = True
+        self._apply_brightness(cfg)
+
+    def _release_realtime(self) -> None:
+        if not self._realtime_live:
+            return
+        self._realtime_live = False
+        if self._tree is not None:
+            self._tree.frame_observer = None
 
     def _power_off(self) -> None:
         if self._tree is None:
@@ -144,34 +542,97 @@ class TreeController:
         Background loop that enforces desired power state and keeps the program running.
         """
         while not self._supervisor_stop.is_set():
+            tick_start = time.perf_counter()
+            # Cleared before reading the config, so a change saved during this tick wakes the next.
+            self._supervisor_wake.clear()
             with self._lock:
                 cfg = self._cfg
+                version = self._cfg_version
+            leader = self._sync.leader_state() if self._sync is not None and self._sync.role == "follower" else None
+            if leader is not None:
+                cfg = self._follow(cfg, leader)
+            timeline = leader.timeline if leader is not None else None
             now = datetime.now()
             want_on = self._desired_on(now, cfg)
+            # Realtime data overrides programs and the schedule; only an explicit "off" wins.
+            realtime_on = self._realtime is not None and cfg.mode != "manual_off" and self._realtime.receiving()
 
             with self._lock:
-                if not want_on:
+                if realtime_on:
+                    self._take_realtime(cfg)
+                    self.tracer.applied(version, tick_start)
+                elif not want_on:
+                    self._release_realtime()
                     self._stop_program()
                     self._power_off()
+                    self.tracer.applied(version, tick_start)
+                    self.tracer.complete_without_frame()
                 else:
+                    self._release_realtime()
                     # Ensure driver exists and stays configured (brightness can change at runtime).
                     self._ensure_tree()
-                    self._apply_brightness(cfg)
-                    # Ensure correct program is running
+                    # Ensure correct program is running. Compared (and backed off) by the
+                    # program that actually runs, so an unknown id isn't a new choice every tick.
+                    program_id = _resolve_program(cfg.program_id)
+                    restart = False
                     if self._runner_thread is None or not self._runner_thread.is_alive():
-                        self._start_program(cfg.program_id, cfg.program_speed)
-                    elif self._runner_program_id != cfg.program_id:
-                        self._stop_program()
-                        self._start_program(cfg.program_id, cfg.program_speed)
+                        crashed_same = (
+                            self._runner_thread is not None
+                            and self._runner_program_id == program_id
+                            and self._runner_speed == float(cfg.program_speed)
+                        )
+                        if not crashed_same:
+                            # A fresh choice of program/speed gets a fresh chance.
+                            self._reset_backoff(program_id)
+                        restart = self._restart_allowed(program_id)
+                    elif self._runner_program_id != program_id:
+                        restart = True
                     elif self._runner_speed is None or float(cfg.program_speed) != float(self._runner_speed):
                         # Apply speed changes immediately (restart runner with the new speed).
+                        restart = True
+                    elif self._sync is not None and self._sync.role == "follower" and self._runner_timeline != timeline:
+                        # The leader started a new timeline, or we gained/lost the leader.
+                        restart = True
+
+                    if not restart:
+                        # Mark applied first so the brightness push below counts as the first frame.
+                        self.tracer.applied(version, tick_start)
+                    self._apply_brightness(cfg)
+                    if restart:
                         self._stop_program()
-                        self._start_program(cfg.program_id, cfg.program_speed)
+                        self._start_program(program_id, cfg.program_speed, timeline)
+                        self.tracer.applied(version, tick_start, restarted=True)
+
+            if self._sync is not None and self._sync.role == "leader":
+                self._sync.publish(want_on, cfg.body_brightness_pct, cfg.star_brightness_pct)
 
-            time.sleep(0.25)
+            self._observe(version, now, cfg)
+            if self.low_jitter is not None:
+                self.low_jitter.maintenance()
+            self._h_supervisor_tick.observe(time.perf_counter() - tick_start)
+            self._supervisor_wake.wait(0.25)
+
+    @staticmethod
+    def _follow(cfg: AppConfig, leader: LeaderState) -> AppConfig:
+        """The config a follower runs with: the leader's program, power and brightness."""
+        return replace(
+            cfg,
+            mode="manual_on" if leader.on else "manual_off",
+            # A program this tree doesn't have (e.g. the leader's local ingest) falls back as usual.
+            program_id=_resolve_program(leader.timeline.program_id),
+            program_speed=leader.timeline.speed,
+            body_brightness_pct=leader.body_pct,
+            star_brightness_pct=leader.star_pct,
+        )
 
     def close(self) -> None:
+        if self._realtime is not None:
+            self._realtime.close()
+        if self._sync is not None:
+            self._sync.close()
         self._supervisor_stop.set()
+        self._supervisor_wake.set()
+        self._notify_change()
         if self._supervisor_thread.is_alive():
             self._supervisor_thread.join(timeout=2.0)
         with self._lock:
@@ -183,5 +644,13 @@ class TreeController:
             except Exception:
                 pass
             self._tree = None
+        if self._ingest is not None:
+            PROGRAMS.pop(LOCAL_INGEST_PROGRAM_ID, None)
+            self._ingest.close()
+        if self._audio is not None:
+            PROGRAMS.pop(AUDIO_PROGRAM_ID, None)
+            self._audio.close()
+        if self.low_jitter is not None:
+            self.low_jitter.close()
 
 
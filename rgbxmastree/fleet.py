@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from urllib.parse import urlsplit
+
+
+# Fleet control: one process that knows a set of tree endpoints and drives them together.
+# Commands are fanned out concurrently over per-node pools of keep-alive connections; each
+# node has its own timeout, so one dead Pi costs at most that long and never blocks the rest.
+DEFAULT_NODE_TIMEOUT_S = 2.0
+POOL_SIZE_PER_NODE = 4
+MAX_FANOUT_WORKERS = 32
+NODE_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+# How a pooled connection the node has since closed fails before any response arrives.
+# Only these are retried on a fresh connection: a timeout may mean the node is still working
+# on the request, and sending it again would apply a command twice.
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+@dataclass
+class FleetNode:
+    name: str
+    url: str  # e.g. "http://tree-hall.local:8080"
+    timeout_s: float = DEFAULT_NODE_TIMEOUT_S
+
+
+@dataclass
+class NodeResult:
+    node: str
+    ok: bool
+    status: int | None
+    body: object | None
+    error: str | None
+    elapsed_ms: float
+    etag: str | None = None
+
+    def to_json(self) -> dict:
+        out = {"ok": self.ok, "status": self.status, "elapsed_ms": round(self.elapsed_ms, 1)}
+        if self.error is not None:
+            out["error"] = self.error
+        if self.body is not None:
+            out["body"] = self.body
+        return out
+
+
+def parse_node_url(url: str) -> tuple[str, int]:
+    split = urlsplit(url)
+    if split.scheme != "http" or not split.hostname:
+        raise ValueError("url must look like http://host[:port]")
+    if split.path not in ("", "/") or split.query:
+        raise ValueError("url must not have a path or query")
+    return split.hostname, split.port or 80
+
+
+class NodeClient:
+    """Keep-alive connections to one tree, reused across requests (up to POOL_SIZE_PER_NODE idle)."""
+
+    def __init__(self, node: FleetNode):
+        self.node = node
+        self._host, self._port = parse_node_url(node.url)
+        self._idle: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return http.client.HTTPConnection(self._host, self._port, timeout=self.node.timeout_s), False
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < POOL_SIZE_PER_NODE:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method: str, path: str, body: bytes | None = None, headers: dict | None = None) -> NodeResult:
+        headers = {"Accept": "application/json", **(headers or {})}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        start = time.perf_counter()
+        while True:
+            conn, reused = self._connection()
+            resp = None
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if reused and resp is None and isinstance(e, STALE_CONNECTION_ERRORS):
+                    continue  # the node closed an idle connection; retry on a fresh one
+                return NodeResult(self.node.name, False, None, None, repr(e), (time.perf_counter() - start) * 1000.0)
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        try:
+            parsed = json.loads(data) if data else None
+        except ValueError:
+            parsed = data.decode("utf-8", "replace")
+        ok = 200 <= resp.status < 300 or resp.status == 304
+        error = None if ok else f"HTTP {resp.status}"
+        return NodeResult(
+            self.node.name, ok, resp.status, parsed, error, (time.perf_counter() - start) * 1000.0, resp.getheader("ETag")
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class Fleet:
+    """
+    The node registry (persisted as JSON, like the tree's own config) and the fan-out.
+
+    Registry file: {"nodes": [{"name": "hall", "url": "http://10.0.0.21:8080", "timeout_s": 2.0}, ...]}
+    """
+
+    def __init__(self, registry_path: str):
+        self._path = registry_path
+        self._lock = threading.Lock()
+        self._clients: dict[str, NodeClient] = {}
+        self._executor = ThreadPoolExecutor(max_workers=MAX_FANOUT_WORKERS, thread_name_prefix="rgbxmastree-fleet")
+        # Last /api/state per node with its ETag, so polling an unchanged node is a 304.
+        self._state_cache: dict[str, tuple[str, object]] = {}
+        for node in self._load():
+            self._clients[node.name] = NodeClient(node)
+
+    # ----- registry -----
+
+    def _load(self) -> list[FleetNode]:
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return []
+        nodes = []
+        for n in raw.get("nodes") or []:
+            if isinstance(n, dict) and n.get("name") and n.get("url"):
+                nodes.append(FleetNode(str(n["name"]), str(n["url"]), float(n.get("timeout_s", DEFAULT_NODE_TIMEOUT_S))))
+        return nodes
+
+    def _save(self) -> None:
+        data = {"nodes": [asdict(c.node) for c in self._clients.values()]}
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix="rgbxmastree_fleet_", suffix=".json", dir=os.path.dirname(self._path) or ".")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+                f.write("\n")
+            os.replace(tmp_path, self._path)
+        finally:
+            try:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def nodes(self) -> list[FleetNode]:
+        with self._lock:
+            return [c.node for c in self._clients.values()]
+
+    def add_node(self, node: FleetNode) -> None:
+        """Add or replace a node. Raises ValueError for a bad name or URL."""
+        if not NODE_NAME_RE.match(node.name):
+            raise ValueError("name must be 1-64 letters, digits, '.', '_' or '-'")
+        client = NodeClient(node)
+        with self._lock:
+            old = self._clients.pop(node.name, None)
+            self._clients[node.name] = client
+            self._state_cache.pop(node.name, None)
+            self._save()
+        if old is not None:
+            old.close()
+
+    def remove_node(self, name: str) -> bool:
+        with self._lock:
+            client = self._clients.pop(name, None)
+            self._state_cache.pop(name, None)
+            if client is not None:
+                self._save()
+        if client is None:
+            return False
+        client.close()
+        return True
+
+    # ----- fan-out -----
+
+    def fan_out(
+        self,
+        method: str,
+        path: str,
+        body: bytes | None = None,
+        names: list[str] | None = None,
+        headers: dict | None = None,
+    ) -> list[NodeResult]:
+        """Send one request to every node (or the named ones) at once; results in registry order."""
+        with self._lock:
+            clients = [c for c in self._clients.values() if names is None or c.node.name in names]
+        futures = {c.node.name: self._executor.submit(c.request, method, path, body, headers) for c in clients}
+        # Connect and read each get the node's timeout; allow for both before giving up on it.
+        deadline = max((c.node.timeout_s for c in clients), default=0.0) * 2 + 0.5
+        wait(futures.values(), timeout=deadline)
+        results = []
+        for c in clients:
+            future = futures[c.node.name]
+            if future.done():
+                results.append(future.result())
+            else:
+                results.append(NodeResult(c.node.name, False, None, None, "timed out", deadline * 1000.0))
+        return results
+
+    def _state_request(self, client: NodeClient) -> NodeResult:
+        # Runs on the fan-out pool: the cache is shared with other polls and registry edits.
+        with self._lock:
+            cached = self._state_cache.get(client.node.name)
+        headers = {"If-None-Match": cached[0]} if cached is not None else None
+        result = client.request("GET", "/api/state", headers=headers)
+        if result.status == 304 and cached is not None:
+            result.body = cached[1]
+        elif result.ok and result.etag:
+            with self._lock:
+                # Not for a node removed or replaced while the request was out.
+                if self._clients.get(client.node.name) is client:
+                    self._state_cache[client.node.name] = (result.etag, result.body)
+        return result
+
+    def state(self) -> dict:
+        """Every node's /api/state plus a summary of how the fleet as a whole looks."""
+        with self._lock:
+            clients = list(self._clients.values())
+        futures = [(c, self._executor.submit(self._state_request, c)) for c in clients]
+        deadline = max((c.node.timeout_s for c in clients), default=0.0) * 2 + 0.5
+        wait([f for _, f in futures], timeout=deadline)
+
+        nodes = {}
+        modes: dict[str, int] = {}
+        programs: dict[str, int] = {}
+        running = 0
+        for c, future in futures:
+            if not future.done():
+                nodes[c.node.name] = {"ok": False, "url": c.node.url, "error": "timed out"}
+                continue
+            result = future.result()
+            entry = {"ok": result.ok, "url": c.node.url, "elapsed_ms": round(result.elapsed_ms, 1)}
+            if result.ok and isinstance(result.body, dict):
+                state = result.body
+                entry["state"] = state
+                modes[state.get("mode")] = modes.get(state.get("mode"), 0) + 1
+                runtime = state.get("runtime") or {}
+                if runtime.get("program_running"):
+                    running += 1
+                    pid = runtime.get("program_id")
+                    programs[pid] = programs.get(pid, 0) + 1
+            else:
+                entry["error"] = result.error or "unexpected response"
+            nodes[c.node.name] = entry
+        online = sum(1 for e in nodes.values() if e["ok"])
+        return {
+            "nodes": nodes,
+            "summary": {
+                "total": len(nodes),
+                "online": online,
+                "running": running,
+                "modes": modes,
+                "programs": programs,
+                # True when every online node is in the same mode running the same program.
+                "uniform": online > 0 and len(modes) == 1 and len(programs) <= 1,
+            },
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            clients = list(self._clients.values())
+        for c in clients:
+            c.close()
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+from threading import Event
+
+from rgbxmastree.hardware.simulated import SimulatedXmasTree
+from rgbxmastree.programs import PROGRAMS
+from rgbxmastree.runtime import run_headless
+
+
+# File layout: MAGIC | u32 big-endian header length | JSON header | zlib(frame0 + frame1 + ...)
+# Each frame is the tree's pixels as packed 8-bit RGB triples, in pixel-index order.
+MAGIC = b"RGBXGLD1"
+DEFAULT_DIR = "golden"
+DEFAULT_FRAMES = 120
+DEFAULT_SPEEDS = (1.0, 10.0, 200.0)
+DEFAULT_SEED = 1234
+MAX_WALL_S_PER_RUN = 60.0
+
+
+class _FrameCapture:
+    """tree.frame_observer that records each shown frame and stops after N of them."""
+
+    def __init__(self, tree: SimulatedXmasTree, frames: int, stop: Event):
+        self.tree = tree
+        self.frames = frames
+        self.stop = stop
+        self.captured: list[bytes] = []
+
+    def frame_shown(self, start: float, end: float) -> None:
+        if len(self.captured) < self.frames:
+            self.captured.append(self.tree.rgb_frame())
+        if len(self.captured) >= self.frames:
+            self.stop.set()
+
+
+def record_frames(tree: SimulatedXmasTree, program_id: str, speed: float, frames: int, seed: int) -> list[bytes]:
+    """First `frames` frames a program shows, on a virtual clock with a seeded RNG."""
+    spec = PROGRAMS[program_id]
+    tree.frame_observer = None
+    tree.auto_show = True
+    tree.off()
+    stop = Event()
+    capture = _FrameCapture(tree, frames, stop)
+    tree.frame_observer = capture
+    try:
+        run_headless(tree, spec.runner, speed, stop, program_id=program_id, seed=seed, max_wall_s=MAX_WALL_S_PER_RUN)
+    finally:
+        tree.frame_observer = None
+    return capture.captured
+
+
+def golden_path(directory: str, program_id: str, speed: float) -> str:
+    return os.path.join(directory, f"{program_id}@{speed:g}.gold")
+
+
+def write_golden(path: str, meta: dict, frames: list[bytes]) -> None:
+    header = json.dumps(meta, sort_keys=True).encode("utf-8")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack(">I", len(header)))
+        f.write(header)
+        f.write(zlib.compress(b"".join(frames), 9))
+
+
+def read_golden(path: str) -> tuple[dict, list[bytes]]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path}: not a golden frame file")
+    (hlen,) = struct.unpack_from(">I", data, len(MAGIC))
+    start = len(MAGIC) + 4
+    meta = json.loads(data[start:start + hlen].decode("utf-8"))
+    payload = zlib.decompress(data[start + hlen:])
+    size = int(meta["frame_bytes"])
+    return meta, [payload[i:i + size] for i in range(0, len(payload), size)]
+
+
+def compare_frames(expected: list[bytes], actual: list[bytes], tolerance: int = 0) -> str | None:
+    """
+    Return a description of the first difference, or None if `actual` matches.
+
+    tolerance=0 means byte-for-byte; otherwise each channel may differ by up to
+    `tolerance` (out of 255).
+    """
+    if len(actual) < len(expected):
+        return f"only {len(actual)} of {len(expected)} frames were shown"
+    for n, (e, a) in enumerate(zip(expected, actual)):
+        if e == a:
+            continue
+        if len(e) != len(a):
+            return f"frame {n}: {len(a)} bytes, expected {len(e)}"
+        for i, (x, y) in enumerate(zip(e, a)):
+            if abs(x - y) > tolerance:
+                return f"frame {n} pixel {i // 3} channel {'rgb'[i % 3]}: {y}, expected {x}"
+    return None
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m rgbxmastree.golden",
+        description="Record or check golden frame files for every program.",
+    )
+    parser.add_argument("command", choices=("record", "check"))
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="Golden file directory")
+    parser.add_argument("--programs", default="", help="Comma-separated program ids (default: all)")
+    parser.add_argument(
+        "--speeds",
+        default=",".join(f"{s:g}" for s in DEFAULT_SPEEDS),
+        help="Comma-separated speeds (record only; check uses what's on disk)",
+    )
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES, help="Frames to record")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--tolerance", type=int, default=0, help="Allowed per-channel difference (0 = exact)")
+    args = parser.parse_args(argv)
+
+    program_ids = [p.strip() for p in args.programs.split(",") if p.strip()] or list(PROGRAMS)
+    unknown = [p for p in program_ids if p not in PROGRAMS]
+    if unknown:
+        parser.error(f"unknown program(s): {', '.join(unknown)}")
+
+    tree = SimulatedXmasTree()
+    failures = 0
+    try:
+        if args.command == "record":
+            speeds = [float(s) for s in args.speeds.split(",") if s.strip()]
+            for program_id in program_ids:
+                for speed in speeds:
+                    frames = record_frames(tree, program_id, speed, max(1, args.frames), args.seed)
+                    meta = {
+                        "program": program_id,
+                        "speed": speed,
+                        "seed": args.seed,
+                        "frames": len(frames),
+                        "pixels": len(tree),
+                        "frame_bytes": len(tree) * 3,
+                    }
+                    path = golden_path(args.dir, program_id, speed)
+                    write_golden(path, meta, frames)
+                    print(f"recorded {path} ({len(frames)} frames)")
+        else:
+            for name in sorted(os.listdir(args.dir)):
+                if not name.endswith(".gold"):
+                    continue
+                path = os.path.join(args.dir, name)
+                meta, expected = read_golden(path)
+                if meta["program"] not in program_ids:
+                    continue
+                actual = record_frames(tree, meta["program"], float(meta["speed"]), len(expected), int(meta["seed"]))
+                problem = compare_frames(expected, actual, args.tolerance)
+                if problem:
+                    failures += 1
+                    print(f"FAIL {name}: {problem}")
+                else:
+                    print(f"ok   {name}")
+    finally:
+        tree.close()
+
+    if failures:
+        print(f"{failures} golden file(s) differ", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from statistics import mean
+from time import perf_counter
+from typing import Callable
+
+from colorzero import Color
+
+from rgbxmastree.hardware.tree import Pixel, RGBXmasTree
+from rgbxmastree.metrics import MetricsRegistry
+
+
+# EWMA weight for the per-chain throughput gauge (roughly the last ~20 transfers).
+_THROUGHPUT_ALPHA = 0.05
+CHAIN_KINDS = ("tree", "strip")
+
+
+@dataclass(frozen=True)
+class ChainSpec:
+    """
+    One APA102 chain on its own pins.
+
+    kind "tree" is the 3D Xmas Tree (25 pixels, levels/branches and a star); "strip" is a
+    plain run of `pixels` LEDs. `mirror` names an earlier chain of the same kind and length
+    to copy instead of adding pixels of its own (e.g. a second tree showing the same thing).
+    """
+
+    name: str
+    kind: str = "tree"
+    pixels: int = 25
+    mosi_pin: int = 12
+    clock_pin: int = 25
+    select_pin: int = 26
+    mirror: str | None = None
+
+
+def load_chains(path: str) -> list[ChainSpec]:
+    """
+    Read a chains file: {"chains": [{"name": "tree", "kind": "tree"}, {"name": "strip",
+    "kind": "strip", "pixels": 60, "mosi_pin": 10, "clock_pin": 11, "select_pin": 7}]}.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    specs = []
+    for i, c in enumerate(raw.get("chains") or []):
+        if not isinstance(c, dict):
+            raise ValueError(f"chain {i} must be an object")
+        kind = c.get("kind", "tree")
+        specs.append(ChainSpec(
+            name=str(c.get("name", f"chain{i}")),
+            kind=kind,
+            pixels=int(c.get("pixels", 25 if kind == "tree" else 0)),
+            mosi_pin=int(c.get("mosi_pin", 12)),
+            clock_pin=int(c.get("clock_pin", 25)),
+            select_pin=int(c.get("select_pin", 26)),
+            mirror=c.get("mirror"),
+        ))
+    validate_chains(specs)
+    return specs
+
+
+def validate_chains(specs: list[ChainSpec]) -> None:
+    if not specs:
+        raise ValueError("at least one chain is required")
+    seen: dict[str, ChainSpec] = {}
+    for spec in specs:
+        if spec.kind not in CHAIN_KINDS:
+            raise ValueError(f"chain {spec.name!r}: kind must be one of {', '.join(CHAIN_KINDS)}")
+        if spec.kind == "tree" and spec.pixels != 25:
+            raise ValueError(f"chain {spec.name!r}: a tree has 25 pixels")
+        if spec.pixels < 1:
+            raise ValueError(f"chain {spec.name!r}: pixels must be at least 1")
+        if spec.name in seen:
+            raise ValueError(f"duplicate chain name {spec.name!r}")
+        if spec.mirror is not None:
+            source = seen.get(spec.mirror)
+            if source is None or source.mirror is not None:
+                raise ValueError(f"chain {spec.name!r}: mirror must name an earlier, non-mirror chain")
+            if (source.kind, source.pixels) != (spec.kind, spec.pixels):
+                raise ValueError(f"chain {spec.name!r}: a mirror must match its source's kind and length")
+        seen[spec.name] = spec
+    if not any(s.kind == "tree" and s.mirror is None for s in specs):
+        raise ValueError("one (non-mirror) chain must be a tree: programs address levels, branches and the star")
+
+
+class _ChainStats:
+    def __init__(self, metrics: MetricsRegistry, name: str, frame_bytes: int):
+        self.frame_bytes = frame_bytes
+        self.frames = metrics.counter("rgbxmastree_chain_frames_total", "Frames transferred per chain", chain=name)
+        self.bytes = metrics.counter("rgbxmastree_chain_bytes_total", "SPI bytes transferred per chain", chain=name)
+        self.seconds = metrics.histogram(
+            "rgbxmastree_chain_transfer_seconds", "Time to transfer one frame down a chain", chain=name
+        )
+        self.throughput = metrics.gauge(
+            "rgbxmastree_chain_throughput_bytes_per_second", "SPI throughput per chain while transferring", chain=name
+        )
+        self._ewma: float | None = None
+
+    def observe(self, seconds: float) -> None:
+        self.frames.inc()
+        self.bytes.inc(self.frame_bytes)
+        self.seconds.observe(seconds)
+        if seconds > 0.0:
+            rate = self.frame_bytes / seconds
+            e = self._ewma
+            self._ewma = rate if e is None else e + _THROUGHPUT_ALPHA * (rate - e)
+            self.throughput.set(self._ewma)
+
+
+class MultiChainTree:
+    """
+    Several APA102 chains behind the RGBXmasTree interface, so programs and the controller
+    don't know the difference.
+
+    The non-mirror chains form one logical framebuffer, in the order given: pixel 0 is the
+    first chain's pixel 0, and so on. `tree[level, branch]` and `tree.star` address the first
+    tree chain. Pixel writes go straight into the owning chain's SPI frame; `show()` copies
+    mirrors and then transfers every chain in parallel.
+    """
+
+    def __init__(
+        self,
+        specs: list[ChainSpec],
+        chain_factory: Callable[..., RGBXmasTree] = RGBXmasTree,
+        brightness: float = 0.5,
+    ):
+        validate_chains(specs)
+        self.specs = list(specs)
+        self._drivers: list[RGBXmasTree] = []
+        by_name: dict[str, RGBXmasTree] = {}
+        self._mirrors: list[tuple[RGBXmasTree, RGBXmasTree]] = []
+        # (driver, first logical pixel, pixel count) for each non-mirror chain.
+        self._segments: list[tuple[RGBXmasTree, int, int]] = []
+        self._locate: list[tuple[RGBXmasTree, int]] = []
+        primary: RGBXmasTree | None = None
+        base = 0
+        try:
+            for spec in self.specs:
+                kwargs = dict(
+                    pixels=spec.pixels,
+                    brightness=brightness,
+                    mosi_pin=spec.mosi_pin,
+                    clock_pin=spec.clock_pin,
+                    select_pin=spec.select_pin,
+                    # APA102s have no data out; leaving MISO unclaimed lets chains coexist.
+                    miso_pin=None,
+                )
+                if spec.kind == "strip":
+                    kwargs.update(index_map=(tuple(range(spec.pixels)),), star_index=None)
+                driver = chain_factory(**kwargs)
+                driver.auto_show = False
+                self._drivers.append(driver)
+                by_name[spec.name] = driver
+                if spec.mirror is not None:
+                    self._mirrors.append((driver, by_name[spec.mirror]))
+                    continue
+                if spec.kind == "tree" and primary is None:
+                    primary, base = driver, len(self._locate)
+                self._segments.append((driver, len(self._locate), spec.pixels))
+                self._locate.extend((driver, i) for i in range(spec.pixels))
+        except Exception:
+            for driver in self._drivers:
+                driver.close()
+            raise
+
+        self._index_map = tuple(tuple(base + i for i in row) for row in primary._index_map)
+        self._star_index = base + primary._star_index
+
+        self._all = [Pixel(parent=self, index=i) for i in range(len(self._locate))]
+        self._value: list[tuple[float, float, float]] = [(0.0, 0.0, 0.0)] * len(self._locate)
+        self._body_brightness_bits = primary.body_brightness
+        self._star_brightness_bits = primary.star_brightness
+
+        self.auto_show: bool = True
+        self.frame_observer = None
+        self.capture_shown: bool = False
+        # (sequence number, tuple of each non-mirror chain's SPI frame); see RGBXmasTree.shown.
+        self.shown: tuple[int, tuple[bytes, ...]] | None = None
+        self._shown_seq = 0
+        self._stats: list[_ChainStats] | None = None
+        self._pool = (
+            ThreadPoolExecutor(max_workers=len(self._drivers), thread_name_prefix="rgbxmastree-chain")
+            if len(self._drivers) > 1
+            else None
+        )
+
+    def bind_metrics(self, metrics: MetricsRegistry) -> None:
+        """Report per-chain frames, bytes, transfer time and throughput (called by the controller)."""
+        self._stats = [_ChainStats(metrics, s.name, len(d._spi_frame)) for s, d in zip(self.specs, self._drivers)]
+
+    def __len__(self):
+        return len(self._all)
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple) and len(index) == 2:
+            level, branch = index
+            return self._all[self._index_map[level][branch]]
+        return self._all[index]
+
+    def __iter__(self):
+        return iter(self._all)
+
+    @property
+    def star(self) -> Pixel:
+        return self._all[self._star_index]
+
+    # --- frame ---
+
+    def _set_pixel_value(self, index: int, rgb: tuple[float, float, float]) -> None:
+        driver, local = self._locate[index]
+        driver._set_pixel_value(local, rgb)
+        self._value[index] = driver._value[local]
+        if self.auto_show:
+            self.show()
+
+    def write_rgb(self, first: int, data) -> int:
+        """As RGBXmasTree.write_rgb, across chains in logical order."""
+        count = max(0, min(len(data) // 3, len(self._all) - first))
+        end = first + count
+        for driver, offset, n in self._segments:
+            lo = max(first, offset)
+            hi = min(end, offset + n)
+            if lo < hi:
+                driver.write_rgb(lo - offset, data[(lo - first) * 3:(hi - first) * 3])
+                self._value[lo:hi] = driver._value[lo - offset:hi - offset]
+        return count
+
+    def frame_rgb(self, frames) -> bytes:
+        return b"".join(driver.frame_rgb(frame) for (driver, _o, _n), frame in zip(self._segments, frames))
+
+    def _transfer_chain(self, i: int) -> None:
+        driver = self._drivers[i]
+        if self._stats is None:
+            driver._transfer()
+            return
+        start = perf_counter()
+        driver._transfer()
+        self._stats[i].observe(perf_counter() - start)
+
+    def show(self) -> None:
+        """Copy mirrored chains, then send every chain's SPI frame (in parallel)."""
+        for mirror, source in self._mirrors:
+            src = source._spi_frame
+            dst = mirror._spi_frame
+            for i in range(len(source)):
+                s = source._pixel_offset(i)
+                dst[s + 1:s + 4] = src[s + 1:s + 4]
+            mirror._value[:] = source._value
+        observer = self.frame_observer
+        ready = getattr(observer, "frame_ready", None)
+        if ready is not None and not ready(itertools.chain.from_iterable(d._spi_frame for d in self._drivers)):
+            return
+        start = perf_counter()
+        if self._pool is None:
+            self._transfer_chain(0)
+        else:
+            for _ in self._pool.map(self._transfer_chain, range(len(self._drivers))):
+                pass
+        if observer is not None:
+            observer.frame_shown(start, perf_counter())
+        if self.capture_shown:
+            self._shown_seq += 1
+            self.shown = (self._shown_seq, tuple(bytes(d._spi_frame) for d, _o, _n in self._segments))
+
+    # --- bulk colour (same semantics as RGBXmasTree) ---
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        seq = list(value)
+        if len(seq) != len(self._all):
+            raise ValueError(f"value must have length {len(self._all)}")
+        prev = self.auto_show
+        self.auto_show = False
+        try:
+            for i, (r, g, b) in enumerate(seq):
+                self._set_pixel_value(i, (r, g, b))
+        finally:
+            self.auto_show = prev
+        if self.auto_show:
+            self.show()
+
+    @property
+    def color(self):
+        return Color(
+            mean(v[0] for v in self._value),
+            mean(v[1] for v in self._value),
+            mean(v[2] for v in self._value),
+        )
+
+    @color.setter
+    def color(self, c):
+        r, g, b = c
+        self.value = ((r, g, b),) * len(self)
+
+    def on(self):
+        self.value = ((1, 1, 1),) * len(self)
+
+    def off(self):
+        self.value = ((0, 0, 0),) * len(self)
+
+    # --- brightness (body applies to every chain, star to chains that have one) ---
+
+    @property
+    def brightness(self):
+        return self._body_brightness_bits / 31.0
+
+    @brightness.setter
+    def brightness(self, brightness: float):
+        self.body_brightness = RGBXmasTree._brightness_arg_to_bits(brightness)
+
+    @property
+    def body_brightness(self) -> int:
+        return int(self._body_brightness_bits)
+
+    @body_brightness.setter
+    def body_brightness(self, bits: int) -> None:
+        self._body_brightness_bits = RGBXmasTree._brightness_arg_to_bits(bits)
+        for driver in self._drivers:
+            driver.body_brightness = self._body_brightness_bits
+        if self.auto_show:
+            self.show()
+
+    @property
+    def star_brightness(self) -> int:
+        return int(self._star_brightness_bits)
+
+    @star_brightness.setter
+    def star_brightness(self, bits: int) -> None:
+        self._star_brightness_bits = RGBXmasTree._brightness_arg_to_bits(bits)
+        for driver in self._drivers:
+            if driver._star_index is not None:
+                driver.star_brightness = self._star_brightness_bits
+        if self.auto_show:
+            self.show()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        for driver in self._drivers:
+            driver.close()
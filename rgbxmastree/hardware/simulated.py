@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import time
+
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory
+
+from rgbxmastree.hardware.tree import RGBXmasTree
+
+
+class SimulatedXmasTree(RGBXmasTree):
+    """
+    Drop-in RGBXmasTree for headless runs (benchmarks, load tests, development).
+
+    Uses gpiozero mock pins and replaces the SPI transfer with a copy of the frame, so
+    programs run exactly as on hardware without a Pi. Set `transfer_time` (seconds) to
+    emulate the cost of pushing a frame down the bus.
+    """
+
+    def __init__(self, *args, transfer_time: float = 0.0, **kwargs):
+        if Device.pin_factory is None:
+            # gpiozero's software SPI bus resolves pins via the *default* factory, so a
+            # per-device factory alone isn't enough. Nothing real is driven in this process.
+            Device.pin_factory = MockFactory()
+        if isinstance(Device.pin_factory, MockFactory):
+            kwargs.setdefault("pin_factory", Device.pin_factory)
+        else:
+            kwargs.setdefault("pin_factory", MockFactory())
+        self.transfer_time = float(transfer_time)
+        self.frames_sent = 0
+        self.last_frame: bytes = b""
+        super().__init__(*args, **kwargs)
+
+    def _transfer(self) -> None:
+        self.last_frame = bytes(self._spi_frame)
+        self.frames_sent += 1
+        if self.transfer_time > 0.0:
+            time.sleep(self.transfer_time)
+
+    def rgb_frame(self) -> bytes:
+        """Last frame sent, as packed 8-bit RGB triples in pixel order (no brightness bytes)."""
+        return self.frame_rgb(self.last_frame)
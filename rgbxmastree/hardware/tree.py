@@ -3,6 +3,11 @@ from __future__ import annotations
 from gpiozero import SPIDevice, SourceMixin
 from colorzero import Color
 from statistics import mean
+from time import perf_counter
+
+
+# 8-bit channel value -> float, for write_rgb().
+_UNIT = tuple(i / 255.0 for i in range(256))
 
 
 class Pixel:
@@ -55,6 +60,8 @@ class RGBXmasTree(SourceMixin, SPIDevice):
         # depending on kernel SPI configuration / other processes.
         select_pin: int = 26,
         *args,
+        index_map: tuple[tuple[int, ...], ...] | None = None,
+        star_index: int | None = 3,
         **kwargs,
     ):
         super().__init__(
@@ -64,10 +71,12 @@ class RGBXmasTree(SourceMixin, SPIDevice):
             *args,
             **kwargs,
         )
-        if pixels != 25:
-            # The physical mapping for this product is 25 pixels (24 body + 1 star).
-            # We keep this configurable for testing/mocking but discourage other values.
-            pass
+        # The physical mapping for this product is 25 pixels (24 body + 1 star). Other
+        # chains (e.g. an APA102 strip driven by MultiChainTree) pass their own geometry:
+        # `index_map` rows are levels, `star_index` None means no separately dimmed star.
+        if index_map is not None:
+            self._index_map = tuple(tuple(row) for row in index_map)
+        self._star_index = star_index
 
         self._all = [Pixel(parent=self, index=i) for i in range(pixels)]
         self._value: list[tuple[float, float, float]] = [(0.0, 0.0, 0.0)] * pixels
@@ -85,6 +94,20 @@ class RGBXmasTree(SourceMixin, SPIDevice):
         # Batching control (default keeps current immediate update behavior)
         self.auto_show: bool = True
 
+        # Optional render-path instrumentation: an object with
+        # `frame_shown(start: float, end: float)`, called after every transfer with
+        # perf_counter() timestamps, and optionally `frame_ready(frame) -> bool`, called
+        # before it with the SPI bytes, which may veto the transfer. Installed by the
+        # controller (see rgbxmastree.runtime).
+        self.frame_observer = None
+
+        # Copy of the last transferred frame as (sequence number, SPI bytes), for live
+        # previews. Only kept while `capture_shown` is set, so the render path doesn't pay
+        # for it when nobody is watching.
+        self.capture_shown: bool = False
+        self.shown: tuple[int, bytes] | None = None
+        self._shown_seq = 0
+
         # Brightness: keep backwards-compatible float API via `brightness`,
         # but implement two independent APA102 brightness channels (ints 0..31).
         # Defaults: body brightness from the legacy float, and star matches body.
@@ -133,6 +156,14 @@ class RGBXmasTree(SourceMixin, SPIDevice):
     def _pixel_offset(self, index: int) -> int:
         return self._frame_header_len + (index * 4)
 
+    def frame_rgb(self, frame) -> bytes:
+        """Pixel colours of an SPI frame as packed 8-bit RGB triples, in pixel order."""
+        out = bytearray(len(self._all) * 3)
+        for i in range(len(self._all)):
+            s = self._pixel_offset(i)
+            out[i * 3:i * 3 + 3] = (frame[s + 3], frame[s + 2], frame[s + 1])
+        return bytes(out)
+
     def _apply_brightness_bytes(self) -> None:
         """
         Apply current body/star brightness bytes into the SPI frame.
@@ -146,6 +177,21 @@ class RGBXmasTree(SourceMixin, SPIDevice):
 
     def show(self) -> None:
         """Send the current SPI frame down the bus."""
+        observer = self.frame_observer
+        if observer is None:
+            self._transfer()
+        else:
+            ready = getattr(observer, "frame_ready", None)
+            if ready is not None and not ready(self._spi_frame):
+                return
+            start = perf_counter()
+            self._transfer()
+            observer.frame_shown(start, perf_counter())
+        if self.capture_shown:
+            self._shown_seq += 1
+            self.shown = (self._shown_seq, bytes(self._spi_frame))
+
+    def _transfer(self) -> None:
         self._spi.transfer(self._spi_frame)
 
     def _set_pixel_value(self, index: int, rgb: tuple[float, float, float]) -> None:
@@ -161,6 +207,28 @@ class RGBXmasTree(SourceMixin, SPIDevice):
         if self.auto_show:
             self.show()
 
+    def write_rgb(self, first: int, data) -> int:
+        """
+        Copy packed 8-bit RGB triples (any buffer, e.g. a memoryview of a network packet)
+        into pixels `first`, `first + 1`, ... of the SPI frame. Never shows; data beyond
+        the last pixel is ignored. Returns the number of pixels written.
+        """
+        frame = self._spi_frame
+        count = max(0, min(len(data) // 3, len(self._all) - first))
+        if count == 0:
+            return 0
+        # Strided slice copies: each channel lands in every 4th byte of the SPI frame.
+        n = count * 3
+        reds, greens, blues = data[0:n:3], data[1:n:3], data[2:n:3]
+        s = self._pixel_offset(first)
+        end = s + count * 4
+        frame[s + 1:end:4] = blues
+        frame[s + 2:end:4] = greens
+        frame[s + 3:end:4] = reds
+        unit = _UNIT
+        self._value[first:first + count] = [(unit[r], unit[g], unit[b]) for r, g, b in zip(reds, greens, blues)]
+        return count
+
     @property
     def color(self):
         average_r = mean(pixel.color[0] for pixel in self)
@@ -220,10 +288,12 @@ class RGBXmasTree(SourceMixin, SPIDevice):
         (23, 20, 8, 1, 17, 14, 5, 11),  # level 1
         (22, 21, 9, 2, 18, 13, 4, 10),  # level 2
     )
-    _star_index: int = 3
+    _star_index: int | None = 3
 
     @property
     def star(self) -> Pixel:
+        if self._star_index is None:
+            raise AttributeError("this chain has no star")
         return self._all[self._star_index]
 
     # --- brightness controls (two-channel) ---
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import functools
+import os
+import re
+import threading
+from collections import OrderedDict
+from threading import Event
+
+import numpy as np
+
+from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.patterns import Layout
+from rgbxmastree.programs import PROGRAMS
+from rgbxmastree.programs.base import ProgramSpec
+from rgbxmastree.runtime import program_time, sleep
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it no image programs are offered.
+    Image = None
+
+
+# Images and animated GIFs projected onto the tree.
+#
+# The tree is treated as a cylinder with the picture wrapped around it: x runs around the
+# trunk (branch 0 at the left edge) and y from the top level down to the bottom one; the
+# star takes the top row. Each pixel averages a SAMPLES x SAMPLES grid of points over its
+# cell (the star: SAMPLES^2 points along the top row). Where those points fall depends only
+# on the image size and the tree layout, so it is worked out once per (size, layout) as a
+# flat index; projecting a decoded frame is then one gather and a mean. Palette (GIF)
+# frames gather palette indices and look up only the colours they hit.
+#
+# Frames are decoded lazily, in order, as playback reaches them. Projected frames (a few
+# bytes each) are kept in an LRU capped at FRAME_CACHE_BYTES; the decoder (the open file
+# and the one frame it is on) is kept only while the image is playing and not every frame
+# is cached, so a long GIF streams instead of being unpacked into memory. A GIF that fits
+# the cache is decoded once.
+#
+# Every image in the images directory becomes a program, "image_<file stem>".
+IMAGE_EXTENSIONS = (".gif", ".png", ".jpg", ".jpeg", ".webp", ".bmp")
+SAMPLES = 3
+FRAME_CACHE_BYTES = 1 << 20
+# GIF frame times of 10 ms or less are shown for 100 ms, as browsers do.
+DEFAULT_FRAME_MS = 100
+MIN_FRAME_MS = 10
+# How far playback may fall behind the file's timing before it stops catching up.
+MAX_BEHIND_S = 1.0
+STILL_DELAY_S = 0.5
+MAX_IMAGES = 64
+_ID_SAFE_RE = re.compile(r"[^a-z0-9_]+")
+
+
+@functools.lru_cache(maxsize=16)
+def sampling_index(layout: Layout, width: int, height: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (index, lit): flat pixel offsets into a width x height picture, shape (pixels, SAMPLES^2),
+    and a mask of the tree pixels that show the picture (pixels off the body and star stay dark).
+    """
+    k = SAMPLES * SAMPLES
+    index = np.zeros((layout.pixels, k), dtype=np.intp)
+    lit = np.zeros(layout.pixels, dtype=bool)
+    sub = (np.arange(SAMPLES) + 0.5) / SAMPLES
+    levels = len(layout.grid)
+    for level, row in enumerate(layout.grid):
+        branches = len(row)
+        y = ((levels - 1 - level) + sub) / levels * height
+        for branch, i in enumerate(row):
+            x = (branch + sub) / branches * width
+            ys, xs = np.meshgrid(np.minimum(y.astype(np.intp), height - 1), np.minimum(x.astype(np.intp), width - 1))
+            index[i] = (ys * width + xs).ravel()
+            lit[i] = True
+    if layout.star is not None:
+        x = (np.arange(k) + 0.5) / k * width
+        index[layout.star] = np.minimum(x.astype(np.intp), width - 1)
+        lit[layout.star] = True
+    return index, lit
+
+
+def project(frame: "Image.Image", layout: Layout) -> bytes:
+    """One decoded frame to packed RGB for write_rgb()."""
+    index, lit = sampling_index(layout, frame.width, frame.height)
+    if frame.mode == "P":
+        palette = np.zeros((256, 3), dtype=np.float32)
+        raw = np.frombuffer(bytes(frame.getpalette() or ()), dtype=np.uint8).reshape(-1, 3)[:256]
+        palette[: len(raw)] = raw
+        transparent = frame.info.get("transparency")
+        if isinstance(transparent, int):
+            palette[transparent] = 0.0
+        rgb = palette[np.asarray(frame).ravel()[index]]
+    else:
+        if frame.mode not in ("RGB", "RGBA"):
+            frame = frame.convert("RGBA" if "A" in frame.getbands() or "transparency" in frame.info else "RGB")
+        flat = np.asarray(frame).reshape(-1, len(frame.mode))
+        rgb = flat[index].astype(np.float32)
+        if frame.mode == "RGBA":
+            # Transparent areas go dark (the tree has no background to show through).
+            rgb = rgb[..., :3] * (rgb[..., 3:] / 255.0)
+    out = rgb.mean(axis=1)
+    out[~lit] = 0.0
+    return out.astype(np.uint8).tobytes()
+
+
+class ImageSource:
+    """
+    One image file: frames projected on demand, in playback order, through an LRU.
+
+    Decoding is sequential (GIF frames build on the one before), so while playing the file
+    is kept open and seeked forward; going back to an evicted frame rewinds and decodes
+    from the start. Stopping playback closes it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._image = None
+        self._cache: OrderedDict[tuple[Layout, int], tuple[bytes, float]] = OrderedDict()
+        self._cache_bytes = 0
+        with Image.open(path) as im:
+            self.size = im.size
+            self.frames = getattr(im, "n_frames", 1)
+
+    def frame(self, layout: Layout, k: int) -> tuple[bytes, float]:
+        """(packed RGB, seconds to show it) for frame k."""
+        key = (layout, k)
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                return hit
+            if self._image is None:
+                self._image = Image.open(self.path)
+            im = self._image
+            im.seek(k)
+            ms = im.info.get("duration") or 0
+            ms = ms if ms > MIN_FRAME_MS else DEFAULT_FRAME_MS
+            entry = (project(im, layout), ms / 1000.0)
+            self._cache[key] = entry
+            self._cache_bytes += len(entry[0])
+            while self._cache_bytes > FRAME_CACHE_BYTES and len(self._cache) > 1:
+                _, (old, _) = self._cache.popitem(last=False)
+                self._cache_bytes -= len(old)
+            if len(self._cache) == self.frames:
+                # Everything is cached: the decoder (and its picture) can go.
+                self._close_decoder()
+            return entry
+
+    def _close_decoder(self) -> None:
+        if self._image is not None:
+            self._image.close()
+            self._image = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_decoder()
+
+    def __call__(self, tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
+        layout = Layout.of(tree)
+        speed = max(0.01, float(speed))
+        k = 0
+        due = program_time()
+        try:
+            while not stop.is_set():
+                rgb, seconds = self.frame(layout, k)
+                tree.write_rgb(0, rgb)
+                tree.show()
+                if self.frames == 1:
+                    # A still image: nothing to advance, just hold it.
+                    sleep(STILL_DELAY_S)
+                    continue
+                # Frame times follow the file; late frames shorten the next wait instead of drifting.
+                due += seconds / speed
+                now = program_time()
+                if due < now - MAX_BEHIND_S:
+                    due = now
+                sleep(max(0.0, due - now))
+                k = (k + 1) % self.frames
+        finally:
+            # Only projected frames stay cached while the image isn't showing.
+            self.close()
+
+
+def _image_id(filename: str) -> str:
+    stem = os.path.splitext(filename)[0].lower()
+    return "image_" + (_ID_SAFE_RE.sub("_", stem).strip("_") or "unnamed")[:34]
+
+
+class ImageLibrary:
+    """
+    The images directory and their entries in PROGRAMS, scanned once at startup.
+
+    Files that can't be opened (or every file, without Pillow) are listed in `skipped`.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._images: dict[str, tuple[str, ImageSource]] = {}
+        self.skipped: list[dict] = []
+        try:
+            names = sorted(os.listdir(path))
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        names = [n for n in names if n.lower().endswith(IMAGE_EXTENSIONS)]
+        if names and Image is None:
+            self.skipped = [{"file": n, "error": "Pillow is not installed"} for n in names]
+            return
+        for name in names:
+            image_id = _image_id(name)
+            if image_id in PROGRAMS or len(self._images) >= MAX_IMAGES:
+                self.skipped.append({"file": name, "error": "duplicate name or too many images"})
+                continue
+            try:
+                source = ImageSource(os.path.join(path, name))
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                self.skipped.append({"file": name, "error": str(e)})
+                continue
+            self._images[image_id] = (name, source)
+            title = os.path.splitext(name)[0].replace("_", " ").replace("-", " ").strip()
+            PROGRAMS[image_id] = ProgramSpec(id=image_id, name=f"Image: {title}", runner=source)
+
+    def list(self) -> list[dict]:
+        return [
+            {"id": image_id, "file": name, "width": s.size[0], "height": s.size[1], "frames": s.frames}
+            for image_id, (name, s) in self._images.items()
+        ]
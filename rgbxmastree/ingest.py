@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import argparse
+import colorsys
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from threading import Event
+
+from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.metrics import MetricsRegistry
+
+
+# Local frame ingest for co-processes on the same machine.
+#
+# Control: a Unix stream socket speaking newline-delimited JSON. A client sends
+# {"cmd": "hello"} and gets the ring's shared-memory name and geometry back;
+# {"cmd": "stats"} returns counters. An *empty* line means "a new frame is in the ring"
+# (one byte per frame, so the tree picks it up without polling).
+#
+# Frames: a POSIX shared-memory ring. Header, little-endian:
+#
+#   0   magic  b"RGBXRNG1"
+#   8   u32    slots
+#   12  u32    pixels per slot (frames are packed 8-bit RGB, pixels * 3 bytes)
+#   16  u32    write_seq: last complete frame; the producer bumps it *after* filling
+#              slot write_seq % slots
+#   20  u32    read_seq: last frame the tree took
+#
+# followed by the slots. The tree always takes the newest frame (older unread ones are
+# dropped). Backpressure: a producer must not run more than slots - 1 frames ahead of
+# read_seq, so the slot being read is never overwritten.
+RING_MAGIC = b"RGBXRNG1"
+_RING_HEADER = struct.Struct("<8sIIII")
+RING_HEADER_BYTES = 64
+_SEQ = struct.Struct("<I")
+_WRITE_SEQ_OFFSET = 16
+_READ_SEQ_OFFSET = 20
+_SEQ_MOD = 1 << 32
+
+LOCAL_INGEST_PROGRAM_ID = "local_ingest"
+DEFAULT_SLOTS = 4
+DEFAULT_PIXELS = 25
+MAX_CONTROL_LINE = 4096
+
+
+@dataclass
+class IngestOptions:
+    socket_path: str
+    pixels: int = DEFAULT_PIXELS
+    slots: int = DEFAULT_SLOTS
+
+
+class LocalIngest:
+    """
+    Owns the control socket and the frame ring; `run` is a program runner that shows
+    frames from the ring. The controller registers it in PROGRAMS, so it is selected like
+    any other program.
+    """
+
+    def __init__(self, options: IngestOptions, metrics: MetricsRegistry):
+        self.options = options
+        self.slots = max(2, int(options.slots))
+        self.pixels = max(1, int(options.pixels))
+        self.slot_bytes = self.pixels * 3
+        self._shm = shared_memory.SharedMemory(
+            name=f"rgbxmastree_{os.getpid()}",
+            create=True,
+            size=RING_HEADER_BYTES + self.slots * self.slot_bytes,
+        )
+        self._buf = self._shm.buf
+        _RING_HEADER.pack_into(self._buf, 0, RING_MAGIC, self.slots, self.pixels, 0, 0)
+        try:
+            # Let co-processes in the service's group map it (SharedMemory creates it 0600).
+            os.chmod(f"/dev/shm/{self._shm.name}", 0o660)
+        except OSError:
+            pass
+
+        self._frame_ready = Event()
+        self._closed = Event()
+        self._running = False
+        self._clients = 0
+        self._clients_lock = threading.Lock()
+        self._c_frames = metrics.counter("rgbxmastree_ingest_frames_total", "Frames shown from the local ingest ring")
+        self._c_dropped = metrics.counter(
+            "rgbxmastree_ingest_frames_dropped_total", "Ring frames superseded before the tree took them"
+        )
+        self._g_clients = metrics.gauge("rgbxmastree_ingest_clients", "Connected local ingest clients")
+
+        if os.path.exists(options.socket_path):
+            os.unlink(options.socket_path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(options.socket_path)
+        os.chmod(options.socket_path, 0o660)
+        self._server.listen(4)
+        self._accept_thread = threading.Thread(target=self._accept_loop, name="rgbxmastree-ingest", daemon=True)
+        self._accept_thread.start()
+
+    # ----- control socket -----
+
+    def _accept_loop(self) -> None:
+        while not self._closed.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), name="rgbxmastree-ingest-client", daemon=True).start()
+
+    def _serve(self, conn: socket.socket) -> None:
+        with self._clients_lock:
+            self._clients += 1
+            self._g_clients.set(self._clients)
+        try:
+            with conn, conn.makefile("rb") as reader:
+                for line in reader:
+                    if line in (b"\n", b"\r\n"):
+                        self._frame_ready.set()
+                        continue
+                    conn.sendall(json.dumps(self._command(line[:MAX_CONTROL_LINE])).encode("utf-8") + b"\n")
+        except OSError:
+            pass
+        finally:
+            with self._clients_lock:
+                self._clients -= 1
+                self._g_clients.set(self._clients)
+
+    def _command(self, line: bytes) -> dict:
+        try:
+            msg = json.loads(line)
+            cmd = msg.get("cmd")
+        except (ValueError, AttributeError):
+            return {"ok": False, "error": "expected a JSON object"}
+        if cmd == "hello":
+            return {
+                "ok": True,
+                "shm": self._shm.name,
+                "slots": self.slots,
+                "pixels": self.pixels,
+                "header_bytes": RING_HEADER_BYTES,
+            }
+        if cmd == "stats":
+            return {
+                "ok": True,
+                "selected": self._running,
+                "frames_shown": int(self._c_frames.value),
+                "frames_dropped": int(self._c_dropped.value),
+            }
+        return {"ok": False, "error": f"unknown cmd {cmd!r}"}
+
+    # ----- program runner -----
+
+    def run(self, tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
+        """Show the newest frame from the ring whenever a client signals one. `speed` is unused."""
+        buf = self._buf
+        read_seq = _SEQ.unpack_from(buf, _WRITE_SEQ_OFFSET)[0]
+        _SEQ.pack_into(buf, _READ_SEQ_OFFSET, read_seq)
+        prev_auto = tree.auto_show
+        tree.auto_show = False
+        self._running = True
+        try:
+            while not stop.is_set():
+                self._frame_ready.wait(0.1)
+                self._frame_ready.clear()
+                seq = _SEQ.unpack_from(buf, _WRITE_SEQ_OFFSET)[0]
+                if seq == read_seq:
+                    continue
+                skipped = (seq - read_seq - 1) % _SEQ_MOD
+                if skipped:
+                    self._c_dropped.inc(skipped)
+                start = RING_HEADER_BYTES + (seq % self.slots) * self.slot_bytes
+                tree.write_rgb(0, buf[start:start + self.slot_bytes])
+                read_seq = seq
+                _SEQ.pack_into(buf, _READ_SEQ_OFFSET, read_seq)
+                tree.show()
+                self._c_frames.inc()
+        finally:
+            tree.auto_show = prev_auto
+            self._running = False
+
+    def close(self) -> None:
+        self._closed.set()
+        try:
+            self._server.close()
+            os.unlink(self.options.socket_path)
+        except OSError:
+            pass
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+class IngestClient:
+    """Producer side, for co-processes: `write(rgb)` puts a frame in the ring and signals it."""
+
+    def __init__(self, socket_path: str):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+        self._reader = self._sock.makefile("rb")
+        info = self.request({"cmd": "hello"})
+        self.slots = int(info["slots"])
+        self.pixels = int(info["pixels"])
+        self.slot_bytes = self.pixels * 3
+        self._shm = shared_memory.SharedMemory(name=info["shm"])
+        try:
+            # Python < 3.13 would otherwise unlink the segment when this process exits.
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        except Exception:
+            pass
+        self._buf = self._shm.buf
+        self._seq = _SEQ.unpack_from(self._buf, _WRITE_SEQ_OFFSET)[0]
+
+    def request(self, msg: dict) -> dict:
+        self._sock.sendall(json.dumps(msg).encode("utf-8") + b"\n")
+        return json.loads(self._reader.readline())
+
+    def try_write(self, rgb: bytes) -> bool:
+        """Write one frame (packed RGB, truncated/zero-padded to the ring's pixels); False if the ring is full."""
+        read_seq = _SEQ.unpack_from(self._buf, _READ_SEQ_OFFSET)[0]
+        if (self._seq - read_seq) % _SEQ_MOD >= self.slots - 1:
+            return False
+        seq = (self._seq + 1) % _SEQ_MOD
+        start = RING_HEADER_BYTES + (seq % self.slots) * self.slot_bytes
+        data = bytes(rgb[:self.slot_bytes]).ljust(self.slot_bytes, b"\x00")
+        self._buf[start:start + self.slot_bytes] = data
+        _SEQ.pack_into(self._buf, _WRITE_SEQ_OFFSET, seq)
+        self._seq = seq
+        self._sock.sendall(b"\n")
+        return True
+
+    def write(self, rgb: bytes, timeout: float | None = None) -> bool:
+        """Like try_write, but wait (up to `timeout`) for the tree to catch up when the ring is full."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_write(rgb):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def close(self) -> None:
+        self._buf = None
+        self._shm.close()
+        self._reader.close()
+        self._sock.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m rgbxmastree.ingest",
+        description="Push a rainbow through the local ingest ring (select 'Local Co-process' in the UI).",
+    )
+    parser.add_argument("--socket", required=True, help="Control socket path (the server's --ingest-socket)")
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    client = IngestClient(args.socket)
+    interval = 1.0 / max(0.1, args.fps)
+    deadline = time.monotonic() + args.seconds
+    frames = full = 0
+    while time.monotonic() < deadline:
+        rgb = bytearray()
+        for i in range(client.pixels):
+            r, g, b = colorsys.hsv_to_rgb((i / client.pixels + frames * 0.01) % 1.0, 1.0, 1.0)
+            rgb += bytes((int(r * 255), int(g * 255), int(b * 255)))
+        if client.try_write(bytes(rgb)):
+            frames += 1
+        else:
+            full += 1
+        time.sleep(interval)
+    stats = client.request({"cmd": "stats"})
+    client.close()
+    print(f"wrote {frames} frames ({full} times the ring was full); server: {stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
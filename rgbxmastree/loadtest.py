@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from rgbxmastree.metrics import percentile
+
+
+# (weight, method, path, body factory). Mirrors what a few phones do: mostly polling,
+# occasional knob twiddling. Program/speed POSTs re-send the current values so they still
+# exercise validation, the config write and the supervisor, but don't restart the runner
+# (which would make the loaded frame rate incomparable with the idle one).
+def _request_mix(program_id: str, speed: float) -> list[tuple[int, str, str, object]]:
+    return [
+        (70, "GET", "/api/state", None),
+        (8, "POST", "/api/brightness", lambda rng: {"body_pct": rng.randint(10, 90)}),
+        (8, "POST", "/api/speed", lambda rng: {"program_speed": speed}),
+        (5, "POST", "/api/program", lambda rng: {"program_id": program_id, "program_speed": speed}),
+        (5, "GET", "/api/metrics", None),
+        (4, "GET", "/health", None),
+    ]
+
+
+def _frames(conn: http.client.HTTPConnection, program_id: str) -> float:
+    conn.request("GET", "/api/metrics", headers={"Accept": "application/json"})
+    resp = conn.getresponse()
+    data = json.loads(resp.read() or b"{}")
+    for series in data.get("rgbxmastree_frames_total", {}).get("series", []):
+        if series["labels"].get("program") == program_id:
+            return series["value"]
+    return 0.0
+
+
+class _Client(threading.Thread):
+    """One simulated phone: a keep-alive connection issuing a weighted mix of requests."""
+
+    def __init__(self, host: str, port: int, mix, deadline: float, think_s: float, seed: int):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.mix = mix
+        self.deadline = deadline
+        self.think_s = think_s
+        self.rng = random.Random(seed)
+        self.latencies: dict[str, list[float]] = {}
+        self.errors = 0
+
+    def _pick(self):
+        total = sum(w for w, *_ in self.mix)
+        r = self.rng.uniform(0, total)
+        for w, method, path, body in self.mix:
+            r -= w
+            if r <= 0:
+                return method, path, body
+        return self.mix[-1][1:]
+
+    def run(self) -> None:
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        while time.monotonic() < self.deadline:
+            method, path, body = self._pick()
+            payload = json.dumps(body(self.rng)).encode() if body else None
+            headers = {"Accept": "application/json"}
+            if payload is not None:
+                headers["Content-Type"] = "application/json"
+            t0 = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                ok = resp.status < 500
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+            dt = time.perf_counter() - t0
+            if ok:
+                self.latencies.setdefault(f"{method} {path}", []).append(dt)
+            else:
+                self.errors += 1
+            if self.think_s > 0:
+                time.sleep(self.rng.uniform(0.5, 1.5) * self.think_s)
+        conn.close()
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_local_server(program_id: str, speed: float, transfer_time: float, threads: int):
+    """Start create_app on a simulated tree behind waitress in this process."""
+    from waitress.server import create_server
+
+    from rgbxmastree.hardware.simulated import SimulatedXmasTree
+    from rgbxmastree.web.app import create_app
+
+    config_dir = tempfile.mkdtemp(prefix="rgbxmastree_loadtest_")
+    app = create_app(
+        config_path=os.path.join(config_dir, "config.json"),
+        tree_factory=lambda: SimulatedXmasTree(transfer_time=transfer_time),
+        threads=threads,
+    )
+    controller = app.extensions["rgbxmastree_controller"]
+
+    def _mut(c):
+        c.mode = "manual_on"
+        c.program_id = program_id
+        c.program_speed = speed
+
+    controller.update_config(_mut)
+    server = create_server(app, host="127.0.0.1", port=_free_port(), threads=threads)
+    t = threading.Thread(target=server.run, name="rgbxmastree-loadtest-server", daemon=True)
+    t.start()
+    return server, controller
+
+
+def _measure_frame_rate(host: str, port: int, program_id: str, seconds: float) -> float | None:
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        f0 = _frames(conn, program_id)
+        t0 = time.perf_counter()
+        time.sleep(seconds)
+        f1 = _frames(conn, program_id)
+        dt = time.perf_counter() - t0
+    finally:
+        conn.close()
+    return (f1 - f0) / dt if dt > 0 else None
+
+
+def run_load(
+    host: str,
+    port: int,
+    clients: int,
+    duration_s: float,
+    think_s: float,
+    program_id: str,
+    speed: float,
+    warmup_s: float,
+    seed: int,
+    mutate: bool = True,
+) -> dict:
+    mix = _request_mix(program_id, speed)
+    if not mutate:
+        mix = [m for m in mix if m[1] == "GET"]
+
+    # Idle frame rate first, with no API traffic at all.
+    time.sleep(warmup_s)
+    idle_fps = _measure_frame_rate(host, port, program_id, min(5.0, max(1.0, duration_s / 4)))
+
+    deadline = time.monotonic() + duration_s
+    workers = [_Client(host, port, mix, deadline, think_s, seed + i) for i in range(clients)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+
+    # Frame rate under load: frame counter delta across the whole run.
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    before = _frames(conn, program_id)
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    after = _frames(conn, program_id)
+    conn.close()
+    loaded_fps = (after - before) / elapsed if elapsed > 0 else None
+
+    per_endpoint: dict[str, list[float]] = {}
+    errors = 0
+    for w in workers:
+        errors += w.errors
+        for k, v in w.latencies.items():
+            per_endpoint.setdefault(k, []).extend(v)
+    all_lat = [x for v in per_endpoint.values() for x in v]
+
+    def _summary(values: list[float]) -> dict:
+        return {
+            "count": len(values),
+            "p50_ms": (percentile(values, 0.50) or 0.0) * 1000.0,
+            "p95_ms": (percentile(values, 0.95) or 0.0) * 1000.0,
+            "p99_ms": (percentile(values, 0.99) or 0.0) * 1000.0,
+            "max_ms": (max(values) if values else 0.0) * 1000.0,
+        }
+
+    return {
+        "clients": clients,
+        "duration_s": elapsed,
+        "requests": len(all_lat),
+        "errors": errors,
+        "throughput_rps": len(all_lat) / elapsed if elapsed > 0 else 0.0,
+        "latency": _summary(all_lat),
+        "endpoints": {k: _summary(v) for k, v in sorted(per_endpoint.items())},
+        "frame_rate": {
+            "idle_fps": idle_fps,
+            "loaded_fps": loaded_fps,
+            "degradation_pct": (
+                (1.0 - loaded_fps / idle_fps) * 100.0 if idle_fps and loaded_fps is not None else None
+            ),
+        },
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m rgbxmastree.loadtest",
+        description="Drive the web API with concurrent clients while a program renders.",
+    )
+    parser.add_argument("--url", help="Target an already running server (default: start one on a simulated tree)")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent keep-alive clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load")
+    parser.add_argument("--think-ms", type=float, default=200.0, help="Mean pause between a client's requests")
+    parser.add_argument("--program", default="candles", help="Program rendering during the test")
+    parser.add_argument("--speed", type=float, default=200.0)
+    parser.add_argument("--transfer-ms", type=float, default=1.0, help="Emulated SPI time (local server only)")
+    parser.add_argument("--threads", type=int, default=4, help="Waitress worker threads (local server only)")
+    parser.add_argument("--read-only", action="store_true", help="Only issue GETs (keeps the program fixed)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Write the report JSON here")
+    args = parser.parse_args(argv)
+
+    controller = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname or "127.0.0.1", parts.port or 80
+    else:
+        server, controller = _start_local_server(
+            args.program, args.speed, max(0.0, args.transfer_ms) / 1000.0, args.threads
+        )
+        host, port = "127.0.0.1", server.effective_port
+
+    try:
+        report = run_load(
+            host,
+            port,
+            clients=max(1, args.clients),
+            duration_s=max(1.0, args.duration),
+            think_s=max(0.0, args.think_ms) / 1000.0,
+            program_id=args.program,
+            speed=args.speed,
+            warmup_s=1.0,
+            seed=args.seed,
+            mutate=not args.read_only,
+        )
+    finally:
+        # The local waitress server runs on a daemon thread and goes away with the process.
+        if controller is not None:
+            controller.close()
+
+    lat = report["latency"]
+    fr = report["frame_rate"]
+    print(f"{report['requests']} requests from {report['clients']} clients in {report['duration_s']:.1f}s "
+          f"({report['throughput_rps']:.1f} req/s, {report['errors']} errors)")
+    print(f"latency p50 {lat['p50_ms']:.1f}ms  p95 {lat['p95_ms']:.1f}ms  p99 {lat['p99_ms']:.1f}ms  "
+          f"max {lat['max_ms']:.1f}ms")
+    for k, v in report["endpoints"].items():
+        print(f"  {k:<24} n={v['count']:<6} p50 {v['p50_ms']:7.1f}ms  p95 {v['p95_ms']:7.1f}ms  "
+              f"p99 {v['p99_ms']:7.1f}ms")
+    if fr["idle_fps"] is not None and fr["loaded_fps"] is not None:
+        deg = fr["degradation_pct"]
+        print(f"tree frame rate: idle {fr['idle_fps']:.1f} fps, under load {fr['loaded_fps']:.1f} fps"
+              + (f" ({deg:.1f}% slower)" if deg is not None else ""))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import gc
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from rgbxmastree.metrics import MetricsRegistry
+
+
+# Low-jitter mode: keep the program runner (the thread that renders and sends frames) off
+# the scheduler's and the garbage collector's critical path.
+#
+# - The runner is pinned to one core and asks for SCHED_FIFO, falling back to a negative
+#   nice value, and to nothing, when the process isn't allowed (needs CAP_SYS_NICE / root).
+# - Everything allocated during startup (Flask, routes, programs, config) is moved out of
+#   the collector's reach with gc.freeze(), so full collections only walk what came later.
+# - Automatic generation-2 collections are held back; the runner runs them itself in the
+#   idle gap before a frame when the gap is long enough, and the supervisor runs them when
+#   no program is rendering. One that is very overdue runs anyway.
+DEFAULT_FIFO_PRIORITY = 10
+FALLBACK_NICE = -10
+# Automatic gen-2 threshold while deferred, as a multiple of the normal one.
+GEN2_DEFER_FACTOR = 1000
+# Shortest idle gap a deferred full collection may use (it also needs twice what the last
+# one took), and how overdue (as a multiple of the normal threshold) one may get before it
+# runs regardless.
+MIN_GC_GAP_S = 0.002
+GEN2_FORCE_FACTOR = 20
+# How long without an idle() call before the supervisor takes over collecting.
+IDLE_HANDOVER_S = 1.0
+
+
+@dataclass
+class LowJitterOptions:
+    # Core to pin the runner to; None picks the last one this process may use.
+    cpu: int | None = None
+    # SCHED_FIFO priority to request (1-99); 0 skips straight to the nice fallback.
+    fifo_priority: int = DEFAULT_FIFO_PRIORITY
+
+
+class LowJitter:
+    def __init__(self, options: LowJitterOptions, metrics: MetricsRegistry | None = None):
+        self.options = options
+        self._gen2_threshold: int | None = None
+        self._saved_threshold: tuple[int, int, int] | None = None
+        self._last_idle = 0.0
+        self._last_cost = 0.0
+        self._status = {"cpu": None, "scheduler": None, "frozen_objects": 0, "gc_deferred": False}
+        self._metrics_on = metrics is not None
+        if metrics is not None:
+            self._c_collections = {
+                where: metrics.counter(
+                    "rgbxmastree_gc_deferred_collections_total", "Deferred full collections run", where=where
+                )
+                for where in ("idle", "forced", "supervisor")
+            }
+            self._h_collect = metrics.histogram(
+                "rgbxmastree_gc_deferred_collection_seconds", "Time spent in deferred full collections"
+            )
+
+    # ----- process-wide (GC) -----
+
+    def start(self) -> None:
+        """Call once startup is done: freeze what exists and defer automatic gen-2 collections."""
+        if self._saved_threshold is not None:
+            return
+        gc.collect()
+        gc.freeze()
+        self._status["frozen_objects"] = gc.get_freeze_count()
+        t0, t1, t2 = gc.get_threshold()
+        self._saved_threshold = (t0, t1, t2)
+        self._gen2_threshold = max(1, t2)
+        gc.set_threshold(t0, t1, max(1, t2) * GEN2_DEFER_FACTOR)
+        self._status["gc_deferred"] = True
+
+    def close(self) -> None:
+        if self._saved_threshold is not None:
+            gc.set_threshold(*self._saved_threshold)
+            self._saved_threshold = None
+            self._gen2_threshold = None
+            self._status["gc_deferred"] = False
+
+    def _collect(self, where: str) -> None:
+        start = time.perf_counter()
+        gc.collect(2)
+        self._last_cost = time.perf_counter() - start
+        if self._metrics_on:
+            self._h_collect.observe(self._last_cost)
+            self._c_collections[where].inc()
+
+    def idle(self, gap_s: float) -> None:
+        """Called by the runner (RenderContext) before it sleeps for `gap_s` seconds."""
+        t2 = self._gen2_threshold
+        if t2 is None:
+            return
+        self._last_idle = time.monotonic()
+        # Generation 1 collections since the last full one: what the gen-2 threshold counts.
+        pending = gc.get_count()[2]
+        if pending < t2:
+            return
+        if gap_s >= max(MIN_GC_GAP_S, 2.0 * self._last_cost):
+            self._collect("idle")
+        elif pending >= t2 * GEN2_FORCE_FACTOR:
+            self._collect("forced")
+
+    def maintenance(self) -> None:
+        """Supervisor tick: collect on the runner's behalf while nothing is rendering."""
+        t2 = self._gen2_threshold
+        if t2 is None or time.monotonic() - self._last_idle < IDLE_HANDOVER_S:
+            return
+        if gc.get_count()[2] >= t2:
+            self._collect("supervisor")
+
+    # ----- per-thread (scheduling) -----
+
+    def enter_render_thread(self) -> None:
+        """Pin and prioritise the calling thread. Never raises; status() says what stuck."""
+        tid = threading.get_native_id()
+        cpu = None
+        try:
+            allowed = sorted(os.sched_getaffinity(0))
+            if len(allowed) > 1:
+                cpu = self.options.cpu if self.options.cpu is not None else allowed[-1]
+                os.sched_setaffinity(tid, {cpu})
+        except (AttributeError, OSError, ValueError):
+            cpu = None
+        self._status["cpu"] = cpu
+
+        scheduler = "default"
+        priority = self.options.fifo_priority
+        try:
+            if priority > 0:
+                os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(priority))
+                scheduler = f"fifo:{priority}"
+        except (AttributeError, OSError):
+            pass
+        if scheduler == "default":
+            try:
+                os.setpriority(os.PRIO_PROCESS, tid, FALLBACK_NICE)
+                scheduler = f"nice:{FALLBACK_NICE}"
+            except (AttributeError, OSError):
+                pass
+        self._status["scheduler"] = scheduler
+
+    def status(self) -> dict:
+        return dict(self._status)
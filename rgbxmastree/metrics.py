@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Iterable
+
+
+# Default latency buckets (seconds). Spans sub-millisecond SPI transfers up to multi-second stalls.
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+def _fmt_float(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if v == -math.inf:
+        return "-Inf"
+    return repr(float(v))
+
+
+def _fmt_labels(labels: tuple[tuple[str, str], ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    parts = []
+    for k, v in items:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, n: float = 1.0) -> None:
+        with self._lock:
+            self._value += n
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> dict:
+        return {"value": self._value}
+
+
+class Gauge:
+    def __init__(self) -> None:
+        self._value = 0.0
+
+    def set(self, v: float) -> None:
+        # Single float store: atomic under the GIL, no lock needed.
+        self._value = float(v)
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> dict:
+        return {"value": self._value}
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. observe() is O(log buckets) and allocation-free, so it is
+    cheap enough to call several times per frame on the render thread.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self._bounds: tuple[float, ...] = tuple(sorted(float(b) for b in buckets))
+        self._lock = threading.Lock()
+        # One slot per bound plus the +Inf overflow slot (non-cumulative).
+        self._counts: list[int] = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, v: float) -> None:
+        i = bisect_left(self._bounds, v)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += v
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Estimate a quantile by linear interpolation inside the matching bucket.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        return _bucket_quantile(self._bounds, counts, total, q)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            s = self._sum
+        cumulative = []
+        running = 0
+        for bound, c in zip(self._bounds + (math.inf,), counts):
+            running += c
+            cumulative.append([_fmt_float(bound), running])
+        return {
+            "count": total,
+            "sum": s,
+            "mean": (s / total) if total else None,
+            "p50": _bucket_quantile(self._bounds, counts, total, 0.50),
+            "p95": _bucket_quantile(self._bounds, counts, total, 0.95),
+            "p99": _bucket_quantile(self._bounds, counts, total, 0.99),
+            "buckets": cumulative,
+        }
+
+
+def _bucket_quantile(bounds: tuple[float, ...], counts: list[int], total: int, q: float) -> float | None:
+    if total <= 0:
+        return None
+    rank = q * total
+    running = 0
+    lower = 0.0
+    for i, c in enumerate(counts):
+        if running + c >= rank and c > 0:
+            if i >= len(bounds):
+                # Overflow bucket has no upper bound; report the largest finite bound.
+                return bounds[-1] if bounds else None
+            upper = bounds[i]
+            frac = (rank - running) / c
+            return lower + (upper - lower) * frac
+        running += c
+        if i < len(bounds):
+            lower = bounds[i]
+    return bounds[-1] if bounds else None
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank quantile of raw samples (benchmarks and load tests keep every sample)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class MetricsRegistry:
+    """
+    Tiny in-process metrics registry with JSON and Prometheus text exposition.
+
+    Metrics are identified by (name, labels). Lookups are cached, so hot paths should
+    fetch their metric objects once and keep references rather than calling
+    histogram()/counter()/gauge() per event.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # name -> (type, help, {labels_tuple: metric})
+        self._families: dict[str, tuple[str, str, dict[tuple[tuple[str, str], ...], object]]] = {}
+
+    def _get(self, kind: str, name: str, help: str, labels: dict[str, str], factory):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            fam = self._families.get(name)
+            if fam is None:
+                fam = (kind, help, {})
+                self._families[name] = fam
+            elif fam[0] != kind:
+                raise ValueError(f"metric {name} already registered as {fam[0]}")
+            series = fam[2]
+            m = series.get(key)
+            if m is None:
+                m = factory()
+                series[key] = m
+            return m
+
+    def counter(self, name: str, help: str = "", **labels: str) -> Counter:
+        return self._get("counter", name, help, labels, Counter)
+
+    def gauge(self, name: str, help: str = "", **labels: str) -> Gauge:
+        return self._get("gauge", name, help, labels, Gauge)
+
+    def histogram(
+        self,
+        name: str,
+        help: str = "",
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+        **labels: str,
+    ) -> Histogram:
+        return self._get("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    def _families_copy(self):
+        with self._lock:
+            return [(name, kind, help, list(series.items())) for name, (kind, help, series) in self._families.items()]
+
+    def to_json(self) -> dict:
+        out: dict[str, dict] = {}
+        for name, kind, help, series in self._families_copy():
+            out[name] = {
+                "type": kind,
+                "help": help,
+                "series": [dict(labels=dict(labels), **m.snapshot()) for labels, m in series],
+            }
+        return out
+
+    def to_prometheus(self) -> str:
+        lines: list[str] = []
+        for name, kind, help, series in self._families_copy():
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, m in series:
+                if isinstance(m, Histogram):
+                    snap = m.snapshot()
+                    for le, c in snap["buckets"]:
+                        lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', le),))} {c}")
+                    lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_float(snap['sum'])}")
+                    lines.append(f"{name}_count{_fmt_labels(labels)} {snap['count']}")
+                else:
+                    lines.append(f"{name}{_fmt_labels(labels)} {_fmt_float(m.value)}")
+        return "\n".join(lines) + "\n"
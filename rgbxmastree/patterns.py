@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import zlib
+from dataclasses import dataclass
+from threading import Event
+
+from colorzero import Color
+
+from rgbxmastree.audio import AUDIO_PROGRAM_ID
+from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.ingest import LOCAL_INGEST_PROGRAM_ID
+from rgbxmastree.programs import BUILTIN_PROGRAM_IDS, PROGRAMS
+from rgbxmastree.programs.base import ProgramSpec
+from rgbxmastree.runtime import program_time, sleep
+
+
+# User-authored patterns: a small declarative format, posted through the web API, that is
+# validated and compiled into a table-driven program registered in PROGRAMS at runtime.
+#
+#   {
+#     "id": "peppermint",                  # program id: a-z, 0-9 and _, up to 40
+#     "name": "Peppermint",
+#     "palette": ["red", "white"],         # 1-16 colours: names or "#rrggbb"
+#     "blend": "step",                     # "smooth" (default) or "step" between colours
+#     "motion": "scroll",                  # static | scroll | pulse | twinkle
+#     "mapping": "spiral",                 # what the palette is laid along (see MAPPINGS)
+#     "spread": 1.0,                       # palette repeats across the mapping
+#     "timing": {"period_s": 2.0, "fps": 30},
+#     "floor": 0.1,                        # pulse/twinkle: dimmest level, 0..1
+#     "star": "gold",                      # optional fixed star colour
+#     "default_speed": 1.0
+#   }
+#
+# Every motion is periodic, so compiling renders one period as packed RGB frames per tree
+# layout; the runner then only picks the frame for the current time and hands it to
+# write_rgb(). Speed divides the period.
+MOTIONS = ("static", "scroll", "pulse", "twinkle")
+# height: bottom to top; angle: around the trunk; spiral: diagonally around and up (like
+# candy_cane); index: chain order; uniform: every pixel alike; random: a fixed scatter.
+MAPPINGS = ("height", "angle", "spiral", "index", "uniform", "random")
+PATTERN_ID_RE = re.compile(r"^[a-z0-9_]{1,40}$")
+MAX_PALETTE = 16
+MAX_PATTERNS = 64
+MAX_FRAMES = 3600
+# Cap on one layout's frame table; long periods get fewer, coarser frames instead.
+MAX_TABLE_BYTES = 1 << 20
+_LUT_SIZE = 256
+
+
+@dataclass(frozen=True)
+class PatternSpec:
+    id: str
+    name: str
+    palette: tuple[tuple[float, float, float], ...]
+    blend: str = "smooth"
+    motion: str = "scroll"
+    mapping: str = "height"
+    spread: float = 1.0
+    period_s: float = 4.0
+    fps: float = 30.0
+    floor: float = 0.1
+    star: tuple[float, float, float] | None = None
+    default_speed: float = 1.0
+    source: str = "{}"  # the pattern as posted (normalised JSON), for listing and saving
+
+
+def _number(raw: dict, key: str, default: float, lo: float, hi: float) -> float:
+    value = raw.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{key} must be a number")
+    if not lo <= value <= hi:
+        raise ValueError(f"{key} must be between {lo} and {hi}")
+    return float(value)
+
+
+def _colour(value, what: str) -> tuple[float, float, float]:
+    if not isinstance(value, str):
+        raise ValueError(f"{what} must be a colour name or #rrggbb")
+    try:
+        c = Color(value)
+    except ValueError:
+        raise ValueError(f"{what}: unknown colour {value!r}") from None
+    return (c.red, c.green, c.blue)
+
+
+def parse_pattern(raw: object, reserved: frozenset[str] = frozenset()) -> PatternSpec:
+    """Validate a pattern definition. Raises ValueError saying what is wrong."""
+    if not isinstance(raw, dict):
+        raise ValueError("pattern must be a JSON object")
+    pid = raw.get("id")
+    if not isinstance(pid, str) or not PATTERN_ID_RE.match(pid):
+        raise ValueError("id must be 1-40 characters of a-z, 0-9 and _")
+    if pid in reserved:
+        raise ValueError(f"id {pid!r} is taken by a built-in program")
+    name = raw.get("name", pid)
+    if not isinstance(name, str) or not 1 <= len(name) <= 60:
+        raise ValueError("name must be 1-60 characters")
+    palette = raw.get("palette")
+    if not isinstance(palette, list) or not 1 <= len(palette) <= MAX_PALETTE:
+        raise ValueError(f"palette must be a list of 1-{MAX_PALETTE} colours")
+    colours = tuple(_colour(c, f"palette[{i}]") for i, c in enumerate(palette))
+    for key, allowed in (("blend", ("smooth", "step")), ("motion", MOTIONS), ("mapping", MAPPINGS)):
+        if key in raw and raw[key] not in allowed:
+            raise ValueError(f"{key} must be one of: {', '.join(allowed)}")
+    timing = raw.get("timing", {})
+    if not isinstance(timing, dict):
+        raise ValueError("timing must be an object")
+    star = raw.get("star")
+    spec = PatternSpec(
+        id=pid,
+        name=name,
+        palette=colours,
+        blend=raw.get("blend", "smooth"),
+        motion=raw.get("motion", "scroll"),
+        mapping=raw.get("mapping", "height"),
+        spread=_number(raw, "spread", 1.0, 0.0, 16.0),
+        period_s=_number(timing, "period_s", 4.0, 0.1, 600.0),
+        fps=_number(timing, "fps", 30.0, 1.0, 60.0),
+        floor=_number(raw, "floor", 0.1, 0.0, 1.0),
+        star=_colour(star, "star") if star is not None else None,
+        default_speed=_number(raw, "default_speed", 1.0, 0.1, 200.0),
+        source=json.dumps(raw, sort_keys=True),
+    )
+    return spec
+
+
+# ----- compilation -----
+
+
+def _palette_lut(spec: PatternSpec) -> list[tuple[float, float, float]]:
+    """The palette sampled at _LUT_SIZE points around one cycle."""
+    pal = spec.palette
+    n = len(pal)
+    lut = []
+    for k in range(_LUT_SIZE):
+        x = k / _LUT_SIZE * n
+        i = int(x)
+        if spec.blend == "step" or n == 1:
+            lut.append(pal[i % n])
+            continue
+        f = x - i
+        a, b = pal[i % n], pal[(i + 1) % n]
+        lut.append((a[0] + (b[0] - a[0]) * f, a[1] + (b[1] - a[1]) * f, a[2] + (b[2] - a[2]) * f))
+    return lut
+
+
+@dataclass(frozen=True)
+class Layout:
+    """What compiling needs to know about a tree: its size, body grid and star."""
+
+    pixels: int
+    grid: tuple[tuple[int, ...], ...]  # pixel index per [level][branch]
+    star: int | None
+
+    @classmethod
+    def of(cls, tree: RGBXmasTree) -> "Layout":
+        grid = tuple(tuple(tree[level, branch].index for branch in range(8)) for level in range(3))
+        try:
+            star = tree.star.index
+        except AttributeError:
+            star = None
+        return cls(len(tree), grid, star)
+
+
+# The 3D Xmas Tree on its own; patterns are compiled for it as they are posted.
+STANDARD_LAYOUT = Layout(25, RGBXmasTree._index_map, RGBXmasTree._star_index)
+
+
+def _coordinates(layout: Layout, mapping: str, seed: int) -> list[float]:
+    """Per-pixel position in [0, 1] along the mapping. Pixels off the 3x8 body use their index."""
+    n = layout.pixels
+    coords = [i / n for i in range(n)]
+    if mapping == "index":
+        return coords
+    if mapping == "uniform":
+        return [0.0] * n
+    if mapping == "random":
+        rng = random.Random(seed)
+        return [rng.random() for _ in range(n)]
+    for level, row in enumerate(layout.grid):
+        for branch, i in enumerate(row):
+            if mapping == "height":
+                coords[i] = level / 3
+            elif mapping == "angle":
+                coords[i] = branch / 8
+            else:  # spiral
+                coords[i] = ((branch + level) % 8) / 8
+    if layout.star is not None:
+        coords[layout.star] = 1.0 if mapping == "height" else 0.0
+    return coords
+
+
+def _envelope(spec: PatternSpec, phase: float) -> float:
+    """Brightness over one period for pulse (smooth) and twinkle (short sparkle)."""
+    wave = 0.5 - 0.5 * math.cos(2.0 * math.pi * phase)
+    if spec.motion == "twinkle":
+        wave = wave ** 6
+    return spec.floor + (1.0 - spec.floor) * wave
+
+
+def _byte(x: float) -> int:
+    # Same rounding as RGBXmasTree._clamp_byte.
+    return 0 if x <= 0.0 else 255 if x >= 1.0 else int(255 * x)
+
+
+def compile_frames(spec: PatternSpec, layout: Layout) -> list[bytes]:
+    """One period of the pattern on `layout`, as packed RGB frames for write_rgb()."""
+    n = layout.pixels
+    # Seeded from the id, so "random" scatter and twinkle timing are stable across restarts.
+    seed = zlib.crc32(spec.id.encode("utf-8"))
+    coords = _coordinates(layout, spec.mapping, seed)
+    lut = _palette_lut(spec)
+    offsets: list[float] = []
+    if spec.motion == "twinkle":
+        rng = random.Random(seed + 1)
+        offsets = [rng.random() for _ in range(n)]
+    star = layout.star if spec.star is not None else None
+
+    if spec.motion == "static":
+        count = 1
+    else:
+        count = max(1, min(MAX_FRAMES, round(spec.period_s * spec.fps), MAX_TABLE_BYTES // (n * 3)))
+    base = [lut[int((u * spec.spread) % 1.0 * _LUT_SIZE) % _LUT_SIZE] for u in coords]
+    frames = []
+    for k in range(count):
+        phase = k / count
+        out = bytearray(n * 3)
+        for i in range(n):
+            if spec.motion == "scroll":
+                r, g, b = lut[int((coords[i] * spec.spread + phase) % 1.0 * _LUT_SIZE) % _LUT_SIZE]
+            else:
+                r, g, b = base[i]
+                if spec.motion == "pulse":
+                    level = _envelope(spec, phase)
+                    r, g, b = r * level, g * level, b * level
+                elif spec.motion == "twinkle":
+                    level = _envelope(spec, (phase + offsets[i]) % 1.0)
+                    r, g, b = r * level, g * level, b * level
+            if i == star:
+                r, g, b = spec.star
+            out[i * 3:i * 3 + 3] = (_byte(r), _byte(g), _byte(b))
+        frames.append(bytes(out))
+    return frames
+
+
+class CompiledPattern:
+    """The runner for one pattern: frame tables per tree layout, built on first use."""
+
+    def __init__(self, spec: PatternSpec):
+        self.spec = spec
+        self._tables: dict[Layout, list[bytes]] = {}
+        self._lock = threading.Lock()
+
+    def frames_for(self, layout: Layout) -> list[bytes]:
+        with self._lock:
+            frames = self._tables.get(layout)
+            if frames is None:
+                frames = self._tables[layout] = compile_frames(self.spec, layout)
+        return frames
+
+    def __call__(self, tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
+        frames = self.frames_for(Layout.of(tree))
+        count = len(frames)
+        # Frames per second of program time: one period is `count` frames, sped up by `speed`.
+        rate = count * max(0.001, float(speed)) / self.spec.period_s
+        delay = 1.0 / self.spec.fps
+        t0 = program_time()
+        last = -1
+        while not stop.is_set():
+            k = int((program_time() - t0) * rate) % count
+            if k != last:
+                tree.write_rgb(0, frames[k])
+                tree.show()
+                last = k
+            sleep(delay)
+
+
+def pattern_program(spec: PatternSpec) -> ProgramSpec:
+    return ProgramSpec(id=spec.id, name=spec.name, runner=CompiledPattern(spec), default_speed=spec.default_speed)
+
+
+class PatternLibrary:
+    """
+    The saved patterns (a JSON file next to the config) and their entries in PROGRAMS.
+
+    File: {"patterns": [<pattern>, ...]}. Patterns that no longer validate are skipped on load.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        # Built-in (and other non-pattern) programs can't be shadowed. The controller
+        # registers its live-input programs after this library is loaded, so their ids are
+        # reserved up front; programs added later (images) are caught by put().
+        self._reserved = BUILTIN_PROGRAM_IDS | {LOCAL_INGEST_PROGRAM_ID, AUDIO_PROGRAM_ID}
+        self._patterns: dict[str, PatternSpec] = {}
+        for raw in self._load():
+            try:
+                spec = parse_pattern(raw, self._reserved)
+            except ValueError:
+                continue
+            self._patterns[spec.id] = spec
+            PROGRAMS[spec.id] = pattern_program(spec)
+
+    def _load(self) -> list:
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return []
+        patterns = raw.get("patterns") if isinstance(raw, dict) else None
+        return patterns if isinstance(patterns, list) else []
+
+    def _save(self, patterns: dict[str, PatternSpec]) -> None:
+        data = {"patterns": [json.loads(p.source) for p in patterns.values()]}
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix="rgbxmastree_patterns_", suffix=".json", dir=os.path.dirname(self._path) or ".")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+                f.write("\n")
+            os.replace(tmp_path, self._path)
+        finally:
+            try:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            return [json.loads(p.source) for p in self._patterns.values()]
+
+    def put(self, raw: object) -> PatternSpec:
+        """
+        Add or replace a pattern. Raises ValueError if it doesn't validate, OSError if it
+        can't be saved.
+        """
+        spec = parse_pattern(raw, self._reserved)
+        program = pattern_program(spec)
+        # Compile for the standard tree now, so starting it later costs nothing.
+        program.runner.frames_for(STANDARD_LAYOUT)
+        with self._lock:
+            if spec.id in PROGRAMS and spec.id not in self._patterns:
+                raise ValueError(f"id {spec.id!r} is taken by another program")
+            if spec.id not in self._patterns and len(self._patterns) >= MAX_PATTERNS:
+                raise ValueError(f"at most {MAX_PATTERNS} patterns")
+            # Nothing changes unless the file was written (a full or read-only SD card
+            # raises OSError here and leaves the library as it was).
+            patterns = {**self._patterns, spec.id: spec}
+            self._save(patterns)
+            self._patterns = patterns
+            PROGRAMS[spec.id] = program
+        return spec
+
+    def remove(self, pattern_id: str) -> bool:
+        with self._lock:
+            if pattern_id not in self._patterns:
+                return False
+            patterns = {k: v for k, v in self._patterns.items() if k != pattern_id}
+            self._save(patterns)
+            self._patterns = patterns
+            PROGRAMS.pop(pattern_id, None)
+        return True
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import struct
+import time
+from typing import Callable, Iterator
+
+
+# Binary preview stream (GET /api/preview), a sequence of messages:
+#
+#   keyframe: b"K" | u16 pixel count | count * (r, g, b)
+#   delta:    b"D" | u16 changed count | count * (u16 pixel index, r, g, b)
+#
+# All integers are big-endian. The first message is always a keyframe; after that each
+# message is whichever of the two is smaller. Identical frames are skipped, and an empty
+# delta is sent as a keepalive when nothing has changed for a while.
+MSG_KEYFRAME = ord("K")
+MSG_DELTA = ord("D")
+PREVIEW_DEFAULT_FPS = 10.0
+PREVIEW_MAX_FPS = 30.0
+PREVIEW_KEEPALIVE_S = 15.0
+
+_HEADER = struct.Struct(">BH")
+_DELTA_PIXEL = struct.Struct(">HBBB")
+
+
+def encode_keyframe(rgb: bytes) -> bytes:
+    return _HEADER.pack(MSG_KEYFRAME, len(rgb) // 3) + rgb
+
+
+def encode_delta(previous: bytes, rgb: bytes) -> bytes:
+    body = bytearray()
+    count = 0
+    for i in range(0, len(rgb), 3):
+        if rgb[i:i + 3] != previous[i:i + 3]:
+            body += _DELTA_PIXEL.pack(i // 3, rgb[i], rgb[i + 1], rgb[i + 2])
+            count += 1
+    return _HEADER.pack(MSG_DELTA, count) + bytes(body)
+
+
+class PreviewEncoder:
+    """Per-client encoder state: turns successive shown frames into preview messages."""
+
+    def __init__(self) -> None:
+        self._seq: int | None = None
+        self._rgb: bytes | None = None
+
+    def encode(self, shown: tuple[int, bytes] | None) -> bytes | None:
+        """Message for the latest shown frame, or None if there is nothing new to send."""
+        if shown is None or shown[0] == self._seq:
+            return None
+        self._seq, rgb = shown
+        if rgb == self._rgb:
+            return None
+        if self._rgb is None or len(self._rgb) != len(rgb):
+            msg = encode_keyframe(rgb)
+        else:
+            msg = encode_delta(self._rgb, rgb)
+            if len(msg) > _HEADER.size + len(rgb):
+                msg = encode_keyframe(rgb)
+        self._rgb = rgb
+        return msg
+
+
+def keepalive_message() -> bytes:
+    return _HEADER.pack(MSG_DELTA, 0)
+
+
+def clamp_fps(fps: float) -> float:
+    return max(1.0, min(PREVIEW_MAX_FPS, fps))
+
+
+def preview_stream(
+    get_frame: Callable[[], tuple[int, bytes] | None],
+    fps: float,
+    closing: Callable[[], bool],
+    *,
+    sleep: Callable[[float], None] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> Iterator[bytes]:
+    """
+    Yield preview messages for one client, polling `get_frame` at no more than `fps`.
+
+    `get_frame` returns (sequence number, packed RGB) for the last shown frame, or None
+    if nothing has been shown. Frames are sampled, not queued: a slow client just sees
+    fewer of them.
+    """
+    interval = 1.0 / clamp_fps(fps)
+    encoder = PreviewEncoder()
+    last_sent = clock()
+    while not closing():
+        msg = encoder.encode(get_frame())
+        if msg is not None:
+            last_sent = clock()
+            yield msg
+        elif clock() - last_sent >= PREVIEW_KEEPALIVE_S:
+            last_sent = clock()
+            yield keepalive_message()
+        sleep(interval)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable
+
+
+MAX_PROFILE_SECONDS = 60.0
+MAX_PROFILE_HZ = 1000.0
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(
+    get_thread_id: Callable[[], int | None],
+    seconds: float,
+    hz: float,
+    stop: threading.Event | None = None,
+) -> tuple[Counter, int]:
+    """
+    Statistically sample one thread's Python stack via sys._current_frames().
+
+    This runs on the *calling* thread; the sampled thread is never paused or
+    instrumented beyond the GIL hand-off each sample already implies. `get_thread_id`
+    is re-evaluated per sample so a program restart mid-profile keeps being followed.
+
+    Returns (collapsed stack -> sample count, number of samples taken).
+    """
+    seconds = max(0.0, min(MAX_PROFILE_SECONDS, float(seconds)))
+    hz = max(1.0, min(MAX_PROFILE_HZ, float(hz)))
+    interval = 1.0 / hz
+
+    stacks: Counter = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    next_at = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if now >= deadline or (stop is not None and stop.is_set()):
+            break
+        tid = get_thread_id()
+        if tid is not None:
+            frame = sys._current_frames().get(tid)
+            if frame is not None:
+                parts = []
+                while frame is not None:
+                    parts.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                parts.reverse()
+                stacks[";".join(parts)] += 1
+                samples += 1
+        # Fixed-rate schedule; if we fall behind (slow Pi), skip ahead rather than burst.
+        next_at += interval
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_at = time.monotonic()
+    return stacks, samples
+
+
+def format_collapsed(stacks: Counter) -> str:
+    """
+    Render stacks in Brendan Gregg's collapsed format ("a;b;c 42" per line), as
+    consumed by flamegraph.pl, speedscope, inferno, etc.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
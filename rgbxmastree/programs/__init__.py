@@ -1,17 +1,17 @@
 from __future__ import annotations
 
-from rgbxmastree.programs.base import ProgramSpec
+from rgbxmastree.programs.base import ProgramSpec, ShaderProgramSpec
 from rgbxmastree.programs.candles import candles
-from rgbxmastree.programs.hue_cycle import hue_cycle
+from rgbxmastree.programs.hue_cycle import hue_cycle, hue_cycle_delay
 from rgbxmastree.programs.navi import navi
 from rgbxmastree.programs.one_by_one import one_by_one
 from rgbxmastree.programs.random_sparkles import random_sparkles
-from rgbxmastree.programs.rainbow_snake import rainbow_snake
+from rgbxmastree.programs.rainbow_snake import rainbow_snake, rainbow_snake_delay
 from rgbxmastree.programs.matrix_rain import matrix_rain
 from rgbxmastree.programs.fireplace import fireplace
-from rgbxmastree.programs.radar_scan import radar_scan
+from rgbxmastree.programs.radar_scan import radar_scan, radar_scan_delay
 from rgbxmastree.programs.police_lights import police_lights
-from rgbxmastree.programs.candy_cane import candy_cane
+from rgbxmastree.programs.candy_cane import candy_cane, candy_cane_delay
 from rgbxmastree.programs.holly_jolly import holly_jolly
 from rgbxmastree.programs.silent_night import silent_night
 from rgbxmastree.programs.vintage_lights import vintage_lights
@@ -19,7 +19,7 @@ from rgbxmastree.programs.rgb_cycle import rgb_cycle
 from rgbxmastree.programs.snowfall import snowfall
 
 
-PROGRAMS: dict[str, ProgramSpec] = {
+PROGRAMS: dict[str, ProgramSpec | ShaderProgramSpec] = {
     "candles": ProgramSpec(
         id="candles",
         name="Candles",
@@ -44,10 +44,11 @@ PROGRAMS: dict[str, ProgramSpec] = {
         runner=one_by_one,
         default_speed=1.0,
     ),
-    "hue_cycle": ProgramSpec(
+    "hue_cycle": ShaderProgramSpec(
         id="hue_cycle",
         name="Legacy: Hue Cycle",
-        runner=hue_cycle,
+        shader=hue_cycle,
+        frame_delay=hue_cycle_delay,
         default_speed=1.0,
     ),
     "random_sparkles": ProgramSpec(
@@ -56,10 +57,11 @@ PROGRAMS: dict[str, ProgramSpec] = {
         runner=random_sparkles,
         default_speed=1.0,
     ),
-    "rainbow_snake": ProgramSpec(
+    "rainbow_snake": ShaderProgramSpec(
         id="rainbow_snake",
         name="Rainbow Snake",
-        runner=rainbow_snake,
+        shader=rainbow_snake,
+        frame_delay=rainbow_snake_delay,
         default_speed=1.0,
     ),
     "snowfall": ProgramSpec(
@@ -80,10 +82,11 @@ PROGRAMS: dict[str, ProgramSpec] = {
         runner=fireplace,
         default_speed=1.0,
     ),
-    "radar_scan": ProgramSpec(
+    "radar_scan": ShaderProgramSpec(
         id="radar_scan",
         name="Radar Scan",
-        runner=radar_scan,
+        shader=radar_scan,
+        frame_delay=radar_scan_delay,
         default_speed=1.0,
     ),
     "police_lights": ProgramSpec(
@@ -92,10 +95,11 @@ PROGRAMS: dict[str, ProgramSpec] = {
         runner=police_lights,
         default_speed=1.0,
     ),
-    "candy_cane": ProgramSpec(
+    "candy_cane": ShaderProgramSpec(
         id="candy_cane",
         name="Candy Cane",
-        runner=candy_cane,
+        shader=candy_cane,
+        frame_delay=candy_cane_delay,
         default_speed=1.0,
     ),
     "holly_jolly": ProgramSpec(
@@ -119,3 +123,7 @@ PROGRAMS: dict[str, ProgramSpec] = {
 }
 
 
+
+# The programs above. PROGRAMS itself also gains entries at runtime (saved patterns, images,
+# live-input programs), so it isn't a record of what is built in.
+BUILTIN_PROGRAM_IDS = frozenset(PROGRAMS)
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import partial
 from threading import Event
 from typing import Callable, Protocol
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.programs.shader import Shader, run_shader
 
 
 class ProgramRunner(Protocol):
@@ -17,5 +19,28 @@ class ProgramSpec:
     name: str
     runner: Callable[[RGBXmasTree, Event, float], None]
     default_speed: float = 1.0
+    # False for programs that show live input (the local co-process, music sync): adaptive
+    # pacing lets a runner compute ahead of the wall clock while its output is unchanged,
+    # which would hold back a frame reacting to input that arrives meanwhile.
+    adaptive_pacing: bool = True
 
 
+@dataclass(frozen=True)
+class ShaderProgramSpec:
+    """
+    A program given as one function of the whole tree per frame (see programs/shader.py):
+    `shader(geometry, frame)` returns every pixel's float RGB as an array, and the engine
+    runs the loop, keeping time and speed, and sends the output. `frame_delay(speed)` is
+    the sleep between frames.
+    """
+
+    id: str
+    name: str
+    shader: Shader
+    frame_delay: Callable[[float], float]
+    default_speed: float = 1.0
+    adaptive_pacing: bool = True
+
+    @property
+    def runner(self) -> Callable[[RGBXmasTree, Event, float], None]:
+        return partial(run_shader, self)
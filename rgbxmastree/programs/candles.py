@@ -1,10 +1,13 @@
 from __future__ import annotations
 
-import random
 from threading import Event
-from time import sleep
+
+import numpy as np
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.programs.noise import TABLE_1D, TABLE_1D_CELLS, TABLE_1D_SIZE, sample
+from rgbxmastree.programs.shader import Geometry, to_rgb_bytes
+from rgbxmastree.runtime import program_rng, program_time, sleep
 
 
 def _lerp(a: float, b: float, t: float) -> float:
@@ -57,86 +60,58 @@ def _candle_rgb(brightness: float, *, white_bias: float = 0.0) -> tuple[float, f
     return (_clamp01(r), _clamp01(g), _clamp01(bb))
 
 
+# _candle_rgb as tables over 0..1 brightness in 256 steps: the body is scaled by its
+# brightness, the star is a whiter gold at full level.
+_LUT_STEPS = 256
+_BODY_LUT = np.array([np.array(_candle_rgb(k / (_LUT_STEPS - 1))) * (k / (_LUT_STEPS - 1)) for k in range(_LUT_STEPS)])
+_STAR_LUT = np.array([_candle_rgb(k / (_LUT_STEPS - 1), white_bias=0.18) for k in range(_LUT_STEPS)])
+_SAMPLES_PER_CELL = TABLE_1D_SIZE / TABLE_1D_CELLS
+
+# Subtle global modulation (helps avoid a chaotic "sparkle" feel); 0.0 for purely
+# independent pixels. It wanders at a tenth of the body's pace.
+GLOBAL_STRENGTH = 0.05
+GLOBAL_PACE = 0.1
+STAR_PACE = 0.8
+
+
 def candles(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
     """
     Candle-like warm flicker on the body (red/orange/amber), star flickers too.
 
     The only tempo control is the supplied `speed` knob from the web UI/controller.
     """
-    star = tree.star
-    body_pixels = [px for px in tree if px is not star]
+    rng = program_rng()
+    geo = Geometry.of(tree)
+    body = ~geo.star
 
     # speed is expected to be in a wide range (e.g. 0.1..200).
     s = max(0.001, float(speed))
     # Update cadence: very slow at low end (seconds), extremely fast at high end (milliseconds).
     delay = max(0.001, 1.0 / s)
-
-    # Per-pixel flicker state (independent targets so the body doesn't move uniformly).
-    intensities = [random.uniform(0.35, 0.8) for _ in body_pixels]
-    targets = [i for i in intensities]
-    # Each pixel gets a slightly different responsiveness and target-change rate.
-    rates = [random.uniform(0.7, 1.4) for _ in body_pixels]
-
-    # Optional subtle global modulation (helps avoid a chaotic "sparkle" feel).
-    # Set to 0.0 if you want *purely* independent pixels.
-    GLOBAL_STRENGTH = 0.05
-    global_intensity = 0.5
-    global_target = 0.5
-
-    # Star flicker state (independent of the body).
-    star_intensity = random.uniform(0.55, 0.90)
-    star_target = star_intensity
-    star_rate = random.uniform(0.8, 1.2)
-
+    # Noise lattice cells travelled per second: about one new flicker level every 2 s at
+    # speed 10, a fresh one every frame by 200.
+    cells_per_s = 0.005 * s * s
+
+    # Each pixel reads the noise from its own place at its own pace (so the body doesn't
+    # move uniformly); the star and the global modulation have lanes of their own.
+    offsets = np.array([rng.uniform(0.0, TABLE_1D_SIZE) for _ in range(geo.pixels)])
+    paces = np.array([rng.uniform(0.7, 1.4) for _ in range(geo.pixels)])
+    paces[geo.star] *= STAR_PACE
+    global_offset = rng.uniform(0.0, TABLE_1D_SIZE)
+
+    t0 = program_time()
     while not stop.is_set():
-        # Global modulation updates slowly and gently.
-        if random.random() < _clamp01(0.02 * (s / 10.0)):
-            global_target = random.uniform(0.35, 0.75)
-        global_intensity = _lerp(global_intensity, global_target, _clamp01(0.02 * (s / 10.0)))
-        global_factor = 1.0 + GLOBAL_STRENGTH * ((global_intensity - 0.5) * 2.0)
-
-        # Apply to all body pixels (everything except the star). Batch the SPI update.
-        prev_auto = tree.auto_show
-        tree.auto_show = False
-        try:
-            # --- star ---
-            if random.random() < _clamp01(0.04 * (s / 10.0) * star_rate):
-                star_target = 0.35 + (random.random() ** 0.65) * 0.65
-            star_alpha = _clamp01(0.04 * (s / 10.0) * star_rate)
-            star_intensity = _lerp(star_intensity, star_target, star_alpha)
-
-            star_brightness = _clamp01(star_intensity * (1.0 + 0.02 * ((global_intensity - 0.5) * 2.0)))
-            sr, sg, sb = _candle_rgb(star_brightness, white_bias=0.18)
-            sj = 1.0 + random.uniform(-0.04, 0.04) * (0.25 + 0.75 * star_brightness)
-            star.color = (_clamp01(sr * sj), _clamp01(sg * sj), _clamp01(sb * sj))
-
-            for i, px in enumerate(body_pixels):
-                r_rate = rates[i]
-
-                # Occasionally pick a new random target; higher speed changes targets more often.
-                if random.random() < _clamp01(0.05 * (s / 10.0) * r_rate):
-                    # Bias towards mid values for gentler motion
-                    targets[i] = 0.15 + (random.random() ** 0.7) * 0.85
-
-                # Smooth towards target; faster speeds converge quicker (with per-pixel variance).
-                alpha = _clamp01(0.05 * (s / 10.0) * r_rate)
-                intensities[i] = _lerp(intensities[i], targets[i], alpha)
-
-                brightness = _clamp01(intensities[i] * global_factor)
-                base_r, base_g, base_b = _candle_rgb(brightness)
-
-                # Slight per-pixel jitter on top of per-pixel state, for shimmer.
-                j = 1.0 + random.uniform(-0.06, 0.06) * (0.3 + 0.7 * brightness)
-                px.color = (
-                    _clamp01(base_r * brightness * j),
-                    _clamp01(base_g * brightness * j),
-                    _clamp01(base_b * brightness * j),
-                )
-        finally:
-            tree.auto_show = prev_auto
-            # Ensure we display the batched update each loop, regardless of prior auto_show.
-            tree.show()
+        travelled = (program_time() - t0) * cells_per_s * _SAMPLES_PER_CELL
+        level = sample(TABLE_1D, offsets + travelled * paces)
+        g = sample(TABLE_1D, global_offset + travelled * GLOBAL_PACE)
+        global_factor = 1.0 + GLOBAL_STRENGTH * (2.0 * g - 1.0)
+
+        # Body levels sit between 0.15 and 1.0, the star between 0.35 and 1.0, both biased
+        # towards the bright end.
+        bright = np.where(body, 0.15 + 0.85 * level**0.7, 0.35 + 0.65 * level**0.65) * global_factor
+        k = (np.clip(bright, 0.0, 1.0) * (_LUT_STEPS - 1)).astype(np.intp)
+        out = np.where(body[:, None], _BODY_LUT[k], _STAR_LUT[k])
+        tree.write_rgb(0, to_rgb_bytes(out))
+        tree.show()
 
         sleep(delay)
-
-
@@ -1,47 +1,25 @@
 from __future__ import annotations
 
-from threading import Event
-from time import sleep
+import numpy as np
 
-from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.programs.shader import Geometry, ShaderFrame
 
 
-def candy_cane(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
+RED = np.array((1.0, 0.0, 0.0))
+WHITE = np.array((1.0, 1.0, 1.0))
+
+
+def candy_cane_delay(speed: float) -> float:
+    s = max(0.001, float(speed))
+    return max(0.05, 0.2 / s)
+
+
+def candy_cane(geo: Geometry, frame: ShaderFrame) -> np.ndarray:
     """
     Rotating red and white candy cane stripes.
     """
-    # Speed handling
-    s = max(0.001, float(speed))
-    delay = max(0.05, 0.2 / s)
-    
-    offset = 0
-    
-    while not stop.is_set():
-        prev_auto = tree.auto_show
-        tree.auto_show = False
-        
-        try:
-            for level in range(3):
-                for branch in range(8):
-                    # Create diagonal stripes by adding level to branch
-                    # This makes the pattern spiral up the tree
-                    idx = branch + level + offset
-                    
-                    if idx % 2 == 0:
-                        tree[level, branch].color = (1.0, 0.0, 0.0) # Red
-                    else:
-                        tree[level, branch].color = (1.0, 1.0, 1.0) # White
-            
-            # Star spins too
-            if offset % 2 == 0:
-                tree.star.color = (1.0, 0.0, 0.0)
-            else:
-                tree.star.color = (1.0, 1.0, 1.0)
-                
-            tree.show()
-            
-        finally:
-            tree.auto_show = prev_auto
-            
-        offset += 1
-        sleep(delay)
+    # Create diagonal stripes by adding level to branch; this makes the pattern spiral up
+    # the tree, and the frame number turns it. The star (level 3, branch -1) lands on the
+    # same parity as the frame, so it spins too.
+    red = (geo.branch + geo.level + frame.n) % 2 == 0
+    return np.where(red[:, None], RED, WHITE)
@@ -1,10 +1,37 @@
 from __future__ import annotations
 
-import random
 from threading import Event
-from time import sleep
+
+import numpy as np
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.programs.noise import TABLE_2D, TABLE_2D_CELLS, TABLE_2D_SHAPE, sample
+from rgbxmastree.programs.shader import LEVELS, to_rgb_bytes
+from rgbxmastree.programs.topology import Topology
+from rgbxmastree.runtime import program_rng, sleep
+
+
+# Heat (0..1 per pixel): the bottom level is the fire itself, fed afresh every frame; its
+# heat rises a level at a time, spreads a little to neighbouring branches and cools faster
+# the higher it gets.
+RISE = 0.6
+SPREAD = 0.15
+# Heat kept per frame by level: bottom (overwritten by fuel), middle, top, star.
+COOLING = np.array((1.0, 1.0, 0.5, 0.2))
+FUEL = (0.6, 1.0)
+FLICKER = 0.4
+EMBER = np.array((1.0, 0.2, 0.0))
+# Fuel and flicker are read from the 2-D noise table, a row per pixel (round each level,
+# then up, so neighbouring branches flicker together) and this many columns per frame.
+# Fuel reads half the table away from flicker, so the two are unrelated.
+FRAME_STEP = TABLE_2D_SHAPE[1] / TABLE_2D_CELLS[1] / 2
+
+
+# Heat to colour in hundredths: off, dim red, red, orange, then white-yellow at the hottest.
+FIRE_LUT = np.array(
+    [(0.0, 0.0, 0.0)] * 11 + [(0.3, 0.0, 0.0)] * 30 + [(1.0, 0.0, 0.0)] * 30 + [(1.0, 0.5, 0.0)] * 20
+    + [(1.0, 1.0, 0.5)] * 10
+)
 
 
 def fireplace(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
@@ -14,61 +41,28 @@ def fireplace(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
     # Speed affects flicker rate
     s = max(0.001, float(speed))
     delay = max(0.01, 0.08 / s)
-    
-    def get_fire_color(intensity):
-        """Convert 0.0-1.0 intensity to fire color"""
-        # High intensity = Yellow/White
-        # Med intensity = Orange
-        # Low intensity = Red
-        # Very low = Dim Red/Off
-        
-        if intensity > 0.9:
-            return (1.0, 1.0, 0.5) # White-Yellow
-        elif intensity > 0.7:
-            return (1.0, 0.5, 0.0) # Orange
-        elif intensity > 0.4:
-            return (1.0, 0.0, 0.0) # Red
-        elif intensity > 0.1:
-            return (0.3, 0.0, 0.0) # Dim Red
-        else:
-            return (0.0, 0.0, 0.0)
-            
+    column = program_rng().uniform(0.0, TABLE_2D_SHAPE[1])
+
+    topo = Topology.of(tree)
+    geo = topo.geometry
+    step = topo.advection("up", RISE).then(topo.diffusion(SPREAD))
+    cooling = np.where(geo.level >= 0, COOLING[np.clip(geo.level, 0, LEVELS)], 0.0)
+    bottom = geo.level == 0
+    heat = np.zeros(geo.pixels)
+    lanes = np.where(geo.walk >= 0, geo.walk, geo.walk_len + np.arange(geo.pixels))
+    fuel_lanes = lanes[bottom]
+    fuel_shift = TABLE_2D_SHAPE[1] / 2
+
     while not stop.is_set():
-        prev_auto = tree.auto_show
-        tree.auto_show = False
-        
-        try:
-            # Generate heat map
-            
-            # Bottom level: Hot! High intensity
-            for b in range(8):
-                flicker = random.uniform(0.6, 1.0)
-                tree[0, b].color = get_fire_color(flicker)
-            
-            # Middle level: Medium heat
-            for b in range(8):
-                # Often correlates with bottom, but with lag or randomness
-                flicker = random.uniform(0.3, 0.8)
-                tree[1, b].color = get_fire_color(flicker)
-                
-            # Top level: Sparks and smoke
-            for b in range(8):
-                if random.random() < 0.3:
-                    flicker = random.uniform(0.1, 0.5)
-                else:
-                    flicker = 0.0
-                tree[2, b].color = get_fire_color(flicker)
-            
-            # Star: Occasional glowing ember
-            if random.random() < 0.2:
-                tree.star.color = (0.5, 0.1, 0.0) # Warm glow
-            else:
-                r, g, b = tree.star.color
-                tree.star.color = (max(0, r-0.05), max(0, g-0.05), max(0, b-0.05))
-                
-            tree.show()
-            
-        finally:
-            tree.auto_show = prev_auto
-            
+        flicker = sample(TABLE_2D, column, lanes)
+        heat = step(heat) * cooling * (FLICKER + (1.0 - FLICKER) * flicker)
+        fuel = sample(TABLE_2D, column + fuel_shift, fuel_lanes)
+        heat[bottom] = FUEL[0] + (FUEL[1] - FUEL[0]) * fuel
+        np.clip(heat, 0.0, 1.0, out=heat)
+        out = FIRE_LUT[(heat * 100.0).astype(np.intp)]
+        # The star is an ember glowing with whatever heat reaches it.
+        out[geo.star] = EMBER * np.minimum(1.0, 2.0 * heat[geo.star, None])
+        tree.write_rgb(0, to_rgb_bytes(out))
+        tree.show()
+        column += FRAME_STEP
         sleep(delay)
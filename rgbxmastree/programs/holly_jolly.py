@@ -1,16 +1,16 @@
 from __future__ import annotations
 
-import random
 from threading import Event
-from time import sleep
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.runtime import program_rng, sleep
 
 
 def holly_jolly(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
     """
     Festive sparkles in Red, Green, and Gold.
     """
+    rng = program_rng()
     # Speed handling
     s = max(0.001, float(speed))
     delay = max(0.01, 0.1 / s)
@@ -27,10 +27,10 @@ def holly_jolly(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
         
     while not stop.is_set():
         # Pick a random pixel to sparkle
-        pixel = random.choice(list(tree))
+        pixel = rng.choice(list(tree))
         
         # Flash it bright
-        color = random.choice(colors)
+        color = rng.choice(colors)
         pixel.color = color
         
         # Occasionally reset a random pixel to background to prevent saturation
@@ -38,8 +38,8 @@ def holly_jolly(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
         # Let's just randomly set pixels.
         
         # To make it twinkle, we need to turn them off/dim them too.
-        if random.random() < 0.5:
-            off_pixel = random.choice(list(tree))
+        if rng.random() < 0.5:
+            off_pixel = rng.choice(list(tree))
             off_pixel.color = (0.0, 0.1, 0.0)
             
         sleep(delay)
@@ -1,24 +1,24 @@
 from __future__ import annotations
 
-from threading import Event
-from time import sleep
-
+import numpy as np
 from colorzero import Color, Hue
 
-from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.programs.shader import Geometry, ShaderFrame
+
+
+def hue_cycle_delay(speed: float) -> float:
+    return max(0.005, 0.02 / max(speed, 0.01))
 
 
-def hue_cycle(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
+def hue_cycle(geo: Geometry, frame: ShaderFrame) -> np.ndarray:
     """
     Cycle through hues forever.
-    Ported from examples/huecycle.py, but stop-able.
+    Ported from examples/huecycle.py.
     """
-    tree.color = Color("red")
-    delay = max(0.005, 0.02 / max(speed, 0.01))
-    step = max(1, int(3 * max(speed, 0.01)))
-
-    while not stop.is_set():
-        tree.color += Hue(deg=step)
-        sleep(delay)
-
-
+    if frame.n == 0:
+        color = Color("red")
+    else:
+        # Stepped from the last colour (not computed from n) so rounding matches the original.
+        step = max(1, int(3 * max(frame.speed, 0.01)))
+        color = Color(*frame.prev[0]) + Hue(deg=step)
+    return np.broadcast_to(np.array(color), (geo.pixels, 3))
@@ -1,16 +1,16 @@
 from __future__ import annotations
 
-import random
 from threading import Event
-from time import sleep
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.runtime import program_rng, sleep
 
 
 def matrix_rain(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
     """
     Matrix-style digital rain effect. Green code falling down.
     """
+    rng = program_rng()
     # Speed handling
     s = max(0.001, float(speed))
     delay = max(0.02, 0.15 / s)
@@ -38,13 +38,13 @@ def matrix_rain(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
         
         try:
             # Randomly start new drops
-            if random.random() < 0.3:
+            if rng.random() < 0.3:
                 # Pick a random branch that isn't busy (active <= 0 means near bottom/done)
                 # actually we can have multiple drops per column but it's short.
                 # simpler: pick a random branch, if it's inactive (-1), start it at 3 (above top)
                 candidates = [b for b, pos in enumerate(branch_drops) if pos == -1]
                 if candidates:
-                    b = random.choice(candidates)
+                    b = rng.choice(candidates)
                     branch_drops[b] = 3
             
             # Draw
@@ -82,7 +82,7 @@ def matrix_rain(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
                         branch_drops[b] = -1
             
             # Star: occasional glitch
-            if random.random() < 0.05:
+            if rng.random() < 0.05:
                 tree.star.color = head_color
             else:
                 tree.star.color = (0, 0, 0)
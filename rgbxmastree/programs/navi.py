@@ -3,9 +3,9 @@ from __future__ import annotations
 import math
 import random
 from threading import Event
-from time import sleep
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.runtime import program_rng, sleep
 
 
 def _lerp(a: float, b: float, t: float) -> float:
@@ -54,7 +54,10 @@ _VINTAGE_PALETTE = [
 ]
 
 
-def _generate_fairy_color(previous_color: tuple[float, float, float] | None) -> tuple[float, float, float]:
+def _generate_fairy_color(
+    previous_color: tuple[float, float, float] | None,
+    rng: random.Random,
+) -> tuple[float, float, float]:
     """
     Generate a fairy color from the vintage lights palette that's different from the previous color.
     
@@ -62,13 +65,14 @@ def _generate_fairy_color(previous_color: tuple[float, float, float] | None) ->
     
     Args:
         previous_color: The previous fairy color, or None for the first color
+        rng: Random source for this program run
     
     Returns:
         A color from the vintage palette that's different from the previous one
     """
     if previous_color is None:
         # First color - pick randomly
-        return random.choice(_VINTAGE_PALETTE)
+        return rng.choice(_VINTAGE_PALETTE)
     
     # Find colors that are different from the previous one
     available_colors = [
@@ -78,10 +82,10 @@ def _generate_fairy_color(previous_color: tuple[float, float, float] | None) ->
     
     # If we have options, pick from them, otherwise just pick any color
     if available_colors:
-        return random.choice(available_colors)
+        return rng.choice(available_colors)
     else:
         # Fallback: pick a random color from the palette
-        return random.choice(_VINTAGE_PALETTE)
+        return rng.choice(_VINTAGE_PALETTE)
 
 
 def _generate_corkscrew_path(tree: RGBXmasTree) -> list:
@@ -122,6 +126,7 @@ def navi(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
     
     The only tempo control is the supplied `speed` knob from the web UI/controller.
     """
+    rng = program_rng()
     star = tree.star
     body_pixels = [px for px in tree if px is not star]
     
@@ -162,7 +167,7 @@ def navi(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
     
     while not stop.is_set():
         # Generate new fairy color
-        fairy_color = _generate_fairy_color(previous_fairy_color)
+        fairy_color = _generate_fairy_color(previous_fairy_color, rng)
         previous_fairy_color = fairy_color
         
         # Traverse the corkscrew path
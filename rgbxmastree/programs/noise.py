@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+
+# Precomputed noise for organic motion (flames, candle flicker): smooth random-looking
+# values that are just table lookups at run time.
+#
+# Tables are fractal value noise (random values on a lattice, smoothstep-interpolated,
+# several octaves summed), equalised so values are spread evenly over 0..1 (like the
+# uniform draws they replace, only smooth) and tileable: every axis wraps, so a lookup
+# can run along it forever. They are built once at import from fixed seeds, so the same
+# position always gives the same value; programs vary motion between runs and pixels by
+# where (and how fast) each pixel reads, drawn from program_rng().
+#
+# TABLE_1D: one long lane, read by each pixel from its own offset.
+# TABLE_2D: lanes x time, for per-pixel streams that move together with their neighbours
+# (nearby lanes are correlated); index rows by pixel and columns by time or frame.
+TABLE_1D_SIZE = 4096
+TABLE_1D_CELLS = 256
+TABLE_2D_SHAPE = (32, 1024)
+TABLE_2D_CELLS = (8, 64)
+OCTAVES = 3
+PERSISTENCE = 0.5
+
+
+def _smoothstep(f: np.ndarray) -> np.ndarray:
+    return f * f * (3.0 - 2.0 * f)
+
+
+def _upsample(lattice: np.ndarray, axis: int, size: int) -> np.ndarray:
+    """Interpolate `lattice` along `axis` to `size` samples, wrapping at the end."""
+    cells = lattice.shape[axis]
+    x = np.arange(size) * (cells / size)
+    i0 = np.floor(x).astype(np.intp)
+    f = _smoothstep(x - i0)
+    a = np.take(lattice, i0 % cells, axis=axis)
+    b = np.take(lattice, (i0 + 1) % cells, axis=axis)
+    shape = [1] * lattice.ndim
+    shape[axis] = size
+    return a + (b - a) * f.reshape(shape)
+
+
+def tileable_noise(
+    shape: tuple[int, ...], cells: tuple[int, ...], octaves: int = OCTAVES, seed: int = 0
+) -> np.ndarray:
+    """
+    Value noise of `shape` with `cells` lattice cells per axis for the first octave (each
+    octave after doubles them). Every size must be a multiple of its cell count times
+    2**(octaves - 1), so all octaves tile. Returns float32, evenly distributed over 0..1.
+    """
+    rng = np.random.default_rng(seed)
+    out = np.zeros(shape)
+    amplitude = 1.0
+    for octave in range(octaves):
+        lattice = rng.random(tuple(c << octave for c in cells))
+        for axis, size in enumerate(shape):
+            lattice = _upsample(lattice, axis, size)
+        out += amplitude * lattice
+        amplitude *= PERSISTENCE
+    # Rank-equalise: same ups and downs, uniform distribution.
+    ranks = np.empty(out.size)
+    ranks[np.argsort(out, axis=None)] = np.arange(out.size) / (out.size - 1)
+    return ranks.reshape(shape).astype(np.float32)
+
+
+def sample(table: np.ndarray, x: np.ndarray | float, row: np.ndarray | int | None = None) -> np.ndarray:
+    """
+    Linear interpolation along the last axis of `table` at positions `x` (in samples,
+    wrapping), from rows `row` of a 2-D table.
+    """
+    size = table.shape[-1]
+    if np.ndim(x) == 0:
+        # One position (e.g. the current time for every pixel): plain ints index faster.
+        i0 = math.floor(x)
+        f = x - i0
+        i0 %= size
+        i1 = (i0 + 1) % size
+    else:
+        x = np.asarray(x, dtype=np.float64)
+        i0 = np.floor(x)
+        f = x - i0
+        i0 = i0.astype(np.intp) % size
+        i1 = (i0 + 1) % size
+    if row is None:
+        a, b = table[i0], table[i1]
+    else:
+        row = np.asarray(row) % table.shape[0]
+        a, b = table[row, i0], table[row, i1]
+    return a + (b - a) * f
+
+
+TABLE_1D = tileable_noise((TABLE_1D_SIZE,), (TABLE_1D_CELLS,), seed=1)
+TABLE_2D = tileable_noise(TABLE_2D_SHAPE, TABLE_2D_CELLS, seed=2)
@@ -2,13 +2,13 @@ from __future__ import annotations
 
 import random
 from threading import Event
-from time import sleep
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.runtime import program_rng, sleep
 
 
-def _random_color():
-    return (random.random(), random.random(), random.random())
+def _random_color(rng: random.Random):
+    return (rng.random(), rng.random(), rng.random())
 
 
 def random_sparkles(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
@@ -16,11 +16,12 @@ def random_sparkles(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
     Randomly sparkle all the pixels.
     Ported from examples/randomsparkles.py, but stop-able.
     """
+    rng = program_rng()
     delay = max(0.001, 0.03 / max(speed, 0.01))
 
     while not stop.is_set():
-        pixel = random.choice(list(tree))
-        pixel.color = _random_color()
+        pixel = rng.choice(list(tree))
+        pixel.color = _random_color(rng)
         sleep(delay)
 
 
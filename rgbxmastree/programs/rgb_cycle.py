@@ -1,11 +1,11 @@
 from __future__ import annotations
 
 from threading import Event
-from time import sleep
 
 from colorzero import Color
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.runtime import sleep
 
 
 def rgb_cycle(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
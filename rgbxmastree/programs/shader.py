@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from threading import Event
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+
+from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.runtime import program_time, sleep
+
+if TYPE_CHECKING:
+    from rgbxmastree.programs.base import ShaderProgramSpec
+
+
+LEVELS = 3
+BRANCHES = 8
+
+
+@dataclass(frozen=True)
+class Geometry:
+    """
+    Per-pixel coordinates of a tree, as arrays indexed by pixel number.
+
+    Pixels off the 3x8 body and star (extra chains) have level and branch -1, walk -1.
+    """
+
+    pixels: int
+    level: np.ndarray  # 0 (bottom) .. 2; the star is level 3
+    branch: np.ndarray  # 0..7 around the trunk; -1 for the star
+    angle: np.ndarray  # branch as radians, 0 for the star
+    height: np.ndarray  # 0.0 (bottom level) .. 1.0 (star)
+    star: np.ndarray  # bool mask
+    walk: np.ndarray  # position going around each level bottom to top, then the star
+    walk_len: int
+
+    @classmethod
+    def of(cls, tree: RGBXmasTree) -> "Geometry":
+        n = len(tree)
+        level = np.full(n, -1, dtype=np.int64)
+        branch = np.full(n, -1, dtype=np.int64)
+        walk = np.full(n, -1, dtype=np.int64)
+        star = np.zeros(n, dtype=bool)
+        step = 0
+        for lv in range(LEVELS):
+            for br in range(BRANCHES):
+                i = tree[lv, br].index
+                level[i], branch[i], walk[i] = lv, br, step
+                step += 1
+        try:
+            s = tree.star.index
+        except AttributeError:
+            pass
+        else:
+            level[s], walk[s], star[s] = LEVELS, step, True
+            step += 1
+        height = np.where(level >= 0, level / LEVELS, 0.0)
+        angle = np.where(branch >= 0, branch * (2.0 * math.pi / BRANCHES), 0.0)
+        return cls(n, level, branch, angle, height, star, walk, step)
+
+
+@dataclass(frozen=True)
+class ShaderFrame:
+    n: int  # frame number, from 0
+    t: float  # program seconds since the program started
+    speed: float
+    prev: np.ndarray  # previous frame's output (float RGB, shape (pixels, 3)); the tree's contents for frame 0
+
+
+Shader = Callable[[Geometry, ShaderFrame], np.ndarray]
+
+
+def to_rgb_bytes(rgb: np.ndarray) -> bytes:
+    """Float RGB (0..1, shape (pixels, 3)) to packed 8-bit triples, rounded like RGBXmasTree."""
+    return (np.clip(rgb, 0.0, 1.0) * 255.0).astype(np.uint8).tobytes()
+
+
+def run_shader(spec: "ShaderProgramSpec", tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
+    """The runner behind every ShaderProgramSpec: time, speed, pacing and output."""
+    geo = Geometry.of(tree)
+    prev = np.array(tree.value, dtype=np.float64)
+    delay = spec.frame_delay(speed)
+    t0 = program_time()
+    n = 0
+    while not stop.is_set():
+        out = spec.shader(geo, ShaderFrame(n, program_time() - t0, speed, prev))
+        tree.write_rgb(0, to_rgb_bytes(out))
+        tree.show()
+        prev = out
+        n += 1
+        sleep(delay)
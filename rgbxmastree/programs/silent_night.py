@@ -1,11 +1,10 @@
 from __future__ import annotations
 
 import math
-import time
 from threading import Event
-from time import sleep
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.runtime import program_time, sleep
 
 
 def silent_night(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
@@ -14,14 +13,14 @@ def silent_night(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
     """
     # Speed handling - this one should naturally be slower
     s = max(0.001, float(speed))
-    # We use time.time() for the wave, delay just controls framerate
+    # We use the program clock for the wave, delay just controls framerate
     delay = 0.05 
     
     while not stop.is_set():
         prev_auto = tree.auto_show
         tree.auto_show = False
         
-        t = time.time() * s
+        t = program_time() * s
         
         try:
             # Gentle vertical wave
@@ -1,64 +1,66 @@
 from __future__ import annotations
 
-import random
 from threading import Event
-from time import sleep
+
+import numpy as np
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.programs.shader import LEVELS, to_rgb_bytes
+from rgbxmastree.programs.topology import Topology
+from rgbxmastree.runtime import program_rng, sleep
+
+
+# Snow (0..1 per pixel) falls a level per frame. What reaches the bottom settles there: it
+# builds up, drifts a little round the tree and slowly melts.
+FLAKE_CHANCE = 0.15
+FLAKE = (0.8, 1.0)
+SETTLE = 0.7  # share of a flake that stays when it lands
+DRIFT = 0.2
+MELT = 0.7
 
 
 def snowfall(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
     """
     Simulates snow falling from the top of the tree, with a twinkling star.
     """
+    rng = program_rng()
+    noise = np.random.default_rng(rng.getrandbits(64))
     # Speed handling
     s = max(0.001, float(speed))
     # Snow falls somewhat slowly
     delay = max(0.05, 0.3 / s)
-    
+
+    topo = Topology.of(tree)
+    geo = topo.geometry
+    fall = topo.advection("down", 1.0)
+    drift = topo.diffusion(DRIFT, edges=("around",))
+    top = geo.level == LEVELS - 1
+    bottom = geo.level == 0
+    snow = np.zeros(geo.pixels)
+    star = np.zeros(3)
+
     while not stop.is_set():
-        prev_auto = tree.auto_show
-        tree.auto_show = False
-        
-        try:
-            # Update Star (Random twinkle)
-            if random.random() < 0.1:
-                tree.star.color = (1.0, 1.0, 1.0)
-            elif random.random() < 0.05:
-                tree.star.color = (0.5, 0.5, 1.0) # Blue-ish tint
-            else:
-                # Fade star slightly instead of hard off
-                r, g, b = tree.star.color
-                tree.star.color = (max(0, r - 0.1), max(0, g - 0.1), max(0, b - 0.1))
+        # Update Star (Random twinkle)
+        if rng.random() < 0.1:
+            star = np.array((1.0, 1.0, 1.0))
+        elif rng.random() < 0.05:
+            star = np.array((0.5, 0.5, 1.0))  # Blue-ish tint
+        else:
+            # Fade star slightly instead of hard off
+            star = np.maximum(0.0, star - 0.1)
+
+        # Update Snow: what lands on the bottom level is added to what is already there.
+        landing = snow[bottom].copy()
+        snow = fall(snow)
+        snow[bottom] = landing * MELT + (snow[bottom] - landing) * SETTLE
+        snow[bottom] = drift(snow)[bottom]
+        # New flakes at the top
+        flakes = noise.random(int(top.sum())) < FLAKE_CHANCE
+        snow[top] = np.where(flakes, noise.uniform(*FLAKE, flakes.size), 0.0)
+        np.clip(snow, 0.0, 1.0, out=snow)
 
-            # Update Snow Layers
-            # We iterate branches 0-7
-            for b in range(8):
-                # Move snow down: Level 1 -> Level 0
-                # We add a slight fade or randomness to movement?
-                # No, just shift down for clear effect.
-                
-                # Level 0 (Bottom) - takes from Level 1
-                l1_color = tree[1, b].color
-                # Dim it slightly as it hits bottom/ground
-                tree[0, b].color = (l1_color[0] * 0.7, l1_color[1] * 0.7, l1_color[2] * 0.7)
-                
-                # Level 1 (Middle) - takes from Level 2
-                l2_color = tree[2, b].color
-                tree[1, b].color = l2_color
-                
-                # Level 2 (Top) - Spawns new snow
-                # 15% chance of new flake
-                if random.random() < 0.15:
-                    # White with slight variance
-                    intensity = random.uniform(0.8, 1.0)
-                    tree[2, b].color = (intensity, intensity, intensity)
-                else:
-                    tree[2, b].color = (0, 0, 0)
-                    
-            tree.show()
-            
-        finally:
-            tree.auto_show = prev_auto
-            
+        out = np.repeat(snow[:, None], 3, axis=1)
+        out[geo.star] = star
+        tree.write_rgb(0, to_rgb_bytes(out))
+        tree.show()
         sleep(delay)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.programs.shader import BRANCHES, LEVELS, Geometry
+
+
+# How the tree's pixels connect, for effects that spread from pixel to pixel (heat rising,
+# snow settling, ripples running round a level).
+#
+# Neighbours of a body pixel (level, branch):
+#   around: (level, branch +/- 1), wrapping round the trunk
+#   up:     (level + 1, branch); the top level's "up" is the star
+#   down:   (level - 1, branch); the star's "down" is the whole top level
+# Pixels off the body and star (extra chains) have no neighbours.
+#
+# Operators are sparse matrices stored as fixed-width rows (column index + weight per
+# pixel, padded with zero weights), so applying one to a whole framebuffer, scalar field
+# (pixels,) or colours (pixels, 3), is one gather, one multiply and one sum.
+EDGES = ("around", "up", "down")
+# Advection directions: where each pixel sends its contents.
+DIRECTIONS = ("up", "down", "clockwise", "anticlockwise")
+
+
+@dataclass(frozen=True)
+class SparseOperator:
+    index: np.ndarray  # (pixels, width) source pixel per term
+    weight: np.ndarray  # (pixels, width)
+
+    @classmethod
+    def from_rows(cls, rows: list[dict[int, float]]) -> "SparseOperator":
+        width = max(1, max(len(r) for r in rows)) if rows else 1
+        index = np.zeros((len(rows), width), dtype=np.intp)
+        weight = np.zeros((len(rows), width))
+        for i, row in enumerate(rows):
+            index[i] = i
+            for k, (j, w) in enumerate(row.items()):
+                index[i, k], weight[i, k] = j, w
+        return cls(index, weight)
+
+    def then(self, other: "SparseOperator") -> "SparseOperator":
+        """One operator doing this one and then `other`."""
+        rows: list[dict[int, float]] = []
+        for i in range(len(other.index)):
+            row: dict[int, float] = {}
+            for k, w in zip(other.index[i], other.weight[i]):
+                if w:
+                    for j, v in zip(self.index[k], self.weight[k]):
+                        if v:
+                            row[int(j)] = row.get(int(j), 0.0) + w * v
+            rows.append(row)
+        return SparseOperator.from_rows(rows)
+
+    def __call__(self, field: np.ndarray) -> np.ndarray:
+        if field.ndim == 1:
+            return (field[self.index] * self.weight).sum(axis=1)
+        return np.einsum("pk,pk...->p...", self.weight, field[self.index])
+
+
+@dataclass(frozen=True)
+class Topology:
+    geometry: Geometry
+    around: tuple[tuple[int, ...], ...]
+    up: tuple[tuple[int, ...], ...]
+    down: tuple[tuple[int, ...], ...]
+
+    @classmethod
+    def of(cls, tree: RGBXmasTree) -> "Topology":
+        geo = Geometry.of(tree)
+        n = geo.pixels
+        at = {(int(geo.level[i]), int(geo.branch[i])): i for i in range(n) if geo.branch[i] >= 0}
+        star = int(np.flatnonzero(geo.star)[0]) if geo.star.any() else None
+        around: list[tuple[int, ...]] = [()] * n
+        up: list[tuple[int, ...]] = [()] * n
+        down: list[tuple[int, ...]] = [()] * n
+        for (level, branch), i in at.items():
+            around[i] = (at[level, (branch - 1) % BRANCHES], at[level, (branch + 1) % BRANCHES])
+            if level + 1 < LEVELS:
+                up[i] = (at[level + 1, branch],)
+            elif star is not None:
+                up[i] = (star,)
+            if level > 0:
+                down[i] = (at[level - 1, branch],)
+        if star is not None:
+            down[star] = tuple(at[LEVELS - 1, b] for b in range(BRANCHES))
+        return cls(geo, tuple(around), tuple(up), tuple(down))
+
+    def _edges(self, name: str) -> tuple[tuple[int, ...], ...]:
+        if name == "clockwise":
+            return tuple(a[1:] for a in self.around)
+        if name == "anticlockwise":
+            return tuple(a[:1] for a in self.around)
+        return getattr(self, name)
+
+    def diffusion(self, rate: float, edges: tuple[str, ...] = EDGES) -> SparseOperator:
+        """
+        Each pixel moves `rate` (0..1) of the way towards the mean of its neighbours over
+        `edges`. Pixels with none keep their value.
+        """
+        rows = []
+        for i in range(self.geometry.pixels):
+            nbrs = [j for e in edges for j in self._edges(e)[i]]
+            if not nbrs:
+                rows.append({i: 1.0})
+                continue
+            row = {i: 1.0 - rate}
+            for j in nbrs:
+                row[j] = row.get(j, 0.0) + rate / len(nbrs)
+            rows.append(row)
+        return SparseOperator.from_rows(rows)
+
+    def advection(self, direction: str, rate: float) -> SparseOperator:
+        """
+        Each pixel passes `rate` (0..1) of its contents on in `direction`, split evenly
+        between the pixels there. Nothing is lost: pixels with nowhere to pass to (the
+        bottom level going down, the star going up) keep what reaches them, so contents
+        pile up there. rate=1 moves everything one step per application.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"unknown direction {direction!r}")
+        out = self._edges(direction)
+        rows: list[dict[int, float]] = [{i: 1.0 - rate if out[i] else 1.0} for i in range(self.geometry.pixels)]
+        for i, targets in enumerate(out):
+            for j in targets:
+                rows[j][i] = rows[j].get(i, 0.0) + rate / len(targets)
+        return SparseOperator.from_rows(rows)
@@ -1,9 +1,9 @@
 from __future__ import annotations
 
 from threading import Event
-from time import sleep
 
 from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.runtime import sleep
 
 
 def vintage_lights(tree: RGBXmasTree, stop: Event, speed: float = 1.0) -> None:
@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import argparse
+import colorsys
+import errno
+import select
+import socket
+import struct
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Protocol
+
+from rgbxmastree.metrics import MetricsRegistry
+
+
+# --- DDP (Distributed Display Protocol, http://www.3waylabs.com/ddp/) ---
+#
+#   byte 0    flags: VV x T S R Q P  (version 1 = 0x40, T = timecode present, P = push)
+#   byte 1    sequence number in the low 4 bits (1..15, 0 = unused)
+#   byte 2    data type (we only take 8-bit RGB)
+#   byte 3    destination id (1 = default output, 255 = all)
+#   bytes 4-7 data offset in bytes, big-endian
+#   bytes 8-9 data length, big-endian
+#   [bytes 10-13 timecode if T], then the data
+DDP_PORT = 4048
+DDP_HEADER_LEN = 10
+DDP_FLAG_VERSION_MASK = 0xC0
+DDP_FLAG_VERSION_1 = 0x40
+DDP_FLAG_TIMECODE = 0x10
+DDP_FLAG_QUERY = 0x02
+DDP_FLAG_PUSH = 0x01
+DDP_DEST_DEFAULT = 1
+DDP_DEST_ALL = 255
+
+# --- E1.31 / sACN (ANSI E1.31 data packets; sync and discovery packets are ignored) ---
+E131_PORT = 5568
+E131_ACN_ID = b"ASC-E1.17\x00\x00\x00"
+E131_DATA_OFFSET = 126
+E131_VECTOR_ROOT_DATA = 0x00000004
+E131_VECTOR_FRAMING_DATA = 0x00000002
+E131_VECTOR_DMP_SET_PROPERTY = 0x02
+E131_OPT_PREVIEW = 0x80
+E131_OPT_TERMINATED = 0x40
+E131_PIXELS_PER_UNIVERSE = 170  # 510 of the 512 DMX channels as RGB triples
+
+DEFAULT_TIMEOUT_S = 2.5
+MAX_PACKET_BYTES = 1500
+# Upper bound on packets handled per wakeup, so a flood can't postpone showing forever.
+MAX_DRAIN_PACKETS = 64
+
+
+@dataclass
+class RealtimeOptions:
+    """Where to listen for realtime pixel data. A port of 0 disables that protocol."""
+
+    host: str = "0.0.0.0"
+    ddp_port: int = DDP_PORT
+    e131_port: int = E131_PORT
+    e131_universe: int = 1
+    # How long without a complete frame before the tree goes back to its program/schedule.
+    timeout_s: float = DEFAULT_TIMEOUT_S
+
+
+class FrameSink(Protocol):
+    def write_rgb(self, first_pixel: int, data: memoryview) -> None: ...
+
+    def show(self) -> bool: ...
+
+
+class _Counters:
+    def __init__(self, metrics: MetricsRegistry, protocol: str):
+        self.packets = metrics.counter(
+            "rgbxmastree_realtime_packets_total", "Realtime packets received", protocol=protocol
+        )
+        self.lost = metrics.counter(
+            "rgbxmastree_realtime_packets_lost_total", "Packets missing from the sequence", protocol=protocol
+        )
+        self.out_of_order = metrics.counter(
+            "rgbxmastree_realtime_packets_out_of_order_total", "Late or duplicate packets discarded", protocol=protocol
+        )
+        self.invalid = metrics.counter(
+            "rgbxmastree_realtime_packets_invalid_total", "Packets that were malformed or not for us", protocol=protocol
+        )
+        self.frames = metrics.counter(
+            "rgbxmastree_realtime_frames_total", "Complete realtime frames shown", protocol=protocol
+        )
+        self.frames_dropped = metrics.counter(
+            "rgbxmastree_realtime_frames_dropped_total",
+            "Complete frames not shown (superseded by a newer one, or the tree wasn't handed over yet)",
+            protocol=protocol,
+        )
+
+
+class RealtimeReceiver:
+    """
+    UDP listener for DDP and E1.31 pixel data, on one background thread.
+
+    Packets are read into a preallocated buffer and their RGB payload handed to the sink
+    as a memoryview, which writes it straight into the tree's SPI frame. When a frame is
+    complete (DDP push flag, or the last universe of an E1.31 frame) it is shown; if
+    several frames are already queued on the socket only the newest is shown.
+    """
+
+    def __init__(self, options: RealtimeOptions, sink: FrameSink, metrics: MetricsRegistry):
+        self.options = options
+        self._sink = sink
+        self._buf = bytearray(MAX_PACKET_BYTES)
+        self._view = memoryview(self._buf)
+        self._stop = threading.Event()
+        self._sockets: dict[socket.socket, str] = {}
+        self._counters = {p: _Counters(metrics, p) for p in ("ddp", "e131")}
+
+        self._last_frame_at: float | None = None
+        self._source: str | None = None
+        self._ddp_seq: int | None = None
+        self._ddp_push_seen = False
+        self._ddp_max_end = 0
+        self._e131_seq: dict[int, int] = {}
+        self._e131_last_universe = options.e131_universe
+        self._e131_frame_top = options.e131_universe - 1  # highest universe in the frame arriving now
+
+        if options.ddp_port:
+            self._sockets[self._bind(options.host, options.ddp_port)] = "ddp"
+        if options.e131_port:
+            sock = self._bind(options.host, options.e131_port)
+            self._join_e131_multicast(sock, options.e131_universe)
+            self._sockets[sock] = "e131"
+
+        self._thread = threading.Thread(target=self._run, name="rgbxmastree-realtime", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _bind(host: str, port: int) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.setblocking(False)
+        return sock
+
+    @staticmethod
+    def _join_e131_multicast(sock: socket.socket, universe: int) -> None:
+        # sACN senders often multicast to 239.255.<universe hi>.<universe lo>.
+        group = f"239.255.{(universe >> 8) & 0xFF}.{universe & 0xFF}"
+        mreq = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton("0.0.0.0"))
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        except OSError:
+            # No multicast route (e.g. loopback-only); unicast still works.
+            pass
+
+    # ----- state -----
+
+    def receiving(self) -> bool:
+        """True while complete frames keep arriving (within the timeout)."""
+        last = self._last_frame_at
+        return last is not None and time.monotonic() - last < self.options.timeout_s
+
+    def status(self) -> dict:
+        last = self._last_frame_at
+        return {
+            "active": self.receiving(),
+            "source": self._source,
+            "last_frame_age_s": None if last is None else round(time.monotonic() - last, 3),
+        }
+
+    # ----- receive loop -----
+
+    def _run(self) -> None:
+        socks = list(self._sockets)
+        while not self._stop.is_set():
+            try:
+                readable, _, _ = select.select(socks, [], [], 0.25)
+            except (OSError, ValueError):
+                return
+            for sock in readable:
+                self._drain(sock, self._sockets[sock])
+
+    def _drain(self, sock: socket.socket, protocol: str) -> None:
+        # Read everything already queued; show only the last complete frame (latest wins).
+        counters = self._counters[protocol]
+        completed = 0
+        for _ in range(MAX_DRAIN_PACKETS):
+            try:
+                n = sock.recv_into(self._buf)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                return
+            counters.packets.inc()
+            if protocol == "ddp":
+                done = self._handle_ddp(self._view[:n], counters)
+            else:
+                done = self._handle_e131(self._view[:n], counters)
+            if done:
+                completed += 1
+        if completed:
+            if completed > 1:
+                counters.frames_dropped.inc(completed - 1)
+            self._last_frame_at = time.monotonic()
+            self._source = protocol
+            if self._sink.show():
+                counters.frames.inc()
+            else:
+                counters.frames_dropped.inc()
+
+    def _handle_ddp(self, pkt: memoryview, counters: _Counters) -> bool:
+        if len(pkt) < DDP_HEADER_LEN:
+            counters.invalid.inc()
+            return False
+        flags, seq, _dtype, dest = pkt[0], pkt[1] & 0x0F, pkt[2], pkt[3]
+        if flags & DDP_FLAG_VERSION_MASK != DDP_FLAG_VERSION_1 or flags & DDP_FLAG_QUERY:
+            counters.invalid.inc()
+            return False
+        if dest not in (DDP_DEST_DEFAULT, DDP_DEST_ALL):
+            counters.invalid.inc()
+            return False
+        offset, length = struct.unpack_from(">IH", pkt, 4)
+        start = DDP_HEADER_LEN + (4 if flags & DDP_FLAG_TIMECODE else 0)
+        data = pkt[start:start + length]
+        if len(data) != length or offset % 3:
+            counters.invalid.inc()
+            return False
+
+        if seq:
+            prev = self._ddp_seq
+            if prev is not None:
+                expected = prev % 15 + 1
+                if seq != expected:
+                    counters.lost.inc((seq - expected) % 15)
+            self._ddp_seq = seq
+
+        self._sink.write_rgb(offset // 3, data)
+        push = bool(flags & DDP_FLAG_PUSH)
+        end = offset + length
+        self._ddp_push_seen |= push
+        self._ddp_max_end = max(self._ddp_max_end, end)
+        # Senders that never set push get a frame each time the highest pixel is written.
+        return push or (not self._ddp_push_seen and end >= self._ddp_max_end)
+
+    def _handle_e131(self, pkt: memoryview, counters: _Counters) -> bool:
+        if (
+            len(pkt) <= E131_DATA_OFFSET
+            or pkt[4:16] != E131_ACN_ID
+            or struct.unpack_from(">I", pkt, 18)[0] != E131_VECTOR_ROOT_DATA
+        ):
+            counters.invalid.inc()
+            return False
+        if struct.unpack_from(">I", pkt, 40)[0] != E131_VECTOR_FRAMING_DATA:
+            return False  # sync/discovery: nothing to show
+        options, universe = pkt[112], struct.unpack_from(">H", pkt, 113)[0]
+        if options & E131_OPT_TERMINATED:
+            self._last_frame_at = None
+            return False
+        if options & E131_OPT_PREVIEW or pkt[117] != E131_VECTOR_DMP_SET_PROPERTY or pkt[125] != 0:
+            return False  # preview data or a non-zero start code (e.g. per-address priority)
+        first = universe - self.options.e131_universe
+        if first < 0:
+            counters.invalid.inc()
+            return False
+
+        seq = pkt[111]
+        prev = self._e131_seq.get(universe)
+        if prev is not None:
+            diff = (seq - prev) & 0xFF
+            if diff == 0 or diff > 236:
+                # Within 20 behind the last one: late or duplicate (E1.31 section 6.7.2).
+                counters.out_of_order.inc()
+                return False
+            if diff > 1:
+                counters.lost.inc(diff - 1)
+        self._e131_seq[universe] = seq
+
+        count = struct.unpack_from(">H", pkt, 123)[0] - 1  # property values include the start code
+        data = pkt[E131_DATA_OFFSET:E131_DATA_OFFSET + max(0, count)]
+        self._sink.write_rgb(first * E131_PIXELS_PER_UNIVERSE, data[:len(data) - len(data) % 3])
+        # A frame is complete once the highest universe in use has arrived. Senders go
+        # through their universes in order, so one at or below the last seen starts a new
+        # frame, and the one before ended at the highest universe it reached: a sender
+        # that drops universes is followed down as well as up.
+        if universe <= self._e131_frame_top:
+            self._e131_last_universe = self._e131_frame_top
+        self._e131_frame_top = universe
+        self._e131_last_universe = max(self._e131_last_universe, universe)
+        return universe == self._e131_last_universe
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        for sock in self._sockets:
+            sock.close()
+
+
+# ----- test sender -----
+
+
+def encode_ddp(seq: int, offset: int, data: bytes, push: bool = True) -> bytes:
+    flags = DDP_FLAG_VERSION_1 | (DDP_FLAG_PUSH if push else 0)
+    return struct.pack(">BBBBIH", flags, seq & 0x0F, 0x0B, DDP_DEST_DEFAULT, offset, len(data)) + data
+
+
+def encode_e131(universe: int, seq: int, data: bytes, cid: bytes, source: str = "rgbxmastree") -> bytes:
+    dmx = b"\x00" + data  # start code 0
+    dmp = struct.pack(">HBBHHH", 0x7000 | (10 + len(dmx)), E131_VECTOR_DMP_SET_PROPERTY, 0xA1, 0, 1, len(dmx)) + dmx
+    framing = (
+        struct.pack(">HI", 0x7000 | (77 + len(dmp)), E131_VECTOR_FRAMING_DATA)
+        + source.encode("utf-8")[:63].ljust(64, b"\x00")
+        + struct.pack(">BHBBH", 100, 0, seq & 0xFF, 0, universe)
+        + dmp
+    )
+    root = struct.pack(">HH", 0x0010, 0) + E131_ACN_ID + struct.pack(">HI", 0x7000 | (22 + len(framing)), E131_VECTOR_ROOT_DATA)
+    return root + cid + framing
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m rgbxmastree.realtime",
+        description="Send a rainbow to a tree running with --realtime (for testing the ingest path).",
+    )
+    parser.add_argument("--protocol", choices=("ddp", "e131"), default="ddp")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="Default: 4048 for DDP, 5568 for E1.31")
+    parser.add_argument("--universe", type=int, default=1, help="E1.31 start universe")
+    parser.add_argument("--pixels", type=int, default=25)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    port = args.port or (DDP_PORT if args.protocol == "ddp" else E131_PORT)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    cid = uuid.uuid4().bytes
+    interval = 1.0 / max(0.1, args.fps)
+    deadline = time.monotonic() + args.seconds
+    frame = 0
+    while time.monotonic() < deadline:
+        rgb = bytearray()
+        for i in range(args.pixels):
+            r, g, b = colorsys.hsv_to_rgb(((i / max(1, args.pixels)) + frame * 0.01) % 1.0, 1.0, 1.0)
+            rgb += bytes((int(r * 255), int(g * 255), int(b * 255)))
+        if args.protocol == "ddp":
+            sock.sendto(encode_ddp(frame % 15 + 1, 0, bytes(rgb)), (args.host, port))
+        else:
+            per = E131_PIXELS_PER_UNIVERSE * 3
+            for u, start in enumerate(range(0, len(rgb), per)):
+                sock.sendto(encode_e131(args.universe + u, frame, bytes(rgb[start:start + per]), cid), (args.host, port))
+        frame += 1
+        time.sleep(interval)
+    sock.close()
+    print(f"sent {frame} frames")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Callable
+
+from rgbxmastree.metrics import MetricsRegistry
+
+
+# EWMA weight used for the fps gauges (roughly the last ~20 frames).
+_FPS_ALPHA = 0.05
+
+# Adaptive pacing (see RenderContext): how far a program may compute ahead of the wall
+# clock while its output isn't changing, how far it may fall behind before its timeline is
+# re-anchored instead of caught up, and how many late frames in a row may be dropped
+# before one is sent anyway.
+MAX_AHEAD_S = 1.0
+MAX_BEHIND_S = 0.25
+MAX_LATE_SKIPS = 4
+
+_local = threading.local()
+
+
+class RenderContext:
+    """
+    Per-runner render state: frame pacing plus render-path instrumentation.
+
+    The controller creates one per program run, binds it to the runner thread and
+    installs it as the tree's `frame_observer`. Programs never touch it directly; they
+    call `rgbxmastree.runtime.sleep()` between frames and `tree.show()` as usual.
+
+    Timeline of one frame on the runner thread:
+
+        [wake] --compute--> [show start] --spi--> [show end] ... sleep(delay) ... [wake]
+
+    Sleep overshoot is how much longer than requested the sleep actually took; frame jitter
+    is how far each interval between transfers strays from the delays the program asked for.
+
+    With `adaptive=True` (controller-managed live runs) sleep() doesn't block; it moves the
+    deadline of the next frame and show() waits for that deadline instead, just before the
+    transfer. That lets the engine look at the frame before deciding to wake for it:
+
+    - a frame identical to the last one sent is not sent, and not waited for, so static or
+      slowly changing output only wakes the runner when a pixel actually changes (or every
+      MAX_AHEAD_S, so a program that never changes doesn't spin);
+    - a frame whose deadline has already passed by more than one transfer time (the
+      measured transport limit) is dropped, so a program asking for more than the bus can
+      carry skips frames and keeps its timeline instead of drifting slower and slower.
+
+    program_time() reports the pending frame's deadline, so animation still lands on the
+    timeline the program asked for.
+    """
+
+    def __init__(
+        self,
+        program_id: str,
+        metrics: MetricsRegistry | None = None,
+        *,
+        clock: Callable[[], float] = time.perf_counter,
+        sleeper: Callable[[float], None] = time.sleep,
+        on_frame: Callable[[float], None] | None = None,
+        rng: random.Random | None = None,
+        timebase: Callable[[], float] | None = None,
+        adaptive: bool = False,
+        on_idle: Callable[[float], None] | None = None,
+    ):
+        self.program_id = program_id
+        self._on_frame = on_frame
+        self.rng = rng if rng is not None else random.Random()
+        self.clock = clock
+        # What program_time() reports; defaults to `clock`. Synced trees pass their shared
+        # timeline here while `clock` stays the local one used for the frame metrics.
+        self.timebase = timebase if timebase is not None else clock
+        self._sleeper = sleeper
+        # Called on the runner thread with the length of each idle gap it is about to sleep
+        # through (low-jitter mode uses it for deferred garbage collection).
+        self._on_idle = on_idle
+        self._thread_id: int | None = None
+
+        self.adaptive = adaptive
+        if adaptive and timebase is None:
+            self.timebase = self._frame_time
+        self._deadline: float | None = None  # when the pending frame is due (adaptive only)
+        self._last_sent: bytes | None = None
+        self._late_skips = 0
+        self._transfer_ewma: float | None = None
+
+        now = clock()
+        self._frame_start = now
+        self._last_show_end: float | None = None
+        self._interval_ewma: float | None = None
+        self._requested_ewma: float | None = None
+        self._last_show_start: float | None = None
+        self._requested_since_show = 0.0
+
+        self._metrics_on = metrics is not None
+        if metrics is not None:
+            self._h_compute = metrics.histogram(
+                "rgbxmastree_frame_compute_seconds", "Time spent computing a frame before show()", program=program_id
+            )
+            self._h_spi = metrics.histogram(
+                "rgbxmastree_frame_spi_seconds", "Time spent in show() transferring the frame", program=program_id
+            )
+            self._h_overshoot = metrics.histogram(
+                "rgbxmastree_sleep_overshoot_seconds", "Actual minus requested inter-frame sleep", program=program_id
+            )
+            self._h_jitter = metrics.histogram(
+                "rgbxmastree_frame_jitter_seconds",
+                "Difference between each interval between frames and the delay requested for it",
+                program=program_id,
+            )
+            self._c_frames = metrics.counter("rgbxmastree_frames_total", "Frames sent to the tree", program=program_id)
+            self._g_fps = metrics.gauge("rgbxmastree_fps_achieved", "Achieved frames per second", program=program_id)
+            self._g_fps_nominal = metrics.gauge(
+                "rgbxmastree_fps_nominal", "Frames per second implied by the requested sleep", program=program_id
+            )
+            if adaptive:
+                self._c_wakeups = metrics.counter(
+                    "rgbxmastree_render_wakeups_total", "Times the runner actually slept", program=program_id
+                )
+                self._c_skip_static = metrics.counter(
+                    "rgbxmastree_frames_skipped_total",
+                    "Frames not sent to the tree",
+                    program=program_id,
+                    reason="unchanged",
+                )
+                self._c_skip_late = metrics.counter(
+                    "rgbxmastree_frames_skipped_total", "Frames not sent to the tree", program=program_id, reason="late"
+                )
+                self._g_fps_limit = metrics.gauge(
+                    "rgbxmastree_fps_transport_limit", "Frames per second the measured transfer time allows",
+                    program=program_id,
+                )
+
+    # ----- runner-thread binding -----
+
+    def bind(self) -> None:
+        """Make this the current context for the calling (runner) thread."""
+        self._thread_id = threading.get_ident()
+        self._frame_start = self.clock()
+        _local.ctx = self
+
+    def unbind(self) -> None:
+        if getattr(_local, "ctx", None) is self:
+            _local.ctx = None
+
+    # ----- pacing -----
+
+    def _frame_time(self) -> float:
+        now = self.clock()
+        deadline = self._deadline
+        return deadline if deadline is not None and deadline > now else now
+
+    def _wait_until(self, deadline: float) -> float:
+        """Sleep until `deadline` (adaptive mode); returns how long that took."""
+        start = self.clock()
+        if deadline > start and self._on_idle is not None:
+            self._on_idle(deadline - start)
+        now = self.clock()
+        if deadline > now:
+            self._sleeper(deadline - now)
+            now = self.clock()
+            if self._metrics_on:
+                self._c_wakeups.inc()
+                self._h_overshoot.observe(max(0.0, now - deadline))
+        return now - start
+
+    def _observe_requested(self, requested: float) -> None:
+        r = self._requested_ewma
+        self._requested_ewma = requested if r is None else r + _FPS_ALPHA * (requested - r)
+        self._g_fps_nominal.set(1.0 / self._requested_ewma)
+
+    def sleep(self, seconds: float) -> None:
+        requested = max(0.0, float(seconds))
+        self._requested_since_show += requested
+        if self.adaptive:
+            now = self.clock()
+            deadline = self._deadline
+            if deadline is None or deadline < now - MAX_BEHIND_S:
+                # Too far behind to catch up by dropping frames: accept the lag, start afresh.
+                deadline = now
+            deadline += requested
+            self._deadline = deadline
+            if deadline - now >= MAX_AHEAD_S:
+                # Nothing has needed showing for a while (a pause, or a frozen scene): catch up.
+                self._wait_until(deadline)
+            self._frame_start = self.clock()
+            if self._metrics_on and requested > 0.0:
+                self._observe_requested(requested)
+            return
+        if self._on_idle is not None and requested > 0.0:
+            # Not taken off the sleep: deadline-based sleepers (sync pacers) absorb it anyway.
+            self._on_idle(requested)
+        start = self.clock()
+        self._sleeper(requested)
+        woke = self.clock()
+        self._frame_start = woke
+        if self._metrics_on:
+            self._h_overshoot.observe(max(0.0, (woke - start) - requested))
+            if requested > 0.0:
+                self._observe_requested(requested)
+
+    # ----- tree.frame_observer protocol -----
+
+    def frame_ready(self, frame) -> bool:
+        """
+        Called by show() before a transfer with the frame's SPI bytes (any iterable of ints);
+        returns False to skip the transfer. Only adaptive runs on the runner thread ever skip,
+        and for them this is where the runner waits for the frame's deadline.
+        """
+        if not self.adaptive or threading.get_ident() != self._thread_id:
+            return True
+        key = bytes(frame)
+        if key == self._last_sent:
+            if self._metrics_on:
+                self._c_skip_static.inc()
+            return False
+        deadline = self._deadline
+        if deadline is not None:
+            late = self.clock() - deadline
+            limit = self._transfer_ewma
+            if limit is not None and late > limit and self._late_skips < MAX_LATE_SKIPS:
+                self._late_skips += 1
+                if self._metrics_on:
+                    self._c_skip_late.inc()
+                return False
+            # Keep the wait out of the compute histogram.
+            self._frame_start += self._wait_until(deadline)
+        self._late_skips = 0
+        self._last_sent = key
+        return True
+
+    def frame_shown(self, start: float, end: float) -> None:
+        """
+        Called by RGBXmasTree.show() after each transfer (on whichever thread showed).
+        """
+        if self._on_frame is not None:
+            self._on_frame(end)
+        if self.adaptive:
+            t = self._transfer_ewma
+            self._transfer_ewma = t = (end - start) if t is None else t + _FPS_ALPHA * ((end - start) - t)
+            if self._metrics_on and t > 0.0:
+                self._g_fps_limit.set(1.0 / t)
+        if not self._metrics_on:
+            return
+        self._h_spi.observe(end - start)
+        self._c_frames.inc()
+        if threading.get_ident() != self._thread_id:
+            # e.g. the supervisor pushing a brightness change; not part of the program's frame loop.
+            return
+        self._h_compute.observe(max(0.0, start - self._frame_start))
+        self._frame_start = end
+        requested, self._requested_since_show = self._requested_since_show, 0.0
+        last_start, self._last_show_start = self._last_show_start, start
+        if last_start is not None and requested > 0.0:
+            self._h_jitter.observe(abs((start - last_start) - requested))
+        last = self._last_show_end
+        self._last_show_end = end
+        if last is not None and end > last:
+            dt = end - last
+            ew = self._interval_ewma
+            self._interval_ewma = dt if ew is None else ew + _FPS_ALPHA * (dt - ew)
+            self._g_fps.set(1.0 / self._interval_ewma)
+
+
+class VirtualClock:
+    """
+    Clock that only advances when slept on. Lets headless tools (benchmarks, golden
+    frames) run programs flat out while they still see a consistent timeline.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = float(start)
+
+    def now(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        self._now += max(0.0, float(seconds))
+
+
+def run_headless(
+    tree,
+    runner: Callable,
+    speed: float,
+    stop: threading.Event,
+    *,
+    program_id: str = "headless",
+    seed: int | None = None,
+    max_wall_s: float | None = None,
+) -> tuple[float, VirtualClock]:
+    """
+    Run a program on the calling thread against a VirtualClock, with a seeded RNG.
+
+    The caller decides when to stop (typically from a `tree.frame_observer` that sets
+    `stop` after N frames). `max_wall_s` is a safety net for programs that stop showing
+    frames. Returns (wall seconds spent, the virtual clock).
+    """
+    clock = VirtualClock()
+    wall_start = time.perf_counter()
+
+    def _sleep(seconds: float) -> None:
+        clock.sleep(seconds)
+        if max_wall_s is not None and time.perf_counter() - wall_start > max_wall_s:
+            stop.set()
+
+    ctx = RenderContext(program_id, clock=clock.now, sleeper=_sleep, rng=random.Random(seed))
+    ctx.bind()
+    try:
+        runner(tree, stop, speed)
+    finally:
+        ctx.unbind()
+    return time.perf_counter() - wall_start, clock
+
+
+def current() -> RenderContext | None:
+    """Return the RenderContext bound to the calling thread, if any."""
+    return getattr(_local, "ctx", None)
+
+
+def program_rng() -> random.Random:
+    """
+    Random source for the running program. Programs should draw all randomness from this
+    (never the `random` module directly) so runs can be seeded and reproduced.
+    """
+    ctx = getattr(_local, "ctx", None)
+    return ctx.rng if ctx is not None else random.Random()
+
+
+def program_time() -> float:
+    """
+    Current time on the running program's clock, in seconds (arbitrary epoch). Use this
+    instead of time.time() for time-based animation so runs can be replayed.
+    """
+    ctx = getattr(_local, "ctx", None)
+    return ctx.timebase() if ctx is not None else time.monotonic()
+
+
+def sleep(seconds: float) -> None:
+    """
+    Inter-frame sleep for programs. Use this instead of `time.sleep` so the engine can
+    pace and measure frames; outside a controller-managed runner it is plain time.sleep.
+    """
+    ctx = getattr(_local, "ctx", None)
+    if ctx is None:
+        time.sleep(seconds)
+    else:
+        ctx.sleep(seconds)
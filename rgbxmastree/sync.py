@@ -0,0 +1,446 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import select
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from rgbxmastree.metrics import MetricsRegistry
+
+
+# Leader/follower sync for several trees in one room.
+#
+# Every synced tree runs its program on a shared *timeline*: program time starts at 0 at
+# the timeline's epoch, each `sleep(d)` advances it by d and then waits until the shared
+# clock reaches epoch + program time, and the RNG is seeded from the timeline. Programs
+# are deterministic given time and seed (the golden-frame files rely on the same thing),
+# so every tree renders the same frame at the same moment without sending any pixels.
+#
+# The leader is a normal tree. It multicasts a *beat* every BEAT_INTERVAL_S with its clock,
+# the current timeline (generation, epoch, seed, program, speed) and on/off/brightness.
+# Followers take those settings instead of their own while beats arrive, and estimate the
+# leader's clock NTP-style: a unicast ping (t1) answered with the leader's receive and send
+# times (t2, t3), received at t4, gives
+#
+#   offset = ((t2 - t1) + (t3 - t4)) / 2      delay = (t4 - t1) - (t3 - t2)
+#
+# The offset of the lowest-delay sample in the last OFFSET_WINDOW is used; jitter is the
+# RMS difference of the window's offsets from it. Clocks are time.monotonic().
+#
+# Packets: MAGIC | kind | payload
+#   b"B" beat: JSON object
+#   b"P" ping: u64 id, f64 t1                    (follower -> leader, unicast)
+#   b"Q" pong: u64 id, f64 t1, f64 t2, f64 t3    (leader -> follower)
+SYNC_MAGIC = b"RGBXSYN1"
+SYNC_GROUP = "239.255.72.84"
+SYNC_PORT = 5570
+BEAT_INTERVAL_S = 0.1
+PING_INTERVAL_S = 1.0
+DEFAULT_LEADER_TIMEOUT_S = 2.0
+OFFSET_WINDOW = 8
+# A new timeline starts this far in the future, so followers hear of it before frame 0.
+START_LEAD_S = 0.25
+# A follower joining a timeline that started longer ago than this doesn't replay it: it
+# starts at the current timeline position (time-based programs are still in phase).
+MAX_CATCHUP_S = 2.0
+# Behind the timeline, frames are rendered back to back to catch up; after this many in a
+# row (a busy program joined late, or a tree too slow to keep up) the pacer jumps to the
+# current position instead, so a catch-up never floods the CPU and the SPI bus.
+MAX_CATCHUP_FRAMES = 120
+MAX_PACKET_BYTES = 1500
+
+_PING = struct.Struct(">Qd")
+_PONG = struct.Struct(">Qddd")
+
+
+@dataclass
+class SyncOptions:
+    role: str  # "leader" or "follower"
+    group: str = SYNC_GROUP
+    port: int = SYNC_PORT
+    # Local address of the interface to multicast on ("0.0.0.0" lets the OS pick).
+    interface: str = "0.0.0.0"
+    # Followers go back to their own settings after this long without a beat.
+    timeout_s: float = DEFAULT_LEADER_TIMEOUT_S
+
+
+@dataclass(frozen=True)
+class Timeline:
+    leader: str
+    generation: int
+    epoch: float  # on the leader's clock
+    seed: int
+    program_id: str
+    speed: float
+
+
+@dataclass(frozen=True)
+class LeaderState:
+    timeline: Timeline
+    on: bool
+    body_pct: int
+    star_pct: int
+
+
+class TimelinePacer:
+    """
+    Clock and sleeper for a program running on a shared timeline (see the module comment);
+    passed to RenderContext as `timebase` and `sleeper`.
+    """
+
+    def __init__(self, now: Callable[[], float], timeline: Timeline, stop: threading.Event):
+        self._now = now
+        self._epoch = timeline.epoch
+        self._stop = stop
+        behind = now() - timeline.epoch
+        self.position = behind if behind > MAX_CATCHUP_S else 0.0
+        self._behind_frames = 0
+
+    def time(self) -> float:
+        return self.position
+
+    def wait_start(self) -> None:
+        """Block until the timeline reaches the current position (frame 0 for a new one)."""
+        self._wait_until(self._epoch + self.position)
+
+    def sleep(self, seconds: float) -> None:
+        self.position += max(0.0, float(seconds))
+        behind = self._now() - (self._epoch + self.position)
+        if behind <= 0.0:
+            self._behind_frames = 0
+            self._wait_until(self._epoch + self.position)
+            return
+        # Behind (joined late, or a slow frame): don't wait, so the program catches up.
+        self._behind_frames += 1
+        if self._behind_frames >= MAX_CATCHUP_FRAMES:
+            self.position += behind
+            self._behind_frames = 0
+
+    def _wait_until(self, shared_t: float) -> None:
+        remaining = shared_t - self._now()
+        if remaining > 0.0:
+            self._stop.wait(remaining)
+
+
+class TreeSync:
+    """
+    One tree's end of the sync protocol, on a background thread. The controller asks it for
+    the shared clock (`now`), the timeline to run programs on, and (followers) the leader's
+    settings; leaders start timelines and publish their settings.
+    """
+
+    def __init__(self, options: SyncOptions, metrics: MetricsRegistry, on_change: Callable[[], None] | None = None):
+        if options.role not in ("leader", "follower"):
+            raise ValueError(f"unknown sync role {options.role!r}")
+        self.options = options
+        self.role = options.role
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._id = uuid.uuid4().hex[:12]
+
+        # leader
+        self._generation = 0
+        self._timeline: Timeline | None = None
+        self._published: tuple[bool, int, int] = (False, 50, 50)
+        self._beat_seq = 0
+        self._beat_now = threading.Event()
+
+        # follower
+        self._leader: LeaderState | None = None
+        self._leader_addr: tuple[str, int] | None = None
+        self._last_beat_at: float | None = None
+        self._last_beat_seq: int | None = None
+        self._offset: float | None = None
+        self._delay: float | None = None
+        self._jitter: float | None = None
+        self._samples: deque[tuple[float, float]] = deque(maxlen=OFFSET_WINDOW)
+        self._ping_id = 0
+        self._pending_pings: dict[int, float] = {}
+
+        self._c_beats = metrics.counter("rgbxmastree_sync_beats_total", "Sync beats sent (leader) or received (follower)")
+        self._c_beats_lost = metrics.counter("rgbxmastree_sync_beats_lost_total", "Beats missing from the leader's sequence")
+        self._c_timelines = metrics.counter("rgbxmastree_sync_timelines_total", "Timelines started or followed")
+        self._g_offset = metrics.gauge("rgbxmastree_sync_offset_seconds", "Estimated leader clock minus local clock")
+        self._g_delay = metrics.gauge("rgbxmastree_sync_delay_seconds", "Round-trip delay of the offset sample in use")
+        self._g_jitter = metrics.gauge("rgbxmastree_sync_jitter_seconds", "RMS spread of recent offset samples")
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.role == "leader":
+            self._sock.bind((options.interface, 0))
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(options.interface))
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            self._sockets = [self._sock]
+        else:
+            # Several followers may share a host (and the port); pings use a socket of their own
+            # so the leader's unicast replies reach the follower that asked.
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self._sock.bind(("", options.port))
+            mreq = struct.pack("4s4s", socket.inet_aton(options.group), socket.inet_aton(options.interface))
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            self._ping_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._ping_sock.bind(("", 0))
+            self._sockets = [self._sock, self._ping_sock]
+        for sock in self._sockets:
+            sock.setblocking(False)
+
+        self._thread = threading.Thread(target=self._run, name=f"rgbxmastree-sync-{self.role}", daemon=True)
+        self._thread.start()
+
+    # ----- clock -----
+
+    def now(self) -> float:
+        """The shared clock: the leader's time.monotonic() (as best a follower can tell)."""
+        offset = self._offset if self.role == "follower" else None
+        return time.monotonic() + (offset or 0.0)
+
+    def pacer(self, timeline: Timeline, stop: threading.Event) -> TimelinePacer:
+        return TimelinePacer(self.now, timeline, stop)
+
+    # ----- leader -----
+
+    def start_timeline(self, program_id: str, speed: float) -> Timeline:
+        """Leader: start a fresh timeline for a program (re)start and announce it right away."""
+        with self._lock:
+            self._generation += 1
+            self._timeline = Timeline(
+                leader=self._id,
+                generation=self._generation,
+                epoch=self.now() + START_LEAD_S,
+                seed=random.getrandbits(32),
+                program_id=program_id,
+                speed=float(speed),
+            )
+            timeline = self._timeline
+        self._c_timelines.inc()
+        self._beat_now.set()
+        return timeline
+
+    def publish(self, on: bool, body_pct: int, star_pct: int) -> None:
+        """Leader: settings for followers, sent with every beat."""
+        state = (bool(on), int(body_pct), int(star_pct))
+        if state != self._published:
+            self._published = state
+            self._beat_now.set()
+
+    # ----- follower -----
+
+    def leader_state(self) -> LeaderState | None:
+        """Follower: the leader's settings, or None if no leader has been heard recently."""
+        with self._lock:
+            if self._leader is None or self._last_beat_at is None:
+                return None
+            if time.monotonic() - self._last_beat_at > self.options.timeout_s:
+                return None
+            return self._leader
+
+    def status(self) -> dict:
+        def _ms(v: float | None) -> float | None:
+            return None if v is None else round(v * 1000.0, 3)
+
+        if self.role == "leader":
+            with self._lock:
+                timeline = self._timeline
+            return {
+                "role": "leader",
+                "generation": timeline.generation if timeline is not None else None,
+            }
+        state = self.leader_state()
+        return {
+            "role": "follower",
+            "following": state is not None,
+            "leader": f"{self._leader_addr[0]}:{self._leader_addr[1]}" if state is not None and self._leader_addr else None,
+            "generation": state.timeline.generation if state is not None else None,
+            "offset_ms": _ms(self._offset),
+            "delay_ms": _ms(self._delay),
+            "jitter_ms": _ms(self._jitter),
+        }
+
+    # ----- network thread -----
+
+    def _run(self) -> None:
+        next_beat = next_ping = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if self.role == "leader":
+                if self._beat_now.is_set() or now >= next_beat:
+                    self._beat_now.clear()
+                    self._send_beat()
+                    next_beat = time.monotonic() + BEAT_INTERVAL_S
+                timeout = max(0.0, min(next_beat - time.monotonic(), 0.02))
+            else:
+                if self._leader_addr is not None and now >= next_ping:
+                    self._send_ping()
+                    next_ping = now + PING_INTERVAL_S
+                timeout = max(0.0, min(next_ping - now, 0.1))
+            try:
+                readable, _, _ = select.select(self._sockets, [], [], timeout)
+            except (OSError, ValueError):
+                return
+            for sock in readable:
+                self._drain(sock)
+
+    def _drain(self, sock: socket.socket) -> None:
+        while True:
+            try:
+                data, addr = sock.recvfrom(MAX_PACKET_BYTES)
+            except BlockingIOError:
+                return
+            except OSError:
+                return
+            received = time.monotonic()
+            if not data.startswith(SYNC_MAGIC) or len(data) <= len(SYNC_MAGIC):
+                continue
+            kind = data[len(SYNC_MAGIC)]
+            payload = data[len(SYNC_MAGIC) + 1:]
+            if self.role == "leader" and kind == ord("P") and len(payload) == _PING.size:
+                ping_id, t1 = _PING.unpack(payload)
+                pong = _PONG.pack(ping_id, t1, received, time.monotonic())
+                self._send(sock, SYNC_MAGIC + b"Q" + pong, addr)
+            elif self.role == "follower" and kind == ord("B"):
+                self._handle_beat(payload, addr, received)
+            elif self.role == "follower" and kind == ord("Q") and len(payload) == _PONG.size:
+                self._handle_pong(payload, received)
+
+    @staticmethod
+    def _send(sock: socket.socket, data: bytes, addr) -> None:
+        try:
+            sock.sendto(data, addr)
+        except OSError:
+            pass  # network down; the next beat/ping tries again
+
+    def _send_beat(self) -> None:
+        with self._lock:
+            timeline = self._timeline
+        self._beat_seq += 1
+        on, body_pct, star_pct = self._published
+        beat = {
+            "leader": self._id,
+            "seq": self._beat_seq,
+            "t": time.monotonic(),
+            "on": on and timeline is not None,
+            "body_pct": body_pct,
+            "star_pct": star_pct,
+        }
+        if timeline is not None:
+            beat.update(
+                generation=timeline.generation,
+                epoch=timeline.epoch,
+                seed=timeline.seed,
+                program_id=timeline.program_id,
+                speed=timeline.speed,
+            )
+        self._send(self._sock, SYNC_MAGIC + b"B" + json.dumps(beat).encode("utf-8"), (self.options.group, self.options.port))
+        self._c_beats.inc()
+
+    def _handle_beat(self, payload: bytes, addr, received: float) -> None:
+        try:
+            beat = json.loads(payload)
+            leader = str(beat["leader"])
+            seq = int(beat["seq"])
+            timeline = None
+            if "generation" in beat:
+                timeline = Timeline(
+                    leader=leader,
+                    generation=int(beat["generation"]),
+                    epoch=float(beat["epoch"]),
+                    seed=int(beat["seed"]),
+                    program_id=str(beat["program_id"]),
+                    speed=float(beat["speed"]),
+                )
+            state = LeaderState(timeline, bool(beat["on"]), int(beat["body_pct"]), int(beat["star_pct"]))
+            leader_t = float(beat["t"])
+        except (ValueError, KeyError, TypeError):
+            return
+        if timeline is None:
+            return  # leader hasn't started a program yet
+        self._c_beats.inc()
+        with self._lock:
+            previous = self._leader
+            new_leader = previous is None or previous.timeline.leader != leader
+            if not new_leader and self._last_beat_seq is not None and seq > self._last_beat_seq + 1:
+                self._c_beats_lost.inc(seq - self._last_beat_seq - 1)
+            if new_leader:
+                # Until a ping comes back, the one-way estimate (off by the network delay) will do.
+                self._samples.clear()
+                self._offset = leader_t - received
+                self._delay = self._jitter = None
+            self._leader = state
+            self._leader_addr = addr
+            self._last_beat_seq = seq
+            was_lost = self._last_beat_at is None or received - self._last_beat_at > self.options.timeout_s
+            self._last_beat_at = received
+        if previous is None or previous.timeline != timeline:
+            self._c_timelines.inc()
+        if was_lost or previous is None or (previous.timeline, previous.on, previous.body_pct, previous.star_pct) != (
+            timeline, state.on, state.body_pct, state.star_pct
+        ):
+            if self._on_change is not None:
+                self._on_change()
+
+    def _send_ping(self) -> None:
+        self._ping_id += 1
+        t1 = time.monotonic()
+        self._pending_pings = {k: v for k, v in self._pending_pings.items() if t1 - v < 5.0}
+        self._pending_pings[self._ping_id] = t1
+        self._send(self._ping_sock, SYNC_MAGIC + b"P" + _PING.pack(self._ping_id, t1), self._leader_addr)
+
+    def _handle_pong(self, payload: bytes, t4: float) -> None:
+        ping_id, t1, t2, t3 = _PONG.unpack(payload)
+        if self._pending_pings.pop(ping_id, None) != t1:
+            return
+        offset = ((t2 - t1) + (t3 - t4)) / 2.0
+        delay = max(0.0, (t4 - t1) - (t3 - t2))
+        with self._lock:
+            self._samples.append((delay, offset))
+            best_delay, best_offset = min(self._samples)
+            self._offset = best_offset
+            self._delay = best_delay
+            self._jitter = math.sqrt(sum((o - best_offset) ** 2 for _, o in self._samples) / len(self._samples))
+        self._g_offset.set(self._offset)
+        self._g_delay.set(self._delay)
+        self._g_jitter.set(self._jitter)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        for sock in self._sockets:
+            sock.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m rgbxmastree.sync",
+        description="Watch sync traffic: print each follower-side clock estimate as it updates.",
+    )
+    parser.add_argument("--group", default=SYNC_GROUP)
+    parser.add_argument("--port", type=int, default=SYNC_PORT)
+    parser.add_argument("--interface", default="0.0.0.0", help="Local address of the multicast interface")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    sync = TreeSync(SyncOptions("follower", args.group, args.port, args.interface), MetricsRegistry())
+    deadline = time.monotonic() + args.seconds
+    try:
+        while time.monotonic() < deadline:
+            time.sleep(1.0)
+            print(json.dumps(sync.status()))
+    finally:
+        sync.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
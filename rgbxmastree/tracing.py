@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+
+from rgbxmastree.metrics import MetricsRegistry
+
+
+MAX_RECENT_TRACES = 50
+
+# Pending traces older than this are dropped (e.g. tree stayed dark, nothing was drawn).
+PENDING_TRACE_TIMEOUT_S = 30.0
+
+
+@dataclass
+class CommandTrace:
+    """
+    One config mutation followed from the HTTP request to the first frame that reflects it.
+
+    All timestamps are time.perf_counter() values.
+    """
+
+    trace_id: str
+    kind: str
+    received: float
+    version: int | None = None
+    saved: float | None = None
+    picked_up: float | None = None
+    applied: float | None = None
+    restarted: bool = False
+    first_frame: float | None = None
+
+    def stages(self) -> dict[str, float]:
+        """Per-stage durations (seconds) for the stages this trace reached."""
+        out: dict[str, float] = {}
+        if self.saved is not None:
+            out["save"] = self.saved - self.received
+            if self.picked_up is not None:
+                out["queue"] = max(0.0, self.picked_up - self.saved)
+                if self.applied is not None:
+                    out["apply"] = self.applied - self.picked_up
+                    if self.first_frame is not None:
+                        out["frame"] = max(0.0, self.first_frame - self.applied)
+        end = self.first_frame if self.first_frame is not None else self.applied
+        if end is not None:
+            out["total"] = end - self.received
+        return out
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "kind": self.kind,
+            "config_version": self.version,
+            "restarted": self.restarted,
+            "frame_shown": self.first_frame is not None,
+            "stages_ms": {k: round(v * 1000.0, 3) for k, v in self.stages().items()},
+        }
+
+
+class CommandTracer:
+    """
+    Tracks config mutations through: received -> saved -> picked up by the supervisor
+    -> applied (incl. program restart) -> first frame shown.
+
+    Completed traces feed `rgbxmastree_command_latency_seconds{kind,stage}` histograms.
+    """
+
+    def __init__(self, metrics: MetricsRegistry):
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        self._pending: list[CommandTrace] = []   # saved, not yet applied
+        self._applied: list[CommandTrace] = []   # applied, waiting for a frame
+        self._recent: deque[dict] = deque(maxlen=MAX_RECENT_TRACES)
+
+    def start(self, kind: str, received: float | None = None, trace_id: str | None = None) -> CommandTrace:
+        return CommandTrace(
+            trace_id=trace_id or uuid.uuid4().hex[:16],
+            kind=kind,
+            received=time.perf_counter() if received is None else received,
+        )
+
+    def saved(self, trace: CommandTrace, version: int) -> None:
+        trace.version = version
+        trace.saved = time.perf_counter()
+        with self._lock:
+            self._pending.append(trace)
+
+    def applied(self, version: int, picked_up: float, restarted: bool = False) -> None:
+        """Supervisor has acted on every config version up to and including `version`."""
+        if not self._pending and not self._applied:
+            return
+        now = time.perf_counter()
+        stale: list[CommandTrace] = []
+        with self._lock:
+            waiting = []
+            for t in self._applied:
+                (stale if now - t.received > PENDING_TRACE_TIMEOUT_S else waiting).append(t)
+            self._applied = waiting
+            keep = []
+            for t in self._pending:
+                if t.version is not None and t.version <= version:
+                    t.picked_up = max(picked_up, t.saved or picked_up)
+                    t.applied = now
+                    t.restarted = restarted
+                    self._applied.append(t)
+                elif now - t.received > PENDING_TRACE_TIMEOUT_S:
+                    continue
+                else:
+                    keep.append(t)
+            self._pending = keep
+        for t in stale:
+            self._finish(t)
+
+    def frame_shown(self, end: float) -> None:
+        """Frame observer hook: completes every applied trace. Cheap when idle."""
+        if not self._applied:
+            return
+        with self._lock:
+            # A transfer that finished before the change was applied can't reflect it.
+            done = [t for t in self._applied if t.applied is not None and end >= t.applied]
+            if not done:
+                return
+            self._applied = [t for t in self._applied if not (t.applied is not None and end >= t.applied)]
+        for t in done:
+            t.first_frame = end
+            self._finish(t)
+
+    def complete_without_frame(self) -> None:
+        """Applied traces that will never see a frame (tree switched off)."""
+        if not self._applied:
+            return
+        with self._lock:
+            done, self._applied = self._applied, []
+        for t in done:
+            self._finish(t)
+
+    def _finish(self, t: CommandTrace) -> None:
+        for stage, seconds in t.stages().items():
+            self._metrics.histogram(
+                "rgbxmastree_command_latency_seconds",
+                "Config command latency by stage, from HTTP request to first frame",
+                kind=t.kind,
+                stage=stage,
+            ).observe(seconds)
+        self._recent.append(t.to_dict())
+
+    def recent(self) -> list[dict]:
+        return list(self._recent)
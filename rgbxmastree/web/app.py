@@ -1,69 +1,365 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
 from datetime import datetime
+from typing import Callable
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, abort, g, jsonify, request
 
+from rgbxmastree.audio import AudioOptions
 from rgbxmastree.config import ScheduleBlock, MAX_SCHEDULE_BLOCKS
 from rgbxmastree.controller import TreeController
+from rgbxmastree.hardware.tree import RGBXmasTree
+from rgbxmastree.ingest import IngestOptions
+from rgbxmastree.images import ImageLibrary
+from rgbxmastree.lowjitter import LowJitterOptions
+from rgbxmastree.patterns import PatternLibrary
+from rgbxmastree.preview import PREVIEW_DEFAULT_FPS, clamp_fps, preview_stream
+from rgbxmastree.profiler import format_collapsed, sample_stacks
 from rgbxmastree.programs import PROGRAMS
+from rgbxmastree.realtime import RealtimeOptions
 from rgbxmastree.scheduler import is_within_schedule
-
-
-def create_app(config_path: str) -> Flask:
+from rgbxmastree.sync import SyncOptions
+from rgbxmastree.web.assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, Asset, StaticAssets, pick_encoding
+
+
+TRACED_PATHS = frozenset({
+    "/api/mode",
+    "/api/program",
+    "/api/speed",
+    "/api/countdown",
+    "/api/schedule",
+    "/api/brightness",
+    "/api/config",
+})
+CONFIG_PATCH_FIELDS = frozenset({"mode", "program_id", "program_speed", "brightness"})
+
+# Long-lived responses (/api/events, /api/preview) each pin one server worker thread, so
+# together they are capped at the worker count less STREAM_FREE_THREADS, which are always
+# left for ordinary requests; clients over the cap get 503 (the UI falls back to polling).
+# Keepalives let dead clients be noticed (the write fails) and stop proxies timing out.
+DEFAULT_THREADS = 4  # waitress's default
+STREAM_FREE_THREADS = 2
+EVENT_KEEPALIVE_S = 15.0
+EVENT_RETRY_MS = 3000
+
+
+def sse_state_event(seq: int, state: dict) -> str:
+    data = json.dumps(state, separators=(",", ":"))
+    return f"id: {seq}\nevent: state\ndata: {data}\n\n"
+
+
+def create_app(
+    config_path: str,
+    tree_factory: Callable[[], RGBXmasTree] = RGBXmasTree,
+    realtime: RealtimeOptions | None = None,
+    ingest: IngestOptions | None = None,
+    sync: SyncOptions | None = None,
+    adaptive_pacing: bool = True,
+    low_jitter: LowJitterOptions | None = None,
+    patterns_path: str | None = None,
+    audio: AudioOptions | None = None,
+    images_path: str | None = None,
+    threads: int = DEFAULT_THREADS,
+) -> Flask:
+    # Static files are served by the /static route below (hashed names, precompressed).
     app = Flask(
         __name__,
-        static_folder="static",
+        static_folder=None,
         template_folder="templates",
     )
-
-    controller = TreeController(config_path=config_path)
+    assets = StaticAssets(os.path.join(app.root_path, "static"))
+    index_page = assets.page(os.path.join(app.root_path, app.template_folder, "index.html"))
+    # /api/state ETags are "<instance>-<change seq>": the controller's change counter moves
+    # whenever anything in the payload except `now` does (subsystem measurements once they
+    # move noticeably: see _status_digest in controller.py). The instance part keeps a
+    # restarted server from matching ETags handed out by the previous process.
+    state_etag_prefix = secrets.token_hex(4)
+    catalogue_cache: dict[tuple, tuple[str, dict]] = {}
+
+    # Saved patterns are registered before the controller starts, so a configured one runs at once.
+    patterns = PatternLibrary(patterns_path or os.path.join(os.path.dirname(config_path) or ".", "patterns.json"))
+    app.extensions["rgbxmastree_patterns"] = patterns
+    images = ImageLibrary(images_path or os.path.join(os.path.dirname(config_path) or ".", "images"))
+
+    controller = TreeController(
+        config_path=config_path,
+        tree_factory=tree_factory,
+        realtime=realtime,
+        ingest=ingest,
+        sync=sync,
+        adaptive_pacing=adaptive_pacing,
+        low_jitter=low_jitter,
+        audio=audio,
+    )
     app.extensions["rgbxmastree_controller"] = controller
     SPEED_MIN = 0.1
     SPEED_MAX = 200.0
+    profile_lock = threading.Lock()
+    streams_lock = threading.Lock()
+    max_streams = max(0, threads - STREAM_FREE_THREADS)
+    open_streams = {"events": 0, "preview": 0}
+    g_streams = {
+        kind: controller.metrics.gauge("rgbxmastree_open_streams", "Open streaming responses", kind=kind)
+        for kind in open_streams
+    }
+
+    def _open_stream(kind: str) -> bool:
+        with streams_lock:
+            if sum(open_streams.values()) >= max_streams:
+                return False
+            open_streams[kind] += 1
+            g_streams[kind].set(open_streams[kind])
+            return True
+
+    def _close_stream(kind: str) -> None:
+        with streams_lock:
+            open_streams[kind] -= 1
+            g_streams[kind].set(open_streams[kind])
+
+    @app.before_request
+    def _start_trace():
+        # Config mutations are traced from here to the first frame that reflects them.
+        if request.method in ("POST", "PATCH") and request.path in TRACED_PATHS:
+            g.trace = controller.tracer.start(
+                kind=request.path.rsplit("/", 1)[-1],
+                received=time.perf_counter(),
+                trace_id=request.headers.get("X-Trace-Id"),
+            )
+
+    @app.after_request
+    def _trace_header(resp):
+        trace = g.get("trace")
+        if trace is not None:
+            resp.headers["X-Trace-Id"] = trace.trace_id
+        return resp
+
+    def _update(mutate):
+        return controller.update_config(mutate, trace=g.get("trace"))
 
     @app.get("/health")
     def health():
         return {"ok": True}
 
+    def _send_asset(asset: Asset, cache_control: str) -> Response:
+        if request.if_none_match.contains_weak(asset.etag):
+            resp = Response(status=304)
+        else:
+            encoding = pick_encoding(request.headers.get("Accept-Encoding", ""), asset.variants)
+            resp = Response(asset.variants[encoding], content_type=asset.mimetype)
+            if encoding != "identity":
+                resp.headers["Content-Encoding"] = encoding
+        resp.set_etag(asset.etag, weak=True)
+        resp.headers["Cache-Control"] = cache_control
+        resp.headers["Vary"] = "Accept-Encoding"
+        return resp
+
     @app.get("/")
     def index():
-        return send_from_directory(app.template_folder, "index.html")
+        return _send_asset(index_page, REVALIDATE_CACHE_CONTROL)
 
-    @app.get("/api/state")
-    def api_state():
+    @app.get("/static/<path:filename>")
+    def static_file(filename: str):
+        found = assets.lookup(filename)
+        if found is None:
+            abort(404)
+        asset, immutable = found
+        return _send_asset(asset, IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL)
+
+    def _state_payload() -> dict:
         cfg = controller.get_config()
         now = datetime.now()
-        return jsonify(
-            {
-                "now": now.isoformat(timespec="seconds"),
-                "mode": cfg.mode,
-                "program_id": cfg.program_id,
-                "program_speed": cfg.program_speed,
-                "program_speed_min": SPEED_MIN,
-                "program_speed_max": SPEED_MAX,
-                "brightness": {
-                    "body_pct": cfg.body_brightness_pct,
-                    "star_pct": cfg.star_brightness_pct,
-                },
-                "schedule_blocks": [
-                    {
-                        "start_hhmm": b.start_hhmm,
-                        "end_hhmm": b.end_hhmm,
-                        "days": b.days,
-                        "enabled": b.enabled,
-                    }
-                    for b in cfg.schedule_blocks
-                ],
-                "in_window_now": is_within_schedule(now, cfg.schedule_blocks),
-                "countdown_until": cfg.countdown_until,
-                "programs": [
-                    {"id": p.id, "name": p.name, "default_speed": p.default_speed}
-                    for p in PROGRAMS.values()
-                ],
-                "runtime": controller.get_runtime_state(),
-            }
-        )
+        return {
+            "now": now.isoformat(timespec="seconds"),
+            "mode": cfg.mode,
+            "program_id": cfg.program_id,
+            "program_speed": cfg.program_speed,
+            "program_speed_min": SPEED_MIN,
+            "program_speed_max": SPEED_MAX,
+            "brightness": {
+                "body_pct": cfg.body_brightness_pct,
+                "star_pct": cfg.star_brightness_pct,
+            },
+            "schedule_blocks": [
+                {
+                    "start_hhmm": b.start_hhmm,
+                    "end_hhmm": b.end_hhmm,
+                    "days": b.days,
+                    "enabled": b.enabled,
+                }
+                for b in cfg.schedule_blocks
+            ],
+            "in_window_now": is_within_schedule(now, cfg.schedule_blocks),
+            "countdown_until": cfg.countdown_until,
+            "runtime": controller.get_runtime_state(),
+            # Lets the page reload its program list when patterns are added or removed.
+            "programs_version": _catalogue()[0],
+        }
+
+    # The asyncio server (web/asyncio_server.py) streams /api/events itself.
+    app.extensions["rgbxmastree_state_payload"] = _state_payload
+
+    def _catalogue() -> tuple[str, dict]:
+        # Keyed on the catalogue's contents so programs registered at runtime show up.
+        key = tuple((p.id, p.name, p.default_speed) for p in PROGRAMS.values())
+        cached = catalogue_cache.get(key)
+        if cached is None:
+            programs = [{"id": pid, "name": name, "default_speed": speed} for pid, name, speed in key]
+            version = hashlib.sha256(json.dumps(programs, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+            cached = (version, {"version": version, "programs": programs})
+            catalogue_cache.clear()
+            catalogue_cache[key] = cached
+        return cached
+
+    @app.get("/api/programs")
+    def api_programs():
+        version, body = _catalogue()
+        if request.if_none_match.contains_weak(version):
+            resp = Response(status=304)
+        else:
+            resp = jsonify(body)
+        resp.set_etag(version, weak=True)
+        resp.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        return resp
+
+    @app.get("/api/patterns")
+    def api_patterns():
+        return jsonify({"patterns": patterns.list()})
+
+    @app.get("/api/images")
+    def api_images():
+        return jsonify({"images": images.list(), "skipped": images.skipped})
+
+    @app.post("/api/patterns")
+    def api_put_pattern():
+        data = request.get_json(force=True, silent=True)
+        try:
+            spec = patterns.put(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except OSError as e:
+            return jsonify({"error": f"could not save patterns: {e.strerror or e}"}), 507
+        controller.program_changed(spec.id)
+        return jsonify({"ok": True, "program_id": spec.id})
+
+    @app.delete("/api/patterns/<pattern_id>")
+    def api_remove_pattern(pattern_id: str):
+        try:
+            removed = patterns.remove(pattern_id)
+        except OSError as e:
+            return jsonify({"error": f"could not save patterns: {e.strerror or e}"}), 507
+        if not removed:
+            return jsonify({"error": "unknown pattern"}), 404
+        if controller.get_config().program_id == pattern_id:
+            _update(lambda c: setattr(c, "program_id", "rgb_cycle"))
+        controller.program_changed(pattern_id)
+        return jsonify({"ok": True})
+
+    @app.get("/api/state")
+    def api_state():
+        # Read the change counter before building the payload, so a change racing with this
+        # request yields an older ETag (and a refetch next time), never a stale body.
+        etag = f"{state_etag_prefix}-{controller.change_seq()}"
+        if request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+        else:
+            resp = jsonify(_state_payload())
+        resp.set_etag(etag, weak=True)
+        resp.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        return resp
+
+    @app.get("/api/events")
+    def api_events():
+        if not _open_stream("events"):
+            return jsonify({"error": "too many open streams"}), 503
+
+        def _stream():
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            seq = controller.change_seq()
+            while True:
+                yield sse_state_event(seq, _state_payload())
+                while True:
+                    latest = controller.wait_for_change(seq, EVENT_KEEPALIVE_S)
+                    if latest is None:
+                        return
+                    if latest != seq:
+                        seq = latest
+                        break
+                    yield ": keepalive\n\n"
+
+        resp = Response(_stream(), mimetype="text/event-stream")
+        # Released when the server closes the response, which also happens when the client
+        # goes away before the first chunk (a generator's finally would never run then).
+        resp.call_on_close(lambda: _close_stream("events"))
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Accel-Buffering"] = "no"
+        return resp
+
+    @app.get("/api/preview")
+    def api_preview():
+        try:
+            fps = float(request.args.get("fps", PREVIEW_DEFAULT_FPS))
+        except ValueError:
+            return jsonify({"error": "invalid fps"}), 400
+        fps = clamp_fps(fps)
+        if not _open_stream("preview"):
+            return jsonify({"error": "too many open streams"}), 503
+        controller.open_preview()
+
+        def _release():
+            controller.close_preview()
+            _close_stream("preview")
+
+        stream = preview_stream(controller.shown_frame, fps, controller.closing)
+        resp = Response(stream, mimetype="application/octet-stream")
+        # As for /api/events: released on close, whether or not streaming ever started.
+        resp.call_on_close(_release)
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Accel-Buffering"] = "no"
+        return resp
+
+    @app.get("/api/errors")
+    def api_errors():
+        return jsonify(controller.get_errors())
+
+    @app.get("/api/metrics")
+    def api_metrics():
+        # Prometheus scrapers ask for text/plain (or OpenMetrics); browsers/scripts get JSON.
+        fmt = request.args.get("format")
+        accept = request.headers.get("Accept", "")
+        if fmt == "prometheus" or (fmt is None and ("text/plain" in accept or "openmetrics" in accept)):
+            return Response(controller.metrics.to_prometheus(), mimetype="text/plain; version=0.0.4")
+        return jsonify(controller.metrics.to_json())
+
+    @app.get("/api/traces")
+    def api_traces():
+        return jsonify({"recent": controller.tracer.recent()})
+
+    @app.post("/api/profile")
+    def api_profile():
+        data = request.get_json(force=True, silent=True) or {}
+        try:
+            seconds = float(data.get("seconds", 5))
+            hz = float(data.get("hz", 100))
+        except Exception:
+            return jsonify({"error": "invalid seconds/hz"}), 400
+        if controller.runner_thread_id() is None:
+            return jsonify({"error": "no program running"}), 409
+        # One profile at a time: each one holds a server worker thread for its duration.
+        if not profile_lock.acquire(blocking=False):
+            return jsonify({"error": "profile already in progress"}), 409
+        try:
+            stacks, samples = sample_stacks(controller.runner_thread_id, seconds, hz)
+        finally:
+            profile_lock.release()
+        resp = Response(format_collapsed(stacks), mimetype="text/plain")
+        resp.headers["X-Profile-Samples"] = str(samples)
+        return resp
 
     @app.post("/api/mode")
     def api_mode():
@@ -72,7 +368,7 @@ def create_app(config_path: str) -> Flask:
         if mode not in ("manual_on", "manual_off", "auto"):
             return jsonify({"error": "invalid mode"}), 400
 
-        cfg = controller.update_config(lambda c: setattr(c, "mode", mode))
+        cfg = _update(lambda c: setattr(c, "mode", mode))
         return jsonify({"ok": True, "mode": cfg.mode})
 
     @app.post("/api/program")
@@ -87,7 +383,7 @@ def create_app(config_path: str) -> Flask:
             if "program_speed" in data:
                 c.program_speed = float(data["program_speed"])
 
-        cfg = controller.update_config(_mut)
+        cfg = _update(_mut)
         return jsonify({"ok": True, "program_id": cfg.program_id, "program_speed": cfg.program_speed})
 
     @app.post("/api/speed")
@@ -98,7 +394,7 @@ def create_app(config_path: str) -> Flask:
         except Exception:
             return jsonify({"error": "invalid program_speed"}), 400
         speed = max(SPEED_MIN, min(SPEED_MAX, speed))
-        cfg = controller.update_config(lambda c: setattr(c, "program_speed", speed))
+        cfg = _update(lambda c: setattr(c, "program_speed", speed))
         return jsonify({"ok": True, "program_speed": cfg.program_speed})
 
     @app.post("/api/countdown")
@@ -107,7 +403,7 @@ def create_app(config_path: str) -> Flask:
         now = datetime.now()
 
         if data.get("clear"):
-            cfg = controller.update_config(lambda c: c.clear_countdown())
+            cfg = _update(lambda c: c.clear_countdown())
             return jsonify({"ok": True, "countdown_until": cfg.countdown_until})
 
         try:
@@ -119,7 +415,7 @@ def create_app(config_path: str) -> Flask:
         def _mut(c):
             c.set_countdown_minutes(minutes, now=now)
 
-        cfg = controller.update_config(_mut)
+        cfg = _update(_mut)
         return jsonify({"ok": True, "countdown_until": cfg.countdown_until})
 
     @app.post("/api/schedule")
@@ -158,7 +454,7 @@ def create_app(config_path: str) -> Flask:
         def _mut(c):
             c.schedule_blocks = schedule_blocks
 
-        cfg = controller.update_config(_mut)
+        cfg = _update(_mut)
         return jsonify({
             "ok": True,
             "schedule_blocks": [
@@ -197,7 +493,7 @@ def create_app(config_path: str) -> Flask:
             if star_pct is not None:
                 c.star_brightness_pct = star_pct
 
-        cfg = controller.update_config(_mut)
+        cfg = _update(_mut)
         return jsonify(
             {
                 "ok": True,
@@ -205,12 +501,71 @@ def create_app(config_path: str) -> Flask:
             }
         )
 
+    @app.patch("/api/config")
+    def api_config_patch():
+        # Scene changes in one request: everything is validated first, then written once,
+        # so the supervisor sees a single config change (at most one program restart).
+        data = request.get_json(force=True, silent=True)
+        if not isinstance(data, dict) or not data:
+            return jsonify({"error": "body must be a non-empty object"}), 400
+        unknown = sorted(set(data) - CONFIG_PATCH_FIELDS)
+        if unknown:
+            return jsonify({"error": f"unknown field(s): {', '.join(unknown)}"}), 400
+
+        mode = data.get("mode")
+        if "mode" in data and mode not in ("manual_on", "manual_off", "auto"):
+            return jsonify({"error": "invalid mode"}), 400
+        program_id = data.get("program_id")
+        if "program_id" in data and program_id not in PROGRAMS:
+            return jsonify({"error": "invalid program_id"}), 400
+        speed = None
+        if "program_speed" in data:
+            try:
+                speed = max(SPEED_MIN, min(SPEED_MAX, float(data["program_speed"])))
+            except Exception:
+                return jsonify({"error": "invalid program_speed"}), 400
+        brightness = data.get("brightness", {})
+        if not isinstance(brightness, dict) or set(brightness) - {"body_pct", "star_pct"}:
+            return jsonify({"error": "brightness must be an object with body_pct/star_pct"}), 400
+        pct: dict[str, int] = {}
+        for key, value in brightness.items():
+            try:
+                pct[key] = max(0, min(100, int(float(value))))
+            except Exception:
+                return jsonify({"error": f"invalid brightness.{key}"}), 400
+
+        def _mut(c):
+            if mode is not None:
+                c.mode = mode
+            if program_id is not None:
+                c.program_id = program_id
+            if speed is not None:
+                c.program_speed = speed
+            if "body_pct" in pct:
+                c.body_brightness_pct = pct["body_pct"]
+            if "star_pct" in pct:
+                c.star_brightness_pct = pct["star_pct"]
+
+        cfg = _update(_mut)
+        return jsonify(
+            {
+                "ok": True,
+                "mode": cfg.mode,
+                "program_id": cfg.program_id,
+                "program_speed": cfg.program_speed,
+                "brightness": {"body_pct": cfg.body_brightness_pct, "star_pct": cfg.star_brightness_pct},
+            }
+        )
+
     @app.teardown_appcontext
     def _teardown(_exc):
         # In production this runs on each request; controller is long-lived.
         # We keep it alive for the life of the process; shutdown handled by atexit.
         return None
 
+    if controller.low_jitter is not None:
+        # Freeze everything built so far (routes, assets, programs): it lives as long as the process.
+        controller.low_jitter.start()
     return app
 
 
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass
+
+try:
+    import brotli  # optional: `pip install brotli` adds br-encoded variants
+except ImportError:
+    brotli = None
+
+
+# Hashed asset URLs change whenever the content does, so clients may keep them forever.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Everything else is revalidated (cheaply, via ETag/304) on each use.
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Compression isn't worth it below this size.
+MIN_COMPRESS_BYTES = 256
+HASH_LEN = 10
+
+
+@dataclass(frozen=True)
+class Asset:
+    name: str
+    hashed_name: str
+    mimetype: str
+    etag: str
+    # Content-Encoding ("identity", "gzip", "br") -> body, all computed once up front.
+    variants: dict[str, bytes]
+
+
+def _make_asset(name: str, data: bytes) -> Asset:
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LEN]
+    stem, ext = os.path.splitext(name)
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if mimetype.startswith("text/") or mimetype in ("application/javascript", "application/json"):
+        mimetype += "; charset=utf-8"
+    variants = {"identity": data}
+    if len(data) >= MIN_COMPRESS_BYTES:
+        gz = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(gz) < len(data):
+            variants["gzip"] = gz
+        if brotli is not None:
+            br = brotli.compress(data, quality=11)
+            if len(br) < len(data):
+                variants["br"] = br
+    return Asset(name=name, hashed_name=f"{stem}.{digest}{ext}", mimetype=mimetype, etag=digest, variants=variants)
+
+
+def pick_encoding(accept_encoding: str, available) -> str:
+    """Best of `available` the client accepts (br > gzip > identity), honouring q=0."""
+    accepted: set[str] = set()
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0.0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(token)
+    for encoding in ("br", "gzip"):
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+class StaticAssets:
+    """
+    The web UI's static files, loaded, hashed and compressed once at startup.
+
+    Each file is served under its plain name (revalidated) and a content-hashed name such as
+    `app.3f2a9c1b0d.js` (cached for a year); pages reference the hashed names via `page()`.
+    """
+
+    def __init__(self, folder: str):
+        self._by_name: dict[str, Asset] = {}
+        self._by_hashed: dict[str, Asset] = {}
+        for root, _dirs, files in os.walk(folder):
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, folder).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    asset = _make_asset(name, f.read())
+                self._by_name[name] = asset
+                self._by_hashed[asset.hashed_name] = asset
+
+    def url(self, name: str) -> str:
+        return f"/static/{self._by_name[name].hashed_name}"
+
+    def lookup(self, requested: str) -> tuple[Asset, bool] | None:
+        """Return (asset, immutable) for a request path under /static/, or None."""
+        asset = self._by_hashed.get(requested)
+        if asset is not None:
+            return asset, True
+        asset = self._by_name.get(requested)
+        if asset is not None:
+            return asset, False
+        return None
+
+    def page(self, path: str) -> Asset:
+        """Load an HTML page with its /static/ references rewritten to hashed URLs."""
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        for name in self._by_name:
+            html = html.replace(f'"/static/{name}"', f'"{self.url(name)}"')
+        return _make_asset(os.path.basename(path), html.encode("utf-8"))
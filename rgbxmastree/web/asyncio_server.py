@@ -0,0 +1,400 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote_to_bytes, urlsplit
+
+from flask import Flask
+
+from rgbxmastree.controller import TreeController
+from rgbxmastree.preview import PREVIEW_DEFAULT_FPS, PREVIEW_KEEPALIVE_S, PreviewEncoder, clamp_fps, keepalive_message
+from rgbxmastree.web.app import EVENT_KEEPALIVE_S, EVENT_RETRY_MS, sse_state_event
+
+
+# An asyncio HTTP/1.1 front end for the Flask app (`--server asyncio`).
+#
+# The two long-lived endpoints, /api/events and /api/preview, are served by coroutines on
+# the event loop, so an idle stream costs a socket and a few KB instead of a worker thread.
+# Every other request is handed to the Flask app (WSGI) on a small thread pool; those
+# responses are short, so the pool never fills up with streams.
+MAX_ASYNC_STREAMS = 256
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+IDLE_TIMEOUT_S = 75.0
+BODY_TIMEOUT_S = 30.0
+SERVER_NAME = "rgbxmastree"
+
+# Managed by this server; hop-by-hop headers from the WSGI app are dropped.
+_HOP_BY_HOP = frozenset({"connection", "keep-alive", "transfer-encoding", "content-length", "date", "server"})
+
+
+def _unbounded(environ: dict, status: str, headers: list[tuple[str, str]]) -> bool:
+    """
+    True for a WSGI response with a body of no declared length, i.e. a generator. Flask
+    gives every finite body (bytes, JSON, assets) a Content-Length; HEAD responses and
+    bodiless statuses come with an empty iterable whatever the view returned.
+    """
+    code = int(status.split(" ", 1)[0])
+    if environ["REQUEST_METHOD"] == "HEAD" or code < 200 or code in (204, 304):
+        return False
+    return not any(k.lower() == "content-length" for k, _ in headers)
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _Request:
+    def __init__(self, method: str, target: str, version: str, headers: list[tuple[str, str]]):
+        self.method = method
+        self.version = version
+        self.headers = headers
+        split = urlsplit(target)
+        self.raw_path = split.path or "/"
+        # Decoded as the WSGI app sees it (PATH_INFO), so "/api/%65vents" is /api/events.
+        self.path = unquote_to_bytes(self.raw_path).decode("latin-1")
+        self.query = split.query
+        self.body = b""
+
+    def header(self, name: str, default: str = "") -> str:
+        name = name.lower()
+        values = [v for k, v in self.headers if k.lower() == name]
+        return ", ".join(values) if values else default
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.header("Connection").lower()
+        if self.version == "HTTP/1.0":
+            return "keep-alive" in connection
+        return "close" not in connection
+
+
+class AsyncioServer:
+    """Serves one Flask app created by `create_app`; see the module comment."""
+
+    def __init__(self, app: Flask, threads: int = 4):
+        self.app = app
+        self.controller: TreeController = app.extensions["rgbxmastree_controller"]
+        self._state_payload = app.extensions["rgbxmastree_state_payload"]
+        self._executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="rgbxmastree-http")
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._changed: asyncio.Event | None = None
+        # (change seq, future state payload): every events client waiting on the same change
+        # shares one payload, built once on the pool.
+        self._state: tuple[int, asyncio.Future] | None = None
+        self._open = {"events": 0, "preview": 0}
+        self._g_streams = {
+            kind: self.controller.metrics.gauge("rgbxmastree_open_streams", "Open streaming responses", kind=kind)
+            for kind in self._open
+        }
+        self._streams = {
+            ("GET", "/api/events"): self._events,
+            ("GET", "/api/preview"): self._preview,
+        }
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        """Start listening on the running loop; serve() runs it until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self.controller.add_change_listener(self._on_change)
+        return await asyncio.start_server(self._connection, host, port, limit=MAX_HEADER_BYTES)
+
+    def stop(self) -> None:
+        self.controller.remove_change_listener(self._on_change)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await self.start(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop()
+
+    # ----- change fan-out -----
+
+    def _on_change(self) -> None:
+        # Controller threads -> loop: one callback per change however many clients listen.
+        try:
+            self._loop.call_soon_threadsafe(self._wake_listeners)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def _wake_listeners(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _state_for(self, seq: int) -> asyncio.Future:
+        if self._state is None or self._state[0] != seq:
+            self._state = (seq, self._loop.run_in_executor(self._executor, self._state_payload))
+        return self._state[1]
+
+    # ----- connections -----
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername") or ("", 0)
+        try:
+            while True:
+                try:
+                    req = await self._read_request(reader, writer)
+                except _HttpError as e:
+                    await self._send_simple(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    return
+                if req is None:
+                    return
+                handler = self._streams.get((req.method, req.path))
+                if handler is not None:
+                    await self._stream(handler, req, reader, writer)
+                    return
+                if not await self._wsgi(req, peer, writer):
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> _Request | None:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT_S)
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.TimeoutError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise _HttpError(431, "request header too large") from None
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise _HttpError(400, "malformed request line") from None
+        if version not in ("HTTP/1.0", "HTTP/1.1"):
+            raise _HttpError(505, "unsupported HTTP version")
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep or not name or name != name.strip():
+                raise _HttpError(400, "malformed header")
+            headers.append((name, value.strip()))
+        req = _Request(method, target, version, headers)
+
+        if req.header("Transfer-Encoding"):
+            raise _HttpError(411, "chunked request bodies are not supported; send Content-Length")
+        try:
+            length = int(req.header("Content-Length", "0"))
+        except ValueError:
+            raise _HttpError(400, "invalid Content-Length") from None
+        if length < 0:
+            raise _HttpError(400, "invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise _HttpError(413, "request body too large")
+        if length:
+            if req.header("Expect").lower() == "100-continue":
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            try:
+                req.body = await asyncio.wait_for(reader.readexactly(length), BODY_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                raise _HttpError(408, "timed out reading the request body") from None
+        return req
+
+    def _head(self, status: int, headers: list[tuple[str, str]], keep_alive: bool) -> bytes:
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ""
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines += [f"{k}: {v}" for k, v in headers]
+        lines.append(f"Date: {formatdate(usegmt=True)}")
+        lines.append(f"Server: {SERVER_NAME}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_simple(self, writer: asyncio.StreamWriter, status: int, body: dict, keep_alive: bool) -> None:
+        data = json.dumps(body).encode("utf-8")
+        headers = [("Content-Type", "application/json"), ("Content-Length", str(len(data)))]
+        writer.write(self._head(status, headers, keep_alive) + data)
+        await writer.drain()
+
+    # ----- WSGI bridge -----
+
+    def _environ(self, req: _Request, peer, writer: asyncio.StreamWriter) -> dict:
+        sockname = writer.get_extra_info("sockname") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": req.method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": req.path,
+            "QUERY_STRING": req.query,
+            "SERVER_NAME": str(sockname[0]),
+            "SERVER_PORT": str(sockname[1]),
+            "SERVER_PROTOCOL": req.version,
+            "REMOTE_ADDR": str(peer[0]),
+            "REMOTE_PORT": str(peer[1]),
+            "CONTENT_LENGTH": str(len(req.body)) if req.body else "",
+            "CONTENT_TYPE": req.header("Content-Type"),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(req.body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, _value in req.headers:
+            key = "HTTP_" + name.upper().replace("-", "_")
+            if key not in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH") and key not in environ:
+                environ[key] = req.header(name)
+        return environ
+
+    def _call_app(self, environ: dict) -> tuple[int, list[tuple[str, str]], bytes]:
+        started: list = []
+        chunks: list[bytes] = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [status, headers]
+            return chunks.append
+
+        result = self.app(environ, start_response)
+        try:
+            if started and _unbounded(environ, started[0], started[1]):
+                # A stream that got past the stream table: reading it would hold this pool
+                # thread for as long as the generator runs (forever, for the SSE one).
+                body = json.dumps({"error": "streaming responses are not served here"}).encode("utf-8")
+                return 500, [("Content-Type", "application/json")], body
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+        status, headers = started
+        return int(status.split(" ", 1)[0]), headers, b"".join(chunks)
+
+    async def _wsgi(self, req: _Request, peer, writer: asyncio.StreamWriter) -> bool:
+        environ = self._environ(req, peer, writer)
+        status, app_headers, body = await self._loop.run_in_executor(self._executor, self._call_app, environ)
+        headers = [(k, v) for k, v in app_headers if k.lower() not in _HOP_BY_HOP]
+        if status >= 200 and status not in (204, 304):
+            headers.append(("Content-Length", str(len(body))))
+        if req.method == "HEAD" or status < 200 or status in (204, 304):
+            body = b""
+        keep_alive = req.keep_alive and not self.controller.closing()
+        writer.write(self._head(status, headers, keep_alive) + body)
+        await writer.drain()
+        return keep_alive
+
+    # ----- streams -----
+
+    async def _stream(self, handler, req: _Request, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # A streaming response ends the connection; the client sending EOF (or anything
+        # else) ends the stream, so dead clients are noticed without waiting for a write.
+        task = asyncio.ensure_future(handler(req, writer))
+        hangup = asyncio.ensure_future(reader.read(1))
+        try:
+            await asyncio.wait({task, hangup}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for t in (task, hangup):
+                t.cancel()
+            await asyncio.gather(task, hangup, return_exceptions=True)
+
+    def _open_stream(self, kind: str) -> bool:
+        if sum(self._open.values()) >= MAX_ASYNC_STREAMS:
+            return False
+        self._open[kind] += 1
+        self._g_streams[kind].set(self._open[kind])
+        return True
+
+    def _close_stream(self, kind: str) -> None:
+        self._open[kind] -= 1
+        self._g_streams[kind].set(self._open[kind])
+
+    async def _start_stream(self, req: _Request, writer: asyncio.StreamWriter, content_type: str):
+        chunked = req.version == "HTTP/1.1"
+        headers = [("Content-Type", content_type), ("Cache-Control", "no-cache"), ("X-Accel-Buffering", "no")]
+        if chunked:
+            headers.append(("Transfer-Encoding", "chunked"))
+        writer.write(self._head(200, headers, keep_alive=False))
+
+        async def send(data: bytes) -> None:
+            if chunked:
+                data = b"%x\r\n%s\r\n" % (len(data), data)
+            writer.write(data)
+            await writer.drain()
+
+        return send
+
+    async def _events(self, req: _Request, writer: asyncio.StreamWriter) -> None:
+        if not self._open_stream("events"):
+            await self._send_simple(writer, 503, {"error": "too many open streams"}, keep_alive=False)
+            return
+        try:
+            send = await self._start_stream(req, writer, "text/event-stream")
+            await send(f"retry: {EVENT_RETRY_MS}\n\n".encode("utf-8"))
+            seq = self.controller.change_seq()
+            while True:
+                state = await self._state_for(seq)
+                await send(sse_state_event(seq, state).encode("utf-8"))
+                while True:
+                    # Take the event before reading the counter, so a change between the
+                    # two still wakes us.
+                    changed = self._changed
+                    if self.controller.closing():
+                        return
+                    latest = self.controller.change_seq()
+                    if latest != seq:
+                        seq = latest
+                        break
+                    try:
+                        await asyncio.wait_for(changed.wait(), EVENT_KEEPALIVE_S)
+                    except asyncio.TimeoutError:
+                        await send(b": keepalive\n\n")
+        finally:
+            self._close_stream("events")
+
+    async def _preview(self, req: _Request, writer: asyncio.StreamWriter) -> None:
+        try:
+            fps = float(parse_qs(req.query).get("fps", [PREVIEW_DEFAULT_FPS])[0])
+        except ValueError:
+            await self._send_simple(writer, 400, {"error": "invalid fps"}, keep_alive=False)
+            return
+        interval = 1.0 / clamp_fps(fps)
+        if not self._open_stream("preview"):
+            await self._send_simple(writer, 503, {"error": "too many open streams"}, keep_alive=False)
+            return
+        self.controller.open_preview()
+        try:
+            send = await self._start_stream(req, writer, "application/octet-stream")
+            encoder = PreviewEncoder()
+            last_sent = time.monotonic()
+            while not self.controller.closing():
+                msg = encoder.encode(self.controller.shown_frame())
+                if msg is not None:
+                    last_sent = time.monotonic()
+                    await send(msg)
+                elif time.monotonic() - last_sent >= PREVIEW_KEEPALIVE_S:
+                    last_sent = time.monotonic()
+                    await send(keepalive_message())
+                await asyncio.sleep(interval)
+        finally:
+            self.controller.close_preview()
+            self._close_stream("preview")
+
+
+def serve_asyncio(app: Flask, host: str, port: int, threads: int = 4) -> None:
+    """Run `app` on the asyncio server until interrupted."""
+    server = AsyncioServer(app, threads=threads)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+
+from flask import Flask, Response, jsonify, request
+
+from rgbxmastree.fleet import DEFAULT_NODE_TIMEOUT_S, Fleet, FleetNode
+from rgbxmastree.programs import PROGRAMS
+from rgbxmastree.web.app import TRACED_PATHS
+
+
+# Commands accepted by /api/fleet/<command>: the tree API's config mutations, forwarded as-is
+# with the method the tree's route takes (PATCH for /api/config, POST for the rest).
+FLEET_COMMANDS = {
+    path.rsplit("/", 1)[-1]: "PATCH" if path == "/api/config" else "POST" for path in TRACED_PATHS
+}
+
+
+def create_fleet_app(registry_path: str) -> Flask:
+    app = Flask(__name__, static_folder=None)
+    fleet = Fleet(registry_path)
+    app.extensions["rgbxmastree_fleet"] = fleet
+
+    def _targets() -> list[str] | None:
+        # ?nodes=hall,porch limits a command to some nodes.
+        raw = request.args.get("nodes")
+        if not raw:
+            return None
+        return [n.strip() for n in raw.split(",") if n.strip()]
+
+    def _check_targets(names: list[str] | None) -> tuple[Response, int] | None:
+        """An error response unless the command would reach at least one node, and only known ones."""
+        known = {n.name for n in fleet.nodes()}
+        if not known:
+            return jsonify({"error": "no nodes registered"}), 404
+        unknown = [n for n in names or () if n not in known]
+        if unknown or names == []:
+            return jsonify({"error": f"unknown nodes: {', '.join(unknown) or '(none named)'}"}), 404
+        return None
+
+    @app.get("/health")
+    def health():
+        return {"ok": True}
+
+    @app.get("/api/fleet/nodes")
+    def api_nodes():
+        return jsonify({"nodes": [{"name": n.name, "url": n.url, "timeout_s": n.timeout_s} for n in fleet.nodes()]})
+
+    @app.post("/api/fleet/nodes")
+    def api_add_node():
+        data = request.get_json(force=True, silent=True) or {}
+        name = data.get("name")
+        url = data.get("url")
+        if not isinstance(name, str) or not isinstance(url, str):
+            return jsonify({"error": "name and url required"}), 400
+        try:
+            timeout_s = float(data.get("timeout_s", DEFAULT_NODE_TIMEOUT_S))
+        except Exception:
+            return jsonify({"error": "invalid timeout_s"}), 400
+        try:
+            fleet.add_node(FleetNode(name=name, url=url.rstrip("/"), timeout_s=max(0.1, min(30.0, timeout_s))))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"ok": True})
+
+    @app.delete("/api/fleet/nodes/<name>")
+    def api_remove_node(name: str):
+        if not fleet.remove_node(name):
+            return jsonify({"error": "unknown node"}), 404
+        return jsonify({"ok": True})
+
+    @app.get("/api/fleet/state")
+    def api_fleet_state():
+        return jsonify(fleet.state())
+
+    @app.get("/api/fleet/programs")
+    def api_fleet_programs():
+        # Only programs every reachable node has can be selected fleet-wide.
+        names = _targets()
+        error = _check_targets(names) if names is not None else None
+        if error is not None:
+            return error
+        results = [r for r in fleet.fan_out("GET", "/api/programs", names=names) if r.ok]
+        catalogues = [
+            {p["id"]: p for p in r.body.get("programs", [])} for r in results if isinstance(r.body, dict)
+        ]
+        if not catalogues:
+            common = [{"id": p.id, "name": p.name, "default_speed": p.default_speed} for p in PROGRAMS.values()]
+        else:
+            common = [p for pid, p in catalogues[0].items() if all(pid in c for c in catalogues[1:])]
+        return jsonify({"programs": common, "nodes": len(catalogues)})
+
+    @app.route("/api/fleet/<command>", methods=["POST", "PATCH"])
+    def api_fleet_command(command: str):
+        path = f"/api/{command}"
+        method = FLEET_COMMANDS.get(command)
+        if method is None:
+            return jsonify({"error": f"unknown command (one of: {', '.join(sorted(FLEET_COMMANDS))})"}), 404
+        if request.method != method:
+            # Every node would answer 405; say so here instead of a fleet-wide 502.
+            return jsonify({"error": f"{command} takes {method}"}), 405, {"Allow": method}
+        names = _targets()
+        error = _check_targets(names)
+        if error is not None:
+            return error
+        # Forwarded verbatim: each node validates it exactly as it would a direct request.
+        body = request.get_data() or b"{}"
+        headers = {}
+        if request.headers.get("X-Trace-Id"):
+            headers["X-Trace-Id"] = request.headers["X-Trace-Id"]
+        results = fleet.fan_out(method, path, body=body, names=names, headers=headers)
+        ok = sum(1 for r in results if r.ok)
+        # 200 when every node took it, 207 when only some did, 502 when none did.
+        status = 200 if ok == len(results) else 207 if ok else 502
+        payload = {"ok": ok == len(results), "results": {r.node: r.to_json() for r in results}}
+        return Response(json.dumps(payload), status=status, mimetype="application/json")
+
+    return app
@@ -24,6 +24,11 @@ function clamp(n, lo, hi) { return Math.max(lo, Math.min(hi, n)); }
 let speedBounds = { min: 0.1, max: 200.0 };
 let speedReady = false;
 
+// Latest state from the server, and the push stream delivering it (null if unsupported).
+let lastState = null;
+let events = null;
+let pollTimer = null;
+
 // Schedule blocks state (editable in UI before saving)
 let scheduleBlocks = [];
 let savedScheduleBlocks = [];  // Last saved state for comparison
@@ -104,8 +109,12 @@ function fmtCountdown(untilIso) {
 function setStatusLine(state) {
   const now = new Date(state.now);
   const modeLabel = state.mode === "manual_on" ? "On" : state.mode === "manual_off" ? "Off" : "Auto";
-  const running = state.runtime?.program_running ? `Running: ${state.runtime.program_id ?? ""}` : "Stopped";
-  const inWindow = state.in_window_now ? "in schedule" : "out of schedule";
+  const running = state.runtime?.realtime?.active
+    ? `Realtime (${state.runtime.realtime.source})`
+    : state.runtime?.program_running ? `Running: ${state.runtime.program_id ?? ""}` : "Stopped";
+  const inWindow = state.runtime?.sync?.following
+    ? `following ${state.runtime.sync.leader}`
+    : state.in_window_now ? "in schedule" : "out of schedule";
   $("statusLine").textContent = `${modeLabel} • ${running} • ${inWindow} • ${now.toLocaleTimeString([], {hour: "2-digit", minute: "2-digit"})}`;
 }
 
@@ -237,26 +246,72 @@ async function saveScheduleBlocks() {
     // Update saved state to match current after successful save
     savedScheduleBlocks = JSON.parse(JSON.stringify(scheduleBlocks));
     renderScheduleBlocks(false);  // Not dirty anymore
-    await refresh();
+    await afterChange();
   } catch (err) {
     alert(err.message);
   }
 }
 
 async function refresh() {
-  const state = await apiGet("/api/state");
+  applyState(await apiGet("/api/state"));
+}
 
-  // programs
+// After a change the event stream pushes the new state; only fetch it ourselves without one.
+async function afterChange() {
+  if (events && events.readyState === EventSource.OPEN) return;
+  await refresh();
+}
+
+function startPolling() {
+  if (pollTimer === null) pollTimer = setInterval(() => refresh().catch(() => {}), 5000);
+}
+
+function stopPolling() {
+  if (pollTimer !== null) {
+    clearInterval(pollTimer);
+    pollTimer = null;
+  }
+}
+
+function subscribe() {
+  if (!window.EventSource) {
+    startPolling();
+    return;
+  }
+  events = new EventSource("/api/events");
+  events.addEventListener("state", (e) => applyState(JSON.parse(e.data)));
+  events.addEventListener("open", stopPolling);
+  // EventSource reconnects by itself; poll until it does. If the server refused the stream
+  // (e.g. 503 at its stream limit) it stays closed and we keep polling.
+  events.addEventListener("error", startPolling);
+}
+
+// The catalogue is served separately (ETag-ed) since it rarely changes; the state carries
+// its version, so patterns added or removed elsewhere show up here too.
+let programsVersion = null;
+async function loadPrograms() {
+  const { programs, version } = await apiGet("/api/programs");
+  programsVersion = version;
   const sel = $("programSelect");
-  if (sel.options.length === 0) {
-    for (const p of state.programs) {
-      const opt = document.createElement("option");
-      opt.value = p.id;
-      opt.textContent = p.name;
-      sel.appendChild(opt);
-    }
+  sel.innerHTML = "";
+  for (const p of programs) {
+    const opt = document.createElement("option");
+    opt.value = p.id;
+    opt.textContent = p.name;
+    sel.appendChild(opt);
+  }
+  if (lastState) sel.value = lastState.program_id;
+}
+
+function applyState(state) {
+  lastState = state;
+  if (programsVersion !== null && state.programs_version && state.programs_version !== programsVersion) {
+    programsVersion = state.programs_version;
+    loadPrograms().catch(() => { programsVersion = ""; });  // retried on the next state
   }
-  sel.value = state.program_id;
+
+  // programs
+  $("programSelect").value = state.program_id;
 
   // mode buttons
   setActiveMode(state.mode);
@@ -308,27 +363,140 @@ async function refresh() {
   setStatusLine(state);
 }
 
+// Live preview: pixel indices by level (bottom to top) and branch, plus the star.
+const TREE_LEVELS = [
+  [24, 19, 7, 0, 16, 15, 6, 12],
+  [23, 20, 8, 1, 17, 14, 5, 11],
+  [22, 21, 9, 2, 18, 13, 4, 10],
+];
+const STAR_INDEX = 3;
+const PREVIEW_KEYFRAME = 0x4B;  // "K": u16 count, count * (r, g, b)
+const PREVIEW_DELTA = 0x44;     // "D": u16 count, count * (u16 index, r, g, b)
+let previewWanted = false;
+let previewAbort = null;
+const previewDots = [];
+
+function buildPreview() {
+  const container = $("previewTree");
+  container.innerHTML = "";
+  const addRow = (indices, cls) => {
+    const row = document.createElement("div");
+    row.className = "preview-row";
+    for (const idx of indices) {
+      const dot = document.createElement("div");
+      dot.className = "preview-dot" + (cls ? ` ${cls}` : "");
+      previewDots[idx] = dot;
+      row.appendChild(dot);
+    }
+    container.appendChild(row);
+  };
+  addRow([STAR_INDEX], "star");
+  for (const level of [...TREE_LEVELS].reverse()) addRow(level);
+}
+
+function setPreviewPixel(idx, r, g, b) {
+  let dot = previewDots[idx];
+  if (!dot) {
+    // Pixels beyond the tree's 25 (extra chains) go in a row underneath.
+    let extra = $("previewExtra");
+    if (!extra) {
+      extra = document.createElement("div");
+      extra.id = "previewExtra";
+      extra.className = "preview-row";
+      $("previewTree").appendChild(extra);
+    }
+    dot = document.createElement("div");
+    dot.className = "preview-dot";
+    extra.appendChild(dot);
+    previewDots[idx] = dot;
+  }
+  dot.style.background = `rgb(${r}, ${g}, ${b})`;
+}
+
+// Apply every complete message in `buf`; return the unconsumed tail.
+function consumePreview(buf) {
+  let off = 0;
+  while (buf.length - off >= 3) {
+    const type = buf[off];
+    const count = (buf[off + 1] << 8) | buf[off + 2];
+    const size = type === PREVIEW_KEYFRAME ? count * 3 : count * 5;
+    if (buf.length - off - 3 < size) break;
+    let p = off + 3;
+    if (type === PREVIEW_KEYFRAME) {
+      for (let i = 0; i < count; i++, p += 3) setPreviewPixel(i, buf[p], buf[p + 1], buf[p + 2]);
+    } else if (type === PREVIEW_DELTA) {
+      for (let i = 0; i < count; i++, p += 5) setPreviewPixel((buf[p] << 8) | buf[p + 1], buf[p + 2], buf[p + 3], buf[p + 4]);
+    }
+    off = p;
+  }
+  return buf.slice(off);
+}
+
+async function runPreview(signal) {
+  const res = await fetch("/api/preview?fps=10", { signal });
+  if (!res.ok) throw new Error(res.status === 503 ? "Server busy, try again later." : `GET /api/preview ${res.status}`);
+  const reader = res.body.getReader();
+  let buf = new Uint8Array(0);
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    const joined = new Uint8Array(buf.length + value.length);
+    joined.set(buf);
+    joined.set(value, buf.length);
+    buf = consumePreview(joined);
+  }
+}
+
+function startPreview() {
+  if (previewAbort) return;
+  const abort = new AbortController();
+  previewAbort = abort;
+  $("previewHint").textContent = "Streams what the tree is showing right now.";
+  runPreview(abort.signal)
+    .catch(err => { if (err.name !== "AbortError") $("previewHint").textContent = err.message; })
+    .finally(() => { if (previewAbort === abort) previewAbort = null; });
+}
+
+function stopPreview() {
+  if (previewAbort) previewAbort.abort();
+  previewAbort = null;
+}
+
+function setPreviewWanted(on) {
+  previewWanted = on;
+  $("previewToggle").textContent = on ? "Hide preview" : "Show preview";
+  if (on) startPreview(); else stopPreview();
+}
+
 function wire() {
+  buildPreview();
+  $("previewToggle").addEventListener("click", () => setPreviewWanted(!previewWanted));
+  // Don't stream to a backgrounded tab.
+  document.addEventListener("visibilitychange", () => {
+    if (!previewWanted) return;
+    if (document.hidden) stopPreview(); else startPreview();
+  });
+
   $("refreshBtn").addEventListener("click", () => refresh().catch(err => alert(err.message)));
   $("speedRange").disabled = true;
   if ($("speedLabel")) $("speedLabel").textContent = "Speed: loading…";
 
   $("modeOn").addEventListener("click", async () => {
     await apiPost("/api/mode", { mode: "manual_on" });
-    await refresh();
+    await afterChange();
   });
   $("modeOff").addEventListener("click", async () => {
     await apiPost("/api/mode", { mode: "manual_off" });
-    await refresh();
+    await afterChange();
   });
   $("modeAuto").addEventListener("click", async () => {
     await apiPost("/api/mode", { mode: "auto" });
-    await refresh();
+    await afterChange();
   });
 
   $("programSelect").addEventListener("change", async (e) => {
     await apiPost("/api/program", { program_id: e.target.value });
-    await refresh();
+    await afterChange();
   });
 
   $("speedRange").addEventListener("input", (e) => {
@@ -346,7 +514,7 @@ function wire() {
     const pct = Number(e.target.value);
     const speed = speedPctToValue(pct, speedMin, speedMax);
     await apiPost("/api/speed", { program_speed: speed });
-    await refresh();
+    await afterChange();
   });
 
   // brightness sliders
@@ -358,7 +526,7 @@ function wire() {
     });
     $("bodyBrightnessRange").addEventListener("change", async (e) => {
       await apiPost("/api/brightness", { body_pct: Number(e.target.value) });
-      await refresh();
+      await afterChange();
     });
   }
   if ($("starBrightnessRange")) {
@@ -369,7 +537,7 @@ function wire() {
     });
     $("starBrightnessRange").addEventListener("change", async (e) => {
       await apiPost("/api/brightness", { star_pct: Number(e.target.value) });
-      await refresh();
+      await afterChange();
     });
   }
 
@@ -377,13 +545,13 @@ function wire() {
     btn.addEventListener("click", async () => {
       const minutes = Number(btn.getAttribute("data-min"));
       await apiPost("/api/countdown", { minutes });
-      await refresh();
+      await afterChange();
     });
   }
 
   $("countdownClear").addEventListener("click", async () => {
     await apiPost("/api/countdown", { clear: true });
-    await refresh();
+    await afterChange();
   });
 
   // Schedule block controls
@@ -392,5 +560,12 @@ function wire() {
 }
 
 wire();
-refresh().catch(err => alert(err.message));
-setInterval(() => refresh().catch(() => {}), 5000);
+loadPrograms().then(refresh).catch(err => alert(err.message));
+subscribe();
+// Keep the clock and countdown text current between pushes (no server round trip).
+setInterval(() => {
+  if (lastState) {
+    setStatusLine({ ...lastState, now: new Date().toISOString() });
+    $("countdownLine").textContent = fmtCountdown(lastState.countdown_until);
+  }
+}, 30000);
@@ -37,7 +37,8 @@ apt-get install -y --no-install-recommends \
   python3-venv \
   python3-pip \
   python3-gpiozero \
-  python3-colorzero
+  python3-colorzero \
+  libopenblas0
 
 echo "==> Enabling SPI (required for the tree)"
 if command -v raspi-config >/dev/null 2>&1; then
@@ -35,6 +35,19 @@ rsync -a --delete \
   "${REPO_DIR}/" "${INSTALL_DIR}/"
 chown -R "${INSTALL_USER}:${INSTALL_USER}" "${INSTALL_DIR}"
 
+# numpy (shader programs) needs OpenBLAS at runtime on Raspberry Pi OS.
+if command -v dpkg >/dev/null 2>&1 && ! dpkg -s libopenblas0 >/dev/null 2>&1; then
+  echo "==> Installing libopenblas0"
+  apt-get install -y --no-install-recommends libopenblas0
+fi
+
+echo "==> Installing Python deps (new requirements only)"
+sudo -u "${INSTALL_USER}" bash -lc "
+  cd '${INSTALL_DIR}'
+  . .venv/bin/activate
+  pip install -r requirements.txt
+"
+
 echo "==> Ensuring systemd service matches template (if changed)"
 SERVICE_TEMPLATE="${INSTALL_DIR}/scripts/rgbxmastree.service"
 SERVICE_OUT="/etc/systemd/system/${SERVICE_NAME}"
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+from rgbxmastree.hardware.simulated import SimulatedXmasTree
+from rgbxmastree.web.app import create_app
+from rgbxmastree.web.asyncio_server import AsyncioServer
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(str(tmp_path / "config.json"), tree_factory=SimulatedXmasTree)
+    yield app
+    app.extensions["rgbxmastree_controller"].close()
+
+
+def _serve(app, client, threads: int = 4):
+    """Run `client(port)` against an AsyncioServer on an ephemeral port."""
+
+    async def main():
+        server = AsyncioServer(app, threads=threads)
+        listener = await server.start("127.0.0.1", 0)
+        try:
+            return await asyncio.wait_for(client(listener.sockets[0].getsockname()[1]), 10.0)
+        finally:
+            listener.close()
+            server.stop()
+
+    return asyncio.run(main())
+
+
+async def _read_response(reader: asyncio.StreamReader) -> tuple[int, dict[str, str], bytes]:
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    status = int(head[0].split(" ")[1])
+    headers = {}
+    for line in head[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", "0")))
+    return status, headers, body
+
+
+def test_keep_alive_requests_and_bodies(app):
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n")
+        first = await _read_response(reader)
+        body = json.dumps({"mode": "manual_off"}).encode("utf-8")
+        writer.write(
+            b"POST /api/mode HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\n"
+            b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+        )
+        second = await _read_response(reader)
+        writer.close()
+        return first, second
+
+    (status1, headers1, _), (status2, _, body2) = _serve(app, client)
+    assert status1 == 200 and headers1["connection"] == "keep-alive"
+    assert status2 == 200 and json.loads(body2)["ok"] is True
+    assert app.extensions["rgbxmastree_controller"].get_config().mode == "manual_off"
+
+
+@pytest.mark.parametrize(
+    "raw, status",
+    [
+        (b"GARBAGE\r\n\r\n", 400),
+        (b"GET / HTTP/2.0\r\n\r\n", 505),
+        (b"POST /api/mode HTTP/1.1\r\nContent-Length: nope\r\n\r\n", 400),
+        (b"POST /api/mode HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n", 411),
+    ],
+)
+def test_malformed_requests(app, raw, status):
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        response = await _read_response(reader)
+        writer.close()
+        return response
+
+    got, headers, _ = _serve(app, client)
+    assert got == status and headers["connection"] == "close"
+
+
+def test_encoded_stream_paths_stay_off_the_pool(app):
+    # Percent-encoded stream paths are still served on the loop, so they can't pin the
+    # pool threads and starve ordinary requests.
+    async def client(port):
+        streams = []
+        for _ in range(4):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /api/%65vents HTTP/1.1\r\nHost: x\r\n\r\n")
+            head = await reader.readuntil(b"\r\n\r\n")
+            streams.append((head, writer))
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /health HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        health = await _read_response(reader)
+        for _, w in streams + [(None, writer)]:
+            w.close()
+        return [h for h, _ in streams], health
+
+    heads, (status, _, _) = _serve(app, client, threads=4)
+    assert all(b"text/event-stream" in h for h in heads)
+    assert status == 200
+
+
+def test_bridge_refuses_unbounded_bodies(app):
+    server = AsyncioServer(app, threads=1)
+    try:
+        environ = EnvironBuilder(path="/api/events").get_environ()
+        status, _, body = server._call_app(environ)
+        assert status == 500 and b"streaming" in body
+        # Closing the refused response released its stream slot.
+        series = app.extensions["rgbxmastree_controller"].metrics.to_json()["rgbxmastree_open_streams"]["series"]
+        assert all(s["value"] == 0 for s in series)
+    finally:
+        server.stop()